@@ -1,6 +1,7 @@
+from pathlib import Path
 from typing import AsyncGenerator
 
-from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import declarative_base
 
 from .config import get_settings
@@ -8,6 +9,8 @@ from .config import get_settings
 
 Base = declarative_base()
 
+ALEMBIC_INI = Path(__file__).resolve().parents[1] / "alembic.ini"
+
 
 def get_engine():
     settings = get_settings()
@@ -23,3 +26,30 @@ async def get_session() -> AsyncGenerator[AsyncSession, None]:
     async with AsyncSessionLocal() as session:
         yield session
 
+
+def dialect_insert(dialect_name: str):
+    """`insert` construct with on_conflict_do_update for the engine's dialect."""
+    if dialect_name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert
+
+
+async def check_schema_revision(engine: AsyncEngine) -> None:
+    """Fail fast unless the database is migrated to the latest Alembic revision."""
+    from alembic.config import Config
+    from alembic.runtime.migration import MigrationContext
+    from alembic.script import ScriptDirectory
+
+    heads = set(ScriptDirectory.from_config(Config(str(ALEMBIC_INI))).get_heads())
+
+    def _current(conn) -> set[str]:
+        return set(MigrationContext.configure(conn).get_current_heads())
+
+    async with engine.connect() as conn:
+        current = await conn.run_sync(_current)
+    if current != heads:
+        have = ", ".join(sorted(current)) or "none"
+        want = ", ".join(sorted(heads))
+        raise RuntimeError(f"Database schema revision is {have}, expected {want}. Run `alembic upgrade head`.")
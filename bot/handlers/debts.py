@@ -1,12 +1,12 @@
 from decimal import Decimal
+from typing import Awaitable, Callable
 
 from aiogram import Router, types, F
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import StatesGroup, State
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
-from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from ..db import AsyncSessionLocal
 from ..models import User, Account
 
 
@@ -61,21 +61,18 @@ async def debts_menu(callback: types.CallbackQuery, state: FSMContext) -> None:
 
 
 @router.callback_query(F.data.startswith("debt:"))
-async def debts_route(callback: types.CallbackQuery, state: FSMContext) -> None:
+async def debts_route(
+    callback: types.CallbackQuery,
+    state: FSMContext,
+    user_accounts: Callable[[], Awaitable[list[Account]]],
+) -> None:
     data = callback.data.split(":")[1]
     message = callback.message
     if data in ("recv", "pay", "settle_recv", "settle_pay"):
         await state.update_data(mode=data)
         # Offer existing counterparties
-        async with AsyncSessionLocal() as session:
-            tg_id = callback.from_user.id
-            user = (await session.execute(select(User).where(User.telegram_id == tg_id))).scalar_one()
-            kind_type = "receivable" if data in ("recv", "settle_recv") else "liability_payable"
-            accs = (
-                await session.execute(
-                    select(Account).where(Account.user_id == user.id, Account.type == kind_type)
-                )
-            ).scalars().all()
+        kind_type = "receivable" if data in ("recv", "settle_recv") else "liability_payable"
+        accs = [a for a in await user_accounts() if a.type == kind_type]
         rows = [[InlineKeyboardButton(text=a.name.split(":",1)[1] if ":" in a.name else a.name, callback_data=f"debt:cp:{a.name}")]
                 for a in accs]
         rows.append([InlineKeyboardButton(text="➕ Новый контрагент", callback_data="debt:new")])
@@ -118,12 +115,12 @@ async def debt_new_cp(callback: types.CallbackQuery, state: FSMContext) -> None:
     await callback.answer()
 
 
-async def _upsert_debt_account(session, user_id: int, mode: str, name: str, currency: str) -> Account:
+async def _upsert_debt_account(
+    session: AsyncSession, user_id: int, accounts: list[Account], mode: str, name: str, currency: str
+) -> Account:
     acc_type = "receivable" if mode in ("recv", "settle_recv") else "liability_payable"
     acc_name = f"{acc_type}:{name}"
-    acc = (
-        await session.execute(select(Account).where(Account.user_id == user_id, Account.name == acc_name))
-    ).scalar_one_or_none()
+    acc = next((a for a in accounts if a.name == acc_name), None)
     if acc is None:
         acc = Account(
             user_id=user_id,
@@ -139,7 +136,13 @@ async def _upsert_debt_account(session, user_id: int, mode: str, name: str, curr
 
 
 @router.message(DebtState.amount)
-async def debt_set_amount(message: types.Message, state: FSMContext) -> None:
+async def debt_set_amount(
+    message: types.Message,
+    state: FSMContext,
+    session: AsyncSession,
+    user: User,
+    user_accounts: Callable[[], Awaitable[list[Account]]],
+) -> None:
     try:
         amount = Decimal(message.text.replace(",", "."))
         if amount <= 0:
@@ -151,35 +154,25 @@ async def debt_set_amount(message: types.Message, state: FSMContext) -> None:
     data = await state.get_data()
     mode = data.get("mode")
 
-    async with AsyncSessionLocal() as session:
-        tg_id = message.from_user.id
-        user = (await session.execute(select(User).where(User.telegram_id == tg_id))).scalar_one()
-        # default currency: base of first internal account or RUB
-        first_acc = (
-            await session.execute(
-                select(Account)
-                .where(Account.user_id == user.id, Account.is_external_balance == False)
-                .order_by(Account.id.asc())
-                .limit(1)
-            )
-        ).scalars().first()
-        currency = first_acc.currency if first_acc else "RUB"
-
-        acc = await _upsert_debt_account(session, user.id, mode, data.get("counterparty"), currency)
-        cur = Decimal(acc.external_balance or 0)
-        if mode == "recv":
-            acc.external_balance = cur + amount
-            msg = f"Записал: мне должны {acc.name.split(':',1)[1]} +{amount} {currency}"
-        elif mode == "pay":
-            acc.external_balance = cur + amount
-            msg = f"Записал: я должен {acc.name.split(':',1)[1]} +{amount} {currency}"
-        elif mode == "settle_recv":
-            acc.external_balance = max(Decimal("0"), cur - amount)
-            msg = f"Погашено: мне должны от {acc.name.split(':',1)[1]} -{amount} {currency}"
-        else:  # settle_pay
-            acc.external_balance = max(Decimal("0"), cur - amount)
-            msg = f"Погашено: мой долг {acc.name.split(':',1)[1]} -{amount} {currency}"
-        await session.commit()
+    # default currency: base of first internal account or RUB
+    accounts = await user_accounts()
+    first_acc = next((a for a in accounts if not a.is_external_balance), None)
+    currency = first_acc.currency if first_acc else "RUB"
+
+    acc = await _upsert_debt_account(session, user.id, accounts, mode, data.get("counterparty"), currency)
+    cur = Decimal(acc.external_balance or 0)
+    if mode == "recv":
+        acc.external_balance = cur + amount
+        msg = f"Записал: мне должны {acc.name.split(':',1)[1]} +{amount} {currency}"
+    elif mode == "pay":
+        acc.external_balance = cur + amount
+        msg = f"Записал: я должен {acc.name.split(':',1)[1]} +{amount} {currency}"
+    elif mode == "settle_recv":
+        acc.external_balance = max(Decimal("0"), cur - amount)
+        msg = f"Погашено: мне должны от {acc.name.split(':',1)[1]} -{amount} {currency}"
+    else:  # settle_pay
+        acc.external_balance = max(Decimal("0"), cur - amount)
+        msg = f"Погашено: мой долг {acc.name.split(':',1)[1]} -{amount} {currency}"
 
     await state.clear()
     await message.answer(msg)
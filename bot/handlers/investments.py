@@ -3,11 +3,12 @@ from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.fsm.state import StatesGroup, State
 from aiogram.fsm.context import FSMContext
 
-from ..services.tinkoff_integration import sync_tinkoff_account
-from ..db import AsyncSessionLocal
-from sqlalchemy import select
+from ..services.tinkoff_integration import _map_account_name, quotation_to_decimal, sync_tinkoff_account
+from sqlalchemy.ext.asyncio import AsyncSession
 from ..models import User, Account, Transaction
+from ..services.balances import post_transactions
 from decimal import Decimal
+from typing import Awaitable, Callable, Optional
 
 router = Router()
 
@@ -30,14 +31,11 @@ async def invest_menu(callback: types.CallbackQuery) -> None:
 
 
 @router.callback_query(F.data == "invest:sync")
-async def invest_sync(callback: types.CallbackQuery) -> None:
-    tg_id = callback.from_user.id
-    async with AsyncSessionLocal() as session:
-        user = (await session.execute(select(User).where(User.telegram_id == tg_id))).scalar_one_or_none()
-        if user is None:
-            await callback.message.answer("Сначала нажмите /start")
-            return
-        text = await sync_tinkoff_account(session, user)
+async def invest_sync(callback: types.CallbackQuery, session: AsyncSession, user: Optional[User]) -> None:
+    if user is None:
+        await callback.message.answer("Сначала нажмите /start")
+        return
+    text = await sync_tinkoff_account(session, user)
     await callback.message.edit_text(text, reply_markup=invest_menu_kb())
     await callback.answer()
 
@@ -55,20 +53,13 @@ def _kb_cancel_menu() -> InlineKeyboardMarkup:
 
 
 @router.callback_query(F.data == "invest:topup")
-async def topup_start(callback: types.CallbackQuery, state: FSMContext) -> None:
+async def topup_start(
+    callback: types.CallbackQuery,
+    state: FSMContext,
+    user_accounts: Callable[[], Awaitable[list[Account]]],
+) -> None:
     message = callback.message
-    async with AsyncSessionLocal() as session:
-        tg_id = callback.from_user.id
-        user = (await session.execute(select(User).where(User.telegram_id == tg_id))).scalar_one()
-        cards = (
-            await session.execute(
-                select(Account).where(
-                    Account.user_id == user.id,
-                    Account.is_external_balance == False,
-                    Account.type.in_(["card", "wallet"]),
-                )
-            )
-        ).scalars().all()
+    cards = [a for a in await user_accounts() if not a.is_external_balance and a.type in ("card", "wallet")]
     kb = InlineKeyboardMarkup(inline_keyboard=[[InlineKeyboardButton(text=a.name, callback_data=f"topup:from:{a.id}")] for a in cards] + [[InlineKeyboardButton(text="⬅️ Назад", callback_data="action:invest")]])
     m = await message.edit_text("Выберите карту для списания:", reply_markup=kb)
     await state.update_data(msg_id=m.message_id)
@@ -86,7 +77,12 @@ async def topup_from(callback: types.CallbackQuery, state: FSMContext) -> None:
 
 
 @router.message(TopUpState.amount)
-async def topup_amount(message: types.Message, state: FSMContext) -> None:
+async def topup_amount(
+    message: types.Message,
+    state: FSMContext,
+    session: AsyncSession,
+    user_accounts: Callable[[], Awaitable[list[Account]]],
+) -> None:
     try:
         amt = Decimal(message.text.replace(",", "."))
         if amt <= 0:
@@ -102,17 +98,18 @@ async def topup_amount(message: types.Message, state: FSMContext) -> None:
     except Exception:
         pass
     # Record ONLY expense from card; portfolio подтянется по API отдельно
-    async with AsyncSessionLocal() as session:
-        from_acc = (await session.execute(select(Account).where(Account.id == from_id))).scalar_one()
-        session.add(Transaction(
-            user_id=from_acc.user_id,
-            account_id=from_acc.id,
-            type="expense",
-            amount=amt,
-            currency=from_acc.currency,
-            category="Пополнение брокера",
-        ))
-        await session.commit()
+    await user_accounts()
+    from_acc = await session.get(Account, from_id)
+    await post_transactions(session, [Transaction(
+        user_id=from_acc.user_id,
+        account_id=from_acc.id,
+        type="expense",
+        amount=amt,
+        currency=from_acc.currency,
+        category="Пополнение брокера",
+    )])
+    # commit before confirming, and release SQLite's write lock before the Telegram call
+    await session.commit()
     await state.clear()
     await message.answer("Пополнение брокера записано ✅", reply_markup=invest_menu_kb())
 
@@ -129,7 +126,7 @@ def _positions_menu_kb(accs: list[tuple[str,str]]) -> InlineKeyboardMarkup:
 @router.callback_query(F.data == "invest:details")
 async def invest_details(callback: types.CallbackQuery) -> None:
     try:
-        from tinkoff.invest import Client
+        from tinkoff.invest import AsyncClient
     except Exception:
         await callback.message.edit_text("SDK не установлен. Установите: pip install tinkoff-investments", reply_markup=invest_menu_kb())
         await callback.answer()
@@ -138,9 +135,8 @@ async def invest_details(callback: types.CallbackQuery) -> None:
     token = get_settings().TINKOFF_API_TOKEN
     accs_info: list[tuple[str,str]] = []
     try:
-        with Client(token) as client:
-            accs = client.users.get_accounts().accounts
-            from ..services.tinkoff_integration import _map_account_name  # reuse naming
+        async with AsyncClient(token) as client:
+            accs = (await client.users.get_accounts()).accounts
             for a in accs:
                 name = _map_account_name(a)
                 accs_info.append((name, a.id))
@@ -156,7 +152,7 @@ async def invest_details(callback: types.CallbackQuery) -> None:
 async def invest_show_positions(callback: types.CallbackQuery) -> None:
     acc_id = callback.data.split(":")[-1]
     try:
-        from tinkoff.invest import Client
+        from tinkoff.invest import AsyncClient
     except Exception:
         await callback.message.edit_text("SDK не установлен. Установите: pip install tinkoff-investments", reply_markup=invest_menu_kb())
         await callback.answer()
@@ -165,17 +161,14 @@ async def invest_show_positions(callback: types.CallbackQuery) -> None:
     token = get_settings().TINKOFF_API_TOKEN
     lines = ["<pre>"]
     try:
-        with Client(token) as client:
-            p = client.operations.get_portfolio(account_id=acc_id)
-            total = p.total_amount_portfolio
-            tot_val = (total.units or 0) + (total.nano or 0)/1_000_000_000
-            lines.append(f"Итого: {tot_val} RUB\n")
-            for pos in p.positions:
-                name = pos.instrument_type or "instrument"
-                qty = (pos.quantity.units or 0) + (pos.quantity.nano or 0)/1_000_000_000
-                valq = pos.current_price
-                val = (valq.units or 0) + (valq.nano or 0)/1_000_000_000
-                lines.append(f"{name:<16} {qty:>10.6f} @ {val:>10.2f}")
+        async with AsyncClient(token) as client:
+            p = await client.operations.get_portfolio(account_id=acc_id)
+        lines.append(f"Итого: {quotation_to_decimal(p.total_amount_portfolio)} RUB\n")
+        for pos in p.positions:
+            name = pos.instrument_type or "instrument"
+            qty = quotation_to_decimal(pos.quantity)
+            val = quotation_to_decimal(pos.current_price)
+            lines.append(f"{name:<16} {qty:>10.6f} @ {val:>10.2f}")
     except Exception as e:
         lines = [f"Ошибка SDK: {e}"]
     text = "\n".join(lines + ["</pre>"])
@@ -0,0 +1,55 @@
+from datetime import datetime
+from typing import Optional
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from aiogram import Router, types
+from aiogram.filters import Command, CommandObject
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..config import get_settings
+from ..models import User
+from ..services.reminders import REMINDER_OFF, next_fire, parse_reminder_time, reminder_scheduler
+
+
+router = Router()
+
+USAGE = "Формат: /reminder ЧЧ:ММ [часовой пояс], например /reminder 21:30 Europe/Moscow, или /reminder off"
+
+
+@router.message(Command("reminder"))
+async def cmd_reminder(message: types.Message, command: CommandObject, session: AsyncSession, user: Optional[User]) -> None:
+    if user is None:
+        await message.answer("Сначала нажмите /start")
+        return
+    args = (command.args or "").split()
+    tz_name = user.timezone or get_settings().TIMEZONE
+
+    if not args:
+        current = "выключено" if user.reminder_time == REMINDER_OFF else f"{user.reminder_time} ({tz_name})"
+        await message.answer(f"Ежедневное напоминание: {current}\n{USAGE}")
+        return
+
+    if args[0].lower() == REMINDER_OFF:
+        user.reminder_time = REMINDER_OFF
+        user.reminder_next_at = None
+        reminder_scheduler.reschedule(user.id, user.chat_id, None)
+        await message.answer("Напоминания выключены.")
+        return
+
+    at = parse_reminder_time(args[0])
+    if at is None:
+        await message.answer(f"Не понял время. {USAGE}")
+        return
+    if len(args) > 1:
+        try:
+            ZoneInfo(args[1])
+        except (ZoneInfoNotFoundError, ValueError):
+            await message.answer(f"Неизвестный часовой пояс: {args[1]}. {USAGE}")
+            return
+        tz_name = args[1]
+        user.timezone = tz_name
+
+    user.reminder_time = at.strftime("%H:%M")
+    user.reminder_next_at = next_fire(user.reminder_time, tz_name, datetime.utcnow())
+    reminder_scheduler.reschedule(user.id, user.chat_id, user.reminder_next_at)
+    await message.answer(f"Буду напоминать каждый день в {user.reminder_time} ({tz_name}).")
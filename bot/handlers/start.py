@@ -1,9 +1,10 @@
+from typing import Awaitable, Callable, Optional
+
 from aiogram import Router, types, F
 from aiogram.filters import Command
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
-from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from ..db import AsyncSessionLocal
 from ..models import User, Account
 
 
@@ -44,31 +45,27 @@ async def back_to_menu(callback: types.CallbackQuery) -> None:
 
 
 @router.message(Command("start"))
-async def cmd_start(message: types.Message) -> None:
+async def cmd_start(
+    message: types.Message,
+    session: AsyncSession,
+    user: Optional[User],
+    user_accounts: Callable[[], Awaitable[list[Account]]],
+) -> None:
     tg_id = message.from_user.id
     chat_id = message.chat.id
 
-    async with AsyncSessionLocal() as session:
-        # get or create user
-        user = (await session.execute(select(User).where(User.telegram_id == tg_id))).scalar_one_or_none()
-        if user is None:
-            user = User(telegram_id=tg_id, chat_id=chat_id)
-            session.add(user)
-            await session.flush()
-        else:
-            user.chat_id = chat_id
-
-        # ensure at least one default account exists (check existence only)
-        exists_row = (
-            await session.execute(
-                select(Account.id).where(Account.user_id == user.id).limit(1)
-            )
-        ).first()
-        if exists_row is None:
-            default_acc = Account(user_id=user.id, name="Кошелек", type="wallet", currency=user.base_currency)
-            session.add(default_acc)
+    # get or create user
+    if user is None:
+        user = User(telegram_id=tg_id, chat_id=chat_id)
+        session.add(user)
+        await session.flush()
+    elif user.chat_id != chat_id:
+        user.chat_id = chat_id
 
-        await session.commit()
+    # ensure at least one default account exists
+    if not await user_accounts():
+        default_acc = Account(user_id=user.id, name="Кошелек", type="wallet", currency=user.base_currency)
+        session.add(default_acc)
 
     await message.answer(
         "Привет! 👋 Я помогу вести ваши финансы. Выберите действие:",
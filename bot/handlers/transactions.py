@@ -1,17 +1,19 @@
 from decimal import Decimal
-from typing import Optional
+from typing import Awaitable, Callable, Optional
 
 from aiogram import Router, types, F
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import StatesGroup, State
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
-from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from ..db import AsyncSessionLocal
 from ..models import User, Account, Transaction
-from ..services.categories import load_categories
-from ..services.crypto_prices import fetch_prices_rub
+from ..money import from_minor
+from ..services.balances import get_user_balances, post_transactions
+from ..services.categories import load_categories, load_category_menu
+from ..services.crypto_prices import price_cache
+from ..services.merchants import merchant_resolver
 
 
 router = Router()
@@ -48,20 +50,15 @@ async def _edit_wizard(message: types.Message, state: FSMContext, text: str, kb:
     await _set_wizard_message(state, m)
 
 
-def _categories_keyboard(kind: str) -> InlineKeyboardMarkup:
-    cats = load_categories(kind)
-    rows = []
-    row: list[InlineKeyboardButton] = []
-    for c in cats:
-        row.append(InlineKeyboardButton(text=c, callback_data=f"wizard:cat:{c}"))
-        if len(row) == 2:
-            rows.append(row)
-            row = []
-    if row:
-        rows.append(row)
-    rows.append([InlineKeyboardButton(text="📝 Ввести текстом", callback_data="wizard:cat_text")])
-    rows.append([InlineKeyboardButton(text="⬅️ Назад", callback_data="action:menu"), InlineKeyboardButton(text="❌ Отмена", callback_data="wizard:cancel")])
-    return InlineKeyboardMarkup(inline_keyboard=rows)
+_CATEGORY_NAV_ROWS = (
+    [InlineKeyboardButton(text="📝 Ввести текстом", callback_data="wizard:cat_text")],
+    [InlineKeyboardButton(text="⬅️ Назад", callback_data="action:menu"), InlineKeyboardButton(text="❌ Отмена", callback_data="wizard:cancel")],
+)
+
+
+async def _categories_keyboard(kind: str) -> InlineKeyboardMarkup:
+    menu = await load_category_menu(kind)
+    return InlineKeyboardMarkup(inline_keyboard=[*map(list, menu.rows), *_CATEGORY_NAV_ROWS])
 
 
 def _main_menu_inline() -> InlineKeyboardMarkup:
@@ -74,6 +71,18 @@ def _main_menu_inline() -> InlineKeyboardMarkup:
     )
 
 
+async def _internal_accounts(
+    session: AsyncSession, user: User, user_accounts: Callable[[], Awaitable[list[Account]]]
+) -> list[Account]:
+    accounts = [a for a in await user_accounts() if not a.is_external_balance]
+    if not accounts:
+        acc = Account(user_id=user.id, name="Кошелек", type="wallet", currency=user.base_currency)
+        session.add(acc)
+        await session.flush()
+        accounts = [acc]
+    return accounts
+
+
 @router.callback_query(F.data == "action:add_expense")
 async def add_expense_cb(callback: types.CallbackQuery, state: FSMContext) -> None:
     message = callback.message
@@ -110,28 +119,23 @@ async def add_amount(message: types.Message, state: FSMContext) -> None:
     await state.set_state(AddTxnState.category)
     data = await state.get_data()
     kind = "income" if data.get("type") == "income" else "expense"
-    await _edit_wizard(message, state, "Выберите категорию:", _categories_keyboard(kind))
+    await _edit_wizard(message, state, "Выберите категорию:", await _categories_keyboard(kind))
 
 
 @router.callback_query(AddTxnState.category, F.data.startswith("wizard:cat:"))
-async def choose_category_cb(callback: types.CallbackQuery, state: FSMContext) -> None:
+async def choose_category_cb(
+    callback: types.CallbackQuery,
+    state: FSMContext,
+    session: AsyncSession,
+    user: User,
+    user_accounts: Callable[[], Awaitable[list[Account]]],
+) -> None:
     message = callback.message
     cat = callback.data.split(":", 2)[-1]
     await state.update_data(category=cat)
 
     # offer accounts to choose
-    async with AsyncSessionLocal() as session:
-        tg_id = callback.from_user.id
-        user = (await session.execute(select(User).where(User.telegram_id == tg_id))).scalar_one()
-        accounts = (
-            await session.execute(select(Account).where(Account.user_id == user.id))
-        ).scalars().all()
-        accounts = [a for a in accounts if not a.is_external_balance]
-        if not accounts:
-            acc = Account(user_id=user.id, name="Кошелек", type="wallet", currency=user.base_currency)
-            session.add(acc)
-            await session.commit()
-            accounts = [acc]
+    accounts = await _internal_accounts(session, user, user_accounts)
 
     kb = InlineKeyboardMarkup(
         inline_keyboard=[
@@ -153,8 +157,24 @@ async def choose_category_text_cb(callback: types.CallbackQuery, state: FSMConte
 
 
 @router.message(AddTxnState.category)
-async def add_category(message: types.Message, state: FSMContext) -> None:
-    await state.update_data(category=message.text.strip())
+async def add_category(
+    message: types.Message,
+    state: FSMContext,
+    session: AsyncSession,
+    user: User,
+    user_accounts: Callable[[], Awaitable[list[Account]]],
+) -> None:
+    text = message.text.strip()
+    data = await state.get_data()
+    merchant = None
+    if data.get("type") == "expense" and text not in load_categories("expense"):
+        # a merchant name instead of a category: file it under the merchant's category.
+        # Exact names/aliases only; fuzzy matching would rewrite plain categories ("Аптека")
+        merchant = merchant_resolver().resolve_exact(text)
+    if merchant is not None and merchant.category:
+        await state.update_data(category=merchant.category, description=text)
+    else:
+        await state.update_data(category=text)
     # delete user message with raw category text
     try:
         await message.delete()
@@ -162,18 +182,7 @@ async def add_category(message: types.Message, state: FSMContext) -> None:
         pass
 
     # offer accounts to choose
-    async with AsyncSessionLocal() as session:
-        tg_id = message.from_user.id
-        user = (await session.execute(select(User).where(User.telegram_id == tg_id))).scalar_one()
-        accounts = (
-            await session.execute(select(Account).where(Account.user_id == user.id))
-        ).scalars().all()
-        accounts = [a for a in accounts if not a.is_external_balance]
-        if not accounts:
-            acc = Account(user_id=user.id, name="Кошелек", type="wallet", currency=user.base_currency)
-            session.add(acc)
-            await session.commit()
-            accounts = [acc]
+    accounts = await _internal_accounts(session, user, user_accounts)
 
     kb = InlineKeyboardMarkup(
         inline_keyboard=[
@@ -187,30 +196,33 @@ async def add_category(message: types.Message, state: FSMContext) -> None:
 
 
 @router.callback_query(AddTxnState.account, F.data.startswith("wizard:acc:"))
-async def add_account_cb(callback: types.CallbackQuery, state: FSMContext) -> None:
+async def add_account_cb(
+    callback: types.CallbackQuery,
+    state: FSMContext,
+    session: AsyncSession,
+    user: User,
+    user_accounts: Callable[[], Awaitable[list[Account]]],
+) -> None:
     message = callback.message
-    acc_id_str = callback.data.split(":")[-1]
-    async with AsyncSessionLocal() as session:
-        tg_id = callback.from_user.id
-        user = (await session.execute(select(User).where(User.telegram_id == tg_id))).scalar_one()
-        account = (
-            await session.execute(select(Account).where(Account.user_id == user.id, Account.id == int(acc_id_str)))
-        ).scalar_one_or_none()
-        if account is None or account.is_external_balance:
-            await callback.answer("Нельзя выбрать этот счет", show_alert=True)
-            return
+    acc_id = int(callback.data.split(":")[-1])
+    account = next((a for a in await user_accounts() if a.id == acc_id), None)
+    if account is None or account.is_external_balance:
+        await callback.answer("Нельзя выбрать этот счет", show_alert=True)
+        return
 
-        data = await state.get_data()
-        txn = Transaction(
-            user_id=user.id,
-            account_id=account.id,
-            type=data["type"],
-            amount=Decimal(data["amount"]),
-            currency=account.currency,
-            category=data.get("category"),
-        )
-        session.add(txn)
-        await session.commit()
+    data = await state.get_data()
+    txn = Transaction(
+        user_id=user.id,
+        account_id=account.id,
+        type=data["type"],
+        amount=Decimal(data["amount"]),
+        currency=account.currency,
+        category=data.get("category"),
+        description=data.get("description"),
+    )
+    await post_transactions(session, [txn])
+    # commit before confirming, and release SQLite's write lock before the Telegram call
+    await session.commit()
 
     await state.clear()
     await message.bot.edit_message_text(
@@ -230,115 +242,89 @@ async def wizard_cancel(callback: types.CallbackQuery, state: FSMContext) -> Non
 
 
 @router.callback_query(F.data == "action:balance")
-async def show_balance_cb(callback: types.CallbackQuery) -> None:
+async def show_balance_cb(
+    callback: types.CallbackQuery,
+    session: AsyncSession,
+    user: Optional[User],
+    user_accounts: Callable[[], Awaitable[list[Account]]],
+) -> None:
     message = callback.message
-    tg_id = callback.from_user.id
-    async with AsyncSessionLocal() as session:
-        user = (await session.execute(select(User).where(User.telegram_id == tg_id))).scalar_one_or_none()
-        if user is None:
-            await message.answer("Сначала нажмите /start")
+    if user is None:
+        await message.answer("Сначала нажмите /start")
+        return
+    accounts = await user_accounts()
+    balances = await get_user_balances(session, user.id)
+
+    groups = {
+        "cards": [],
+        "invest": [],
+        "crypto": [],
+        "debts": [],
+        "cash": [],
+    }
+    # Crypto prices from memory only; the scheduler keeps held symbols fresh
+    crypto_symbols = {a.currency.upper() for a in accounts if a.type == "crypto"}
+    prices_rub = price_cache.cached_rub(crypto_symbols) if crypto_symbols else {}
+
+    for acc in accounts:
+        bal = from_minor(balances.get(acc.id, 0), acc.currency)
+        entry = (acc, bal)
+        if acc.type in ("card",) or (acc.type == "wallet" and "нал" not in acc.name.lower()):
+            if bal != 0:
+                groups["cards"].append(entry)
+        elif acc.type == "wallet":
+            if bal != 0:
+                groups["cash"].append(entry)
+        elif acc.type.startswith("broker"):
+            if bal != 0:
+                groups["invest"].append(entry)
+        elif acc.type == "crypto":
+            # show crypto even if zero
+            groups["crypto"].append(entry)
+        elif acc.type in ("receivable", "liability_payable"):
+            if bal != 0:
+                groups["debts"].append(entry)
+        else:
+            if bal != 0:
+                groups["cards"].append(entry)
+
+    def fmt_line(acc: Account, amount: Decimal) -> str:
+        label_raw = acc.name
+        if acc.type == "receivable":
+            label_raw = f"{acc.name.split(':',1)[-1]} (мне должны)"
+        elif acc.type == "liability_payable":
+            label_raw = f"{acc.name.split(':',1)[-1]} (я должен)"
+        label = label_raw[:24]
+        if acc.type == "crypto":
+            sym = acc.currency.upper()
+            amt_crypto = f"{amount:.8f} {sym}"
+            rub_val = None
+            if sym in prices_rub:
+                rub_val = float(amount) * float(prices_rub[sym])
+            rub_str = f" (~{rub_val:.2f} RUB)" if rub_val is not None else ""
+            return f"{label:<24} {amt_crypto}{rub_str}"
+        amt = f"{amount:.2f}" if acc.currency in ("RUB", "RUR", "USD", "EUR") else f"{amount:.6f}"
+        return f"{label:<24} {amt:>14} {acc.currency}"
+
+    sections: list[str] = []
+    def add_section(title: str, items: list[tuple[Account, Decimal]]):
+        if not items:
             return
-        accounts = (await session.execute(select(Account).where(Account.user_id == user.id))).scalars().all()
-
-        # compute balances per account
-        async def acc_balance(acc: Account) -> Decimal:
-            if acc.is_external_balance and acc.external_balance is not None:
-                return Decimal(acc.external_balance)
-            inc = (
-                await session.execute(
-                    select(func.coalesce(func.sum(Transaction.amount), 0)).where(
-                        Transaction.account_id == acc.id, Transaction.type == "income"
-                    )
-                )
-            ).scalar_one()
-            exp = (
-                await session.execute(
-                    select(func.coalesce(func.sum(Transaction.amount), 0)).where(
-                        Transaction.account_id == acc.id, Transaction.type == "expense"
-                    )
-                )
-            ).scalar_one()
-            return Decimal(inc) - Decimal(exp)
-
-        groups = {
-            "cards": [],
-            "invest": [],
-            "crypto": [],
-            "debts": [],
-            "cash": [],
-        }
-        # Pre-fetch crypto prices
-        crypto_symbols: set[str] = set()
-        for a in accounts:
-            if a.type == "crypto":
-                crypto_symbols.add(a.currency.upper())
-        prices_rub = {}
-        if crypto_symbols:
-            try:
-                prices_rub = await fetch_prices_rub(sorted(list(crypto_symbols)))
-            except Exception:
-                prices_rub = {}
-
-        for acc in accounts:
-            bal = await acc_balance(acc)
-            entry = (acc, bal)
-            if acc.type in ("card",) or (acc.type == "wallet" and "нал" not in acc.name.lower()):
-                if bal != 0:
-                    groups["cards"].append(entry)
-            elif acc.type == "wallet":
-                if bal != 0:
-                    groups["cash"].append(entry)
-            elif acc.type.startswith("broker"):
-                if bal != 0:
-                    groups["invest"].append(entry)
-            elif acc.type == "crypto":
-                # show crypto even if zero
-                groups["crypto"].append(entry)
-            elif acc.type in ("receivable", "liability_payable"):
-                if bal != 0:
-                    groups["debts"].append(entry)
-            else:
-                if bal != 0:
-                    groups["cards"].append(entry)
-
-        def fmt_line(acc: Account, amount: Decimal) -> str:
-            label_raw = acc.name
-            if acc.type == "receivable":
-                label_raw = f"{acc.name.split(':',1)[-1]} (мне должны)"
-            elif acc.type == "liability_payable":
-                label_raw = f"{acc.name.split(':',1)[-1]} (я должен)"
-            label = label_raw[:24]
-            if acc.type == "crypto":
-                sym = acc.currency.upper()
-                amt_crypto = f"{amount:.8f} {sym}"
-                rub_val = None
-                if sym in prices_rub:
-                    rub_val = float(amount) * float(prices_rub[sym])
-                rub_str = f" (~{rub_val:.2f} RUB)" if rub_val is not None else ""
-                return f"{label:<24} {amt_crypto}{rub_str}"
-            amt = f"{amount:.2f}" if acc.currency in ("RUB", "RUR", "USD", "EUR") else f"{amount:.6f}"
-            return f"{label:<24} {amt:>14} {acc.currency}"
-
-        sections: list[str] = []
-        def add_section(title: str, items: list[tuple[Account, Decimal]]):
-            if not items:
-                return
-            sections.append(title)
-            for acc, bal in items:
-                sections.append(fmt_line(acc, bal))
-            sections.append("")
-
-        sections.append("📊 Баланс")
-        sections.append("<pre>")
-        add_section("💳 Карты", groups["cards"])
-        add_section("💵 Наличные", groups["cash"])
-        add_section("📈 Инвестиции", groups["invest"])
-        add_section("🪙 Крипто", groups["crypto"])
-        add_section("🏦 Долги", groups["debts"])
-        if sections and sections[-1] == "":
-            sections.pop()
-        sections.append("</pre>")
-
-        await message.edit_text("\n".join(sections), reply_markup=_main_menu_inline())
+        sections.append(title)
+        for acc, bal in items:
+            sections.append(fmt_line(acc, bal))
+        sections.append("")
+
+    sections.append("📊 Баланс")
+    sections.append("<pre>")
+    add_section("💳 Карты", groups["cards"])
+    add_section("💵 Наличные", groups["cash"])
+    add_section("📈 Инвестиции", groups["invest"])
+    add_section("🪙 Крипто", groups["crypto"])
+    add_section("🏦 Долги", groups["debts"])
+    if sections and sections[-1] == "":
+        sections.pop()
+    sections.append("</pre>")
+
+    await message.edit_text("\n".join(sections), reply_markup=_main_menu_inline())
     await callback.answer()
-
@@ -1,14 +1,15 @@
 from decimal import Decimal
+from typing import Awaitable, Callable
 from uuid import uuid4
 
 from aiogram import Router, types, F
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import StatesGroup, State
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
-from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from ..db import AsyncSessionLocal
-from ..models import User, Account, Transaction
+from ..models import Account, Transaction
+from ..services.balances import post_transactions
 
 
 router = Router()
@@ -51,35 +52,31 @@ def _accounts_kb(accounts: list[Account], prefix: str) -> InlineKeyboardMarkup:
 
 
 @router.callback_query(F.data == "action:transfer")
-async def start_transfer(callback: types.CallbackQuery, state: FSMContext) -> None:
+async def start_transfer(
+    callback: types.CallbackQuery,
+    state: FSMContext,
+    user_accounts: Callable[[], Awaitable[list[Account]]],
+) -> None:
     message = callback.message
     await state.clear()
     await state.set_state(TransferState.from_acc)
 
-    async with AsyncSessionLocal() as session:
-        tg_id = callback.from_user.id
-        user = (await session.execute(select(User).where(User.telegram_id == tg_id))).scalar_one()
-        accounts = (
-            await session.execute(select(Account).where(Account.user_id == user.id))
-        ).scalars().all()
-        accounts = [a for a in accounts if not a.is_external_balance]
+    accounts = [a for a in await user_accounts() if not a.is_external_balance]
     await _edit(message, state, "Выберите счет ИЗ:", _accounts_kb(accounts, "tr:from"))
     await callback.answer()
 
 
 @router.callback_query(TransferState.from_acc, F.data.startswith("tr:from:"))
-async def set_from(callback: types.CallbackQuery, state: FSMContext) -> None:
+async def set_from(
+    callback: types.CallbackQuery,
+    state: FSMContext,
+    user_accounts: Callable[[], Awaitable[list[Account]]],
+) -> None:
     message = callback.message
     from_id = int(callback.data.split(":")[-1])
     await state.update_data(from_id=from_id)
 
-    async with AsyncSessionLocal() as session:
-        tg_id = callback.from_user.id
-        user = (await session.execute(select(User).where(User.telegram_id == tg_id))).scalar_one()
-        accounts = (
-            await session.execute(select(Account).where(Account.user_id == user.id))
-        ).scalars().all()
-        accounts = [a for a in accounts if not a.is_external_balance and a.id != from_id]
+    accounts = [a for a in await user_accounts() if not a.is_external_balance and a.id != from_id]
     await state.set_state(TransferState.to_acc)
     await _edit(message, state, "Выберите счет В:", _accounts_kb(accounts, "tr:to"))
     await callback.answer()
@@ -119,10 +116,15 @@ async def set_amount(message: types.Message, state: FSMContext) -> None:
 
 
 @router.callback_query(TransferState.fee, F.data == "tr:fee:0")
-async def fee_zero(callback: types.CallbackQuery, state: FSMContext) -> None:
+async def fee_zero(
+    callback: types.CallbackQuery,
+    state: FSMContext,
+    session: AsyncSession,
+    user_accounts: Callable[[], Awaitable[list[Account]]],
+) -> None:
     message = callback.message
     await state.update_data(fee="0")
-    await _show_confirm(message, state)
+    await _show_confirm(message, state, session, user_accounts)
     await callback.answer()
 
 
@@ -134,7 +136,12 @@ async def fee_custom(callback: types.CallbackQuery, state: FSMContext) -> None:
 
 
 @router.message(TransferState.fee)
-async def fee_amount(message: types.Message, state: FSMContext) -> None:
+async def fee_amount(
+    message: types.Message,
+    state: FSMContext,
+    session: AsyncSession,
+    user_accounts: Callable[[], Awaitable[list[Account]]],
+) -> None:
     try:
         fee = Decimal(message.text.replace(",", "."))
         if fee < 0:
@@ -147,14 +154,19 @@ async def fee_amount(message: types.Message, state: FSMContext) -> None:
         await message.delete()
     except Exception:
         pass
-    await _show_confirm(message, state)
+    await _show_confirm(message, state, session, user_accounts)
 
 
-async def _show_confirm(message: types.Message, state: FSMContext) -> None:
+async def _show_confirm(
+    message: types.Message,
+    state: FSMContext,
+    session: AsyncSession,
+    user_accounts: Callable[[], Awaitable[list[Account]]],
+) -> None:
     data = await state.get_data()
-    async with AsyncSessionLocal() as session:
-        from_acc = (await session.execute(select(Account).where(Account.id == int(data["from_id"])))).scalar_one()
-        to_acc = (await session.execute(select(Account).where(Account.id == int(data["to_id"])))).scalar_one()
+    await user_accounts()  # cached accounts are now in the identity map, session.get() skips SQL
+    from_acc = await session.get(Account, int(data["from_id"]))
+    to_acc = await session.get(Account, int(data["to_id"]))
     amount = Decimal(data["amount"]).quantize(Decimal("0.01"))
     fee = Decimal(data.get("fee", "0")).quantize(Decimal("0.01"))
     text = (
@@ -173,7 +185,12 @@ async def _show_confirm(message: types.Message, state: FSMContext) -> None:
 
 
 @router.callback_query(TransferState.confirm, F.data == "tr:confirm")
-async def do_transfer(callback: types.CallbackQuery, state: FSMContext) -> None:
+async def do_transfer(
+    callback: types.CallbackQuery,
+    state: FSMContext,
+    session: AsyncSession,
+    user_accounts: Callable[[], Awaitable[list[Account]]],
+) -> None:
     message = callback.message
     data = await state.get_data()
     from_id = int(data["from_id"]) 
@@ -181,14 +198,15 @@ async def do_transfer(callback: types.CallbackQuery, state: FSMContext) -> None:
     amount = Decimal(data["amount"]) 
     fee = Decimal(data.get("fee", "0"))
 
-    async with AsyncSessionLocal() as session:
-        from_acc = (await session.execute(select(Account).where(Account.id == from_id))).scalar_one()
-        to_acc = (await session.execute(select(Account).where(Account.id == to_id))).scalar_one()
-        if from_acc.currency != to_acc.currency:
-            await callback.answer("Пока без конвертации валют", show_alert=True)
-            return
+    await user_accounts()
+    from_acc = await session.get(Account, from_id)
+    to_acc = await session.get(Account, to_id)
+    if from_acc.currency != to_acc.currency:
+        await callback.answer("Пока без конвертации валют", show_alert=True)
+        return
+    legs = [
         # expense from source (amount + fee)
-        session.add(Transaction(
+        Transaction(
             user_id=from_acc.user_id,
             account_id=from_acc.id,
             type="expense",
@@ -196,9 +214,9 @@ async def do_transfer(callback: types.CallbackQuery, state: FSMContext) -> None:
             currency=from_acc.currency,
             category="Переводы",
             description=f"Перевод -> {to_acc.name}",
-        ))
+        ),
         # income to destination (amount)
-        session.add(Transaction(
+        Transaction(
             user_id=to_acc.user_id,
             account_id=to_acc.id,
             type="income",
@@ -206,8 +224,11 @@ async def do_transfer(callback: types.CallbackQuery, state: FSMContext) -> None:
             currency=to_acc.currency,
             category="Переводы",
             description=f"Перевод <- {from_acc.name}",
-        ))
-        await session.commit()
+        ),
+    ]
+    await post_transactions(session, legs)
+    # commit before confirming, and release SQLite's write lock before the Telegram call
+    await session.commit()
 
     await state.clear()
     await message.edit_text("Перевод выполнен ✅")
@@ -2,39 +2,58 @@ import asyncio
 import logging
 
 from aiogram import Bot, Dispatcher
-from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.types import BotCommand
 from aiogram.client.default import DefaultBotProperties
 
 from sqlalchemy.ext.asyncio import AsyncEngine
 
 from .config import get_settings
-from .db import Base, _engine
+from .db import _engine, check_schema_revision
 from .handlers.start import router as start_router
 from .handlers.transactions import router as transactions_router
 from .handlers.integrations import router as integrations_router
 from .handlers.transfers import router as transfers_router
 from .handlers.debts import router as debts_router
 from .handlers.investments import router as investments_router
+from .handlers.reminders import router as reminders_router
+from .middlewares.fsm import FsmFlushMiddleware
+from .middlewares.identity import IdentityMiddleware
+from .middlewares.session import DbSessionMiddleware
 from .scheduler import start_scheduler
+from .services.fsm_storage import DbStorage
+from .services.http import close_http_client, get_http_client
+from .services.identity_cache import identity_cache
+from .services.merchants import save_merchant_caches
+from .services.reminders import reminder_scheduler
+from .services.scheduled_transfers import transfer_executor
 
 
 async def on_startup(bot: Bot, engine: AsyncEngine) -> None:
-    # Create tables
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+    # Schema is managed by Alembic; only verify it is up to date
+    await check_schema_revision(engine)
 
     # Set default commands
     await bot.set_my_commands(
         [
             BotCommand(command="start", description="Запустить бота"),
             BotCommand(command="sync_tinkoff", description="Синхронизировать Тинькофф"),
+            BotCommand(command="reminder", description="Время ежедневного напоминания"),
         ]
     )
+    # Pooled HTTP client shared by FX and price lookups
+    get_http_client()
     # Start reminders scheduler
     start_scheduler(bot)
 
 
+async def on_shutdown() -> None:
+    logging.getLogger(__name__).info("Identity cache: %s", identity_cache.stats())
+    await reminder_scheduler.stop()
+    await transfer_executor.stop()
+    save_merchant_caches()
+    await close_http_client()
+
+
 def setup_logging() -> None:
     logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(name)s: %(message)s")
 
@@ -44,7 +63,13 @@ async def main() -> None:
     settings = get_settings()
 
     bot = Bot(token=settings.TELEGRAM_BOT_TOKEN, default=DefaultBotProperties(parse_mode="HTML"))
-    dp = Dispatcher(storage=MemoryStorage())
+    storage = DbStorage()
+    dp = Dispatcher(storage=storage)
+    dp.update.outer_middleware(FsmFlushMiddleware(storage))
+    # One session per update; identity resolution reuses it
+    dp.update.outer_middleware(DbSessionMiddleware())
+    dp.update.outer_middleware(IdentityMiddleware())
+    dp.shutdown.register(on_shutdown)
 
     # Routers
     dp.include_router(start_router)
@@ -53,6 +78,7 @@ async def main() -> None:
     dp.include_router(debts_router)
     dp.include_router(investments_router)
     dp.include_router(integrations_router)
+    dp.include_router(reminders_router)
 
     await on_startup(bot, _engine)
 
@@ -0,0 +1,30 @@
+from __future__ import annotations
+
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+from ..services.fsm_storage import DbStorage
+
+
+class FsmFlushMiddleware(BaseMiddleware):
+    """Write FSM changes made while handling an update in one batch at its end.
+
+    Register before DbSessionMiddleware: the handler's session must have committed
+    first, otherwise SQLite would make the flush wait on its write lock.
+    """
+
+    def __init__(self, storage: DbStorage) -> None:
+        self.storage = storage
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        try:
+            return await handler(event, data)
+        finally:
+            await self.storage.flush()
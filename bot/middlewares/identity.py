@@ -0,0 +1,70 @@
+from __future__ import annotations
+
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..models import Account, User
+from ..services.identity_cache import CachedIdentity, IdentityCache, identity_cache
+
+
+class IdentityMiddleware(BaseMiddleware):
+    """Resolve the sender's User once per update and inject `user` and `user_accounts`.
+
+    `user` is None until the sender has pressed /start. `user_accounts` is an async
+    callable returning the user's accounts, loaded on first use and cached.
+
+    Must run after DbSessionMiddleware. Cached objects stay detached; handlers get
+    copies merged into the update's session without SQL, so a later
+    `session.get(Account, id)` is answered from the identity map.
+    """
+
+    def __init__(self, cache: IdentityCache = identity_cache) -> None:
+        self.cache = cache
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        tg_user = data.get("event_from_user")
+        if tg_user is None:
+            return await handler(event, data)
+
+        session: AsyncSession = data["session"]
+        item = self.cache.get(tg_user.id)
+        if item is None:
+            user = (await session.execute(select(User).where(User.telegram_id == tg_user.id))).scalar_one_or_none()
+            if user is not None:
+                session.expunge(user)
+                item = self.cache.put(user)
+
+        data["user"] = await session.merge(item.user, load=False) if item is not None else None
+        data["user_accounts"] = _accounts_loader(session, item)
+        return await handler(event, data)
+
+
+def _accounts_loader(session: AsyncSession, item: Optional[CachedIdentity]) -> Callable[[], Awaitable[list[Account]]]:
+    merged: list[Account] = []
+
+    async def user_accounts() -> list[Account]:
+        if item is None:
+            return []
+        if item.accounts is None:
+            accounts = list(
+                (
+                    await session.execute(select(Account).where(Account.user_id == item.user.id).order_by(Account.id))
+                ).scalars().all()
+            )
+            for acc in accounts:
+                session.expunge(acc)
+            item.accounts = accounts
+        if not merged:
+            merged.extend([await session.merge(acc, load=False) for acc in item.accounts])
+        return list(merged)
+
+    return user_accounts
@@ -0,0 +1,38 @@
+from __future__ import annotations
+
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from ..db import AsyncSessionLocal
+
+
+class DbSessionMiddleware(BaseMiddleware):
+    """Open one AsyncSession per update and inject it as `session`.
+
+    The session is committed once after the handler returns and rolled back if it
+    raises, so handlers only flush (when they need generated ids). The exception is a
+    handler that tells the user a write succeeded: it commits first, so the message
+    never reports rows a failed commit rolled back, and the commit here is then a no-op.
+    """
+
+    def __init__(self, session_pool: async_sessionmaker[AsyncSession] = AsyncSessionLocal) -> None:
+        self.session_pool = session_pool
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        async with self.session_pool() as session:
+            data["session"] = session
+            try:
+                result = await handler(event, data)
+            except Exception:
+                await session.rollback()
+                raise
+            await session.commit()
+            return result
@@ -1,13 +1,39 @@
 from __future__ import annotations
 
-from datetime import datetime
+from datetime import date, datetime
 from decimal import Decimal
 from typing import Optional
 
-from sqlalchemy import BigInteger, Boolean, DateTime, Enum, ForeignKey, Numeric, String
+from sqlalchemy import JSON, BigInteger, Boolean, Date, DateTime, Enum, ForeignKey, Index, Integer, Numeric, String
+from sqlalchemy.ext.hybrid import hybrid_property
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from .db import Base
+from .money import DEFAULT_CURRENCY, MinorUnits, from_minor, to_minor
+
+
+class AmountMixin:
+    """Decimal `amount` over the integer `amount_minor` column, scaled by the row's `currency`."""
+
+    def __init__(self, **kwargs):
+        # Scaling depends on currency, so apply the amount after all other columns
+        amount = kwargs.pop("amount", None)
+        super().__init__(**kwargs)
+        if amount is not None:
+            self.amount = amount
+
+    @hybrid_property
+    def amount(self) -> Decimal:
+        return from_minor(self.amount_minor, self.currency or DEFAULT_CURRENCY)
+
+    @amount.inplace.setter
+    def _amount_setter(self, value: Decimal) -> None:
+        self.amount_minor = to_minor(value, self.currency or DEFAULT_CURRENCY)
+
+    @amount.inplace.expression
+    @classmethod
+    def _amount_expression(cls):
+        return cls.amount_minor
 
 
 class User(Base):
@@ -17,7 +43,10 @@ class User(Base):
     telegram_id: Mapped[int] = mapped_column(BigInteger, unique=True, index=True)
     chat_id: Mapped[Optional[int]] = mapped_column(BigInteger, nullable=True)
     base_currency: Mapped[str] = mapped_column(String(8), default="RUB")
-    reminder_time: Mapped[str] = mapped_column(String(8), default="21:00")  # HH:MM
+    reminder_time: Mapped[str] = mapped_column(String(8), default="21:00")  # HH:MM or "off"
+    timezone: Mapped[Optional[str]] = mapped_column(String(64), nullable=True)  # IANA name; None = Settings.TIMEZONE
+    # next reminder in UTC, maintained by services.reminders; None until first computed
+    reminder_next_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True, index=True)
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
 
     accounts: Mapped[list[Account]] = relationship(back_populates="user", cascade="all, delete-orphan")
@@ -26,6 +55,7 @@ class User(Base):
 
 class Account(Base):
     __tablename__ = "accounts"
+    __table_args__ = (Index("uq_accounts_user_id_name", "user_id", "name", unique=True),)
 
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
     user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"), index=True)
@@ -33,21 +63,52 @@ class Account(Base):
     type: Mapped[str] = mapped_column(String(24), default="wallet")  # wallet/card/broker/crypto/other
     currency: Mapped[str] = mapped_column(String(8), default="RUB")
     is_external_balance: Mapped[bool] = mapped_column(Boolean, default=False)
-    external_balance: Mapped[Optional[Decimal]] = mapped_column(Numeric(18, 2), nullable=True)
+    # minor units of `currency`; use `external_balance` for the Decimal value
+    external_balance_minor: Mapped[Optional[int]] = mapped_column("external_balance", MinorUnits, nullable=True)
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
 
     user: Mapped[User] = relationship(back_populates="accounts")
     transactions: Mapped[list[Transaction]] = relationship(back_populates="account", cascade="all, delete-orphan")
 
+    def __init__(self, **kwargs):
+        # Scaling depends on currency, so apply the amount after all other columns
+        external_balance = kwargs.pop("external_balance", None)
+        super().__init__(**kwargs)
+        if external_balance is not None:
+            self.external_balance = external_balance
 
-class Transaction(Base):
+    @hybrid_property
+    def external_balance(self) -> Optional[Decimal]:
+        if self.external_balance_minor is None:
+            return None
+        return from_minor(self.external_balance_minor, self.currency or DEFAULT_CURRENCY)
+
+    @external_balance.inplace.setter
+    def _external_balance_setter(self, value: Optional[Decimal]) -> None:
+        self.external_balance_minor = None if value is None else to_minor(value, self.currency or DEFAULT_CURRENCY)
+
+    @external_balance.inplace.expression
+    @classmethod
+    def _external_balance_expression(cls):
+        return cls.external_balance_minor
+
+
+class Transaction(AmountMixin, Base):
     __tablename__ = "transactions"
+    __table_args__ = (
+        # "rows after checkpoint N" range scans
+        Index("ix_transactions_account_id_id", "account_id", "id"),
+        Index("ix_transactions_account_id_type", "account_id", "type"),
+        Index("ix_transactions_user_id_occurred_at", "user_id", "occurred_at"),
+        Index("ix_transactions_account_id_occurred_at", "account_id", "occurred_at"),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
     user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"), index=True)
     account_id: Mapped[int] = mapped_column(ForeignKey("accounts.id", ondelete="CASCADE"), index=True)
     type: Mapped[str] = mapped_column(String(8))  # expense | income
-    amount: Mapped[Decimal] = mapped_column(Numeric(18, 2))
+    # minor units of `currency`; use `amount` for the Decimal value
+    amount_minor: Mapped[int] = mapped_column("amount", MinorUnits)
     currency: Mapped[str] = mapped_column(String(8), default="RUB")
     category: Mapped[Optional[str]] = mapped_column(String(64), nullable=True)
     description: Mapped[Optional[str]] = mapped_column(String(256), nullable=True)
@@ -57,3 +118,102 @@ class Transaction(Base):
     user: Mapped[User] = relationship(back_populates="transactions")
     account: Mapped[Account] = relationship(back_populates="transactions")
 
+
+class AccountBalance(Base):
+    __tablename__ = "account_balances"
+
+    # Materialized running balance, maintained by services.balances.post_transactions
+    account_id: Mapped[int] = mapped_column(ForeignKey("accounts.id", ondelete="CASCADE"), primary_key=True)
+    balance: Mapped[int] = mapped_column(MinorUnits, default=0)  # minor units of the account currency
+    txn_count: Mapped[int] = mapped_column(Integer, default=0)
+    last_txn_id: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class BalanceCheckpoint(Base):
+    __tablename__ = "balance_checkpoints"
+    __table_args__ = (
+        Index("ix_balance_checkpoints_account_id_txn_id", "account_id", "txn_id"),
+        Index("ix_balance_checkpoints_account_id_cutoff", "account_id", "cutoff"),
+    )
+
+    # Balance of an account including every transaction with id <= txn_id;
+    # cutoff_balance counts only those of them that occurred before `cutoff`
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    account_id: Mapped[int] = mapped_column(ForeignKey("accounts.id", ondelete="CASCADE"))
+    txn_id: Mapped[int] = mapped_column(Integer)
+    balance: Mapped[int] = mapped_column(MinorUnits)  # minor units of the account currency
+    txn_count: Mapped[int] = mapped_column(Integer, default=0)
+    cutoff: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+    cutoff_balance: Mapped[Optional[int]] = mapped_column(MinorUnits, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+
+
+class FsmState(Base):
+    __tablename__ = "fsm_states"
+
+    # Persisted aiogram FSM record, see services.fsm_storage.DbStorage
+    key: Mapped[str] = mapped_column(String(128), primary_key=True)
+    state: Mapped[Optional[str]] = mapped_column(String(128), nullable=True)
+    data: Mapped[dict] = mapped_column(JSON, default=dict)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, index=True)
+
+
+class CurrencyRate(Base):
+    __tablename__ = "currency_rates"
+    __table_args__ = (
+        Index("uq_currency_rates_date_base_quote_source", "date", "base", "quote", "source", unique=True),
+        # per-pair history loads, see services.fx_history
+        Index("ix_currency_rates_base_quote_date", "base", "quote", "date"),
+    )
+
+    # `rate` units of `quote` per 1 `base` on `date`
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    date: Mapped[date] = mapped_column(Date)
+    base: Mapped[str] = mapped_column(String(8))
+    quote: Mapped[str] = mapped_column(String(8))
+    rate: Mapped[Decimal] = mapped_column(Numeric(18, 8))
+    source: Mapped[str] = mapped_column(String(16), default="CBR")  # CBR/ECB/Binance/Manual
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+
+
+class Subscription(AmountMixin, Base):
+    __tablename__ = "subscriptions"
+    __table_args__ = (Index("uq_subscriptions_user_id_name", "user_id", "name", unique=True),)
+
+    # Recurring charge; services.subscriptions advances next_charge after each one
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"), index=True)
+    name: Mapped[str] = mapped_column(String(64))
+    # minor units of `currency`; use `amount` for the Decimal value
+    amount_minor: Mapped[int] = mapped_column("amount", MinorUnits)
+    currency: Mapped[str] = mapped_column(String(8), default="RUB")
+    period: Mapped[str] = mapped_column(String(8), default="monthly")  # monthly | yearly
+    next_charge: Mapped[date] = mapped_column(Date, index=True)
+    # day of month the charge is anchored to, so Jan 31 -> Feb 28 -> Mar 31
+    charge_day: Mapped[int] = mapped_column(Integer)
+    # auto_post: record the expense on `account_id` when the charge date passes
+    account_id: Mapped[Optional[int]] = mapped_column(ForeignKey("accounts.id", ondelete="SET NULL"), nullable=True)
+    category: Mapped[Optional[str]] = mapped_column(String(64), nullable=True)
+    auto_post: Mapped[bool] = mapped_column(Boolean, default=False)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+
+
+class ScheduledTransfer(AmountMixin, Base):
+    __tablename__ = "scheduled_transfers"
+    __table_args__ = (
+        # earliest-due lookups and due batches, see services.scheduled_transfers
+        Index("ix_scheduled_transfers_enabled_next_run_at", "enabled", "next_run_at"),
+    )
+
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"), index=True)
+    from_account_id: Mapped[int] = mapped_column(ForeignKey("accounts.id", ondelete="CASCADE"))
+    to_account_id: Mapped[int] = mapped_column(ForeignKey("accounts.id", ondelete="CASCADE"))
+    # minor units of `currency`; use `amount` for the Decimal value
+    amount_minor: Mapped[int] = mapped_column("amount", MinorUnits)
+    currency: Mapped[str] = mapped_column(String(8), default="RUB")
+    cron: Mapped[str] = mapped_column(String(64))  # crontab expression in the user's timezone
+    next_run_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)  # UTC
+    enabled: Mapped[bool] = mapped_column(Boolean, default=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
@@ -0,0 +1,56 @@
+from __future__ import annotations
+
+from decimal import ROUND_HALF_UP, Decimal
+from typing import Any, Optional, Union
+
+from sqlalchemy import BigInteger
+from sqlalchemy.types import TypeDecorator
+
+
+# Fiat amounts are kept in cents/kopecks; anything else (crypto symbols) in 1e-8 units
+FIAT_SCALE = 2
+CRYPTO_SCALE = 8
+FIAT_CURRENCIES = frozenset(
+    {
+        "RUB", "RUR", "USD", "EUR", "GBP", "CHF", "CNY", "HKD", "JPY", "KZT", "BYN", "UAH",
+        "TRY", "AED", "GEL", "AMD", "AZN", "UZS", "KGS", "TJS", "THB", "INR", "CAD", "AUD",
+        "SGD", "PLN", "CZK", "SEK", "NOK", "DKK", "RSD", "ILS",
+    }
+)
+DEFAULT_CURRENCY = "RUB"
+
+Number = Union[Decimal, int, float, str]
+
+
+def scale_for(currency: Optional[str]) -> int:
+    code = (currency or DEFAULT_CURRENCY).upper()
+    return FIAT_SCALE if code in FIAT_CURRENCIES else CRYPTO_SCALE
+
+
+def to_minor(amount: Number, currency: Optional[str]) -> int:
+    value = amount if isinstance(amount, Decimal) else Decimal(str(amount))
+    return int((value.scaleb(scale_for(currency))).quantize(Decimal("1"), rounding=ROUND_HALF_UP))
+
+
+def from_minor(minor: int, currency: Optional[str]) -> Decimal:
+    return Decimal(int(minor)).scaleb(-scale_for(currency))
+
+
+class MinorUnits(TypeDecorator):
+    """Integer amount in minor units of the row's currency (see scale_for)."""
+
+    impl = BigInteger
+    cache_ok = True
+
+    def process_bind_param(self, value: Any, dialect) -> Optional[int]:
+        if value is None:
+            return None
+        if isinstance(value, int):
+            return value
+        dec = Decimal(str(value))
+        if dec != dec.to_integral_value():
+            raise ValueError(f"Minor-unit amount must be integral, got {value!r}")
+        return int(dec)
+
+    def process_result_value(self, value: Any, dialect) -> Optional[int]:
+        return None if value is None else int(value)
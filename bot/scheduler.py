@@ -1,35 +1,92 @@
 from __future__ import annotations
 
+import logging
+
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
-from datetime import datetime
+from apscheduler.triggers.interval import IntervalTrigger
+from datetime import date, datetime, timedelta
 
-from .services.subscriptions import load_subscriptions, format_subscription_line, is_due_within
+from .services.balances import write_checkpoints
+from .services.broadcast import send_messages
+from .services.crypto_history import backfill_crypto_prices
+from .services.crypto_prices import held_symbols, price_cache
+from .services.fx import fx_cache
+from .services.fx_history import backfill_cbr_rates
+from .services.reminders import reminder_scheduler
+from .services.scheduled_transfers import transfer_executor
+from .services.subscriptions import advance_subscriptions, due_subscriptions, format_subscription_line
 from .db import AsyncSessionLocal
-from .models import User
 
 
 scheduler: AsyncIOScheduler | None = None
 
 
 async def send_subscriptions_digest(bot) -> None:
-    subs = load_subscriptions()
-    due = [s for s in subs if is_due_within(s, 3)]
+    # read up front so the broadcast does not hold a read transaction for minutes
+    async with AsyncSessionLocal() as session:
+        due = await due_subscriptions(session, date.today(), days=3)
     if not due:
         return
-    text_lines = ["🔔 Ближайшие списания (≤ 3 дня):", ""] + [f"• {format_subscription_line(s)}" for s in due]
-    text = "\n".join(text_lines)
+    messages = [
+        (chat_id, "\n".join(["🔔 Ближайшие списания (≤ 3 дня):", ""] + [f"• {format_subscription_line(s)}" for s in subs]))
+        for chat_id, subs in due.items()
+    ]
+    stats = await send_messages(bot, messages)
+    logging.getLogger(__name__).info("Subscriptions digest: %s", stats.as_dict())
+
+
+async def advance_subscription_charges() -> None:
+    async with AsyncSessionLocal() as session:
+        report = await advance_subscriptions(session, date.today())
+        await session.commit()
+    if report.advanced:
+        logging.getLogger(__name__).info(
+            "Subscriptions advanced: %d, charges posted: %d, skipped: %d", report.advanced, report.posted, report.skipped
+        )
+
+
+async def write_balance_checkpoints() -> None:
+    async with AsyncSessionLocal() as session:
+        await write_checkpoints(session)
+        await session.commit()
+
+
+async def sync_currency_rates() -> None:
+    # the last week, so a failed run or a late publication is picked up next time
+    today = date.today()
+    async with AsyncSessionLocal() as session:
+        report = await backfill_cbr_rates(session, today - timedelta(days=7), today + timedelta(days=1))
+        await session.commit()
+    if report.failed:
+        logging.getLogger(__name__).warning("CBR rates not fetched for %s", sorted(report.failed))
+
+
+CRYPTO_REFRESH_SECONDS = 60
+
+
+async def refresh_crypto_prices() -> None:
+    # keep held symbols warm so balance screens never wait for CoinGecko
+    try:
+        await price_cache.refresh_symbol_map()
+    except Exception as e:
+        logging.getLogger(__name__).warning("CoinGecko symbol map refresh failed: %s", e)
+    async with AsyncSessionLocal() as session:
+        symbols = await held_symbols(session)
+    if symbols:
+        await price_cache.refresh(symbols, ahead=CRYPTO_REFRESH_SECONDS)
+        await fx_cache.rates()
+
 
+async def sync_crypto_history() -> None:
+    # yesterday's candle is final after midnight UTC; a few days back covers missed runs
+    today = datetime.utcnow().date()
     async with AsyncSessionLocal() as session:
-        users = (await session.execute(User.__table__.select())).all()
-        # fallback: broadcast to all users with chat_id
-        for row in users:
-            u = row[0]
-            if u.chat_id:
-                try:
-                    await bot.send_message(chat_id=u.chat_id, text=text)
-                except Exception:
-                    pass
+        symbols = await held_symbols(session)
+    if symbols:
+        report = await backfill_crypto_prices(symbols, today - timedelta(days=3), today - timedelta(days=1))
+        for sym, err in report.failed.items():
+            logging.getLogger(__name__).warning("Crypto history for %s not updated: %s", sym, err)
 
 
 def start_scheduler(bot) -> None:
@@ -37,4 +94,18 @@ def start_scheduler(bot) -> None:
     scheduler = AsyncIOScheduler()
     # every day at 10:00 local time
     scheduler.add_job(send_subscriptions_digest, CronTrigger(hour=10, minute=0), args=[bot])
+    # yesterday's charges are settled: move them to the next period
+    scheduler.add_job(advance_subscription_charges, CronTrigger(hour=0, minute=30))
+    # nightly balance checkpoints
+    scheduler.add_job(write_balance_checkpoints, CronTrigger(hour=3, minute=30))
+    # CBR publishes the next day's rates around 11:30 MSK
+    scheduler.add_job(sync_currency_rates, CronTrigger(hour=12, minute=0))
+    scheduler.add_job(sync_crypto_history, CronTrigger(hour=4, minute=0))
+    scheduler.add_job(
+        refresh_crypto_prices, IntervalTrigger(seconds=CRYPTO_REFRESH_SECONDS), next_run_time=datetime.now()
+    )
     scheduler.start()
+    # per-user daily reminders run from their own heap, not one job per user
+    reminder_scheduler.start(bot)
+    # likewise scheduled transfers: one executor sleeping until the earliest next_run_at
+    transfer_executor.start(bot)
@@ -0,0 +1,364 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from datetime import datetime, time
+from typing import Dict, Iterable, Optional, Sequence
+
+from sqlalchemy import and_, case, delete, func, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..models import Account, AccountBalance, BalanceCheckpoint, Transaction
+
+
+# Max (account_id, id > N) predicates per OR-ed range query
+_RANGE_CHUNK = 200
+
+
+# All balances here are integers in minor units of the account currency
+# (see bot.money); convert with from_minor() only when formatting.
+
+
+@dataclass
+class BalanceDrift:
+    account_id: int
+    currency: str
+    stored: Optional[int]
+    actual: int
+    stored_count: Optional[int]
+    actual_count: int
+
+
+def _signed_amount():
+    return case(
+        (Transaction.type == "income", Transaction.amount_minor),
+        (Transaction.type == "expense", -Transaction.amount_minor),
+        else_=0,
+    )
+
+
+def _txn_delta(txn: Transaction) -> int:
+    if txn.type == "income":
+        return txn.amount_minor
+    if txn.type == "expense":
+        return -txn.amount_minor
+    return 0
+
+
+async def _history_totals(session: AsyncSession, *where) -> Dict[int, tuple[int, int, int]]:
+    # Full-history aggregate: {account_id: (balance, txn_count, last_txn_id)}
+    stmt = (
+        select(
+            Transaction.account_id,
+            func.coalesce(func.sum(_signed_amount()), 0),
+            func.count(Transaction.id),
+            func.max(Transaction.id),
+        )
+        .where(*where)
+        .group_by(Transaction.account_id)
+    )
+    rows = (await session.execute(stmt)).all()
+    return {acc_id: (int(total), int(cnt), int(last_id)) for acc_id, total, cnt, last_id in rows}
+
+
+async def _latest_checkpoints(session: AsyncSession, account_ids: Sequence[int]) -> Dict[int, BalanceCheckpoint]:
+    latest = (
+        select(BalanceCheckpoint.account_id, func.max(BalanceCheckpoint.txn_id).label("txn_id"))
+        .where(BalanceCheckpoint.account_id.in_(account_ids))
+        .group_by(BalanceCheckpoint.account_id)
+        .subquery()
+    )
+    rows = (
+        await session.execute(
+            select(BalanceCheckpoint).join(
+                latest,
+                and_(
+                    BalanceCheckpoint.account_id == latest.c.account_id,
+                    BalanceCheckpoint.txn_id == latest.c.txn_id,
+                ),
+            )
+        )
+    ).scalars().all()
+    return {cp.account_id: cp for cp in rows}
+
+
+async def _checkpointed_totals(session: AsyncSession, account_ids: Sequence[int]) -> Dict[int, tuple[int, int, Optional[int]]]:
+    # Latest checkpoint + delta of rows after it, via the (account_id, id) index
+    out: Dict[int, tuple[int, int, Optional[int]]] = {}
+    ids = list(account_ids)
+    for i in range(0, len(ids), _RANGE_CHUNK):
+        chunk = ids[i:i + _RANGE_CHUNK]
+        cps = await _latest_checkpoints(session, chunk)
+        after = [
+            and_(Transaction.account_id == acc_id, Transaction.id > (cps[acc_id].txn_id if acc_id in cps else 0))
+            for acc_id in chunk
+        ]
+        deltas = await _history_totals(session, or_(*after))
+        for acc_id in chunk:
+            cp = cps.get(acc_id)
+            balance, count, last_id = (cp.balance, cp.txn_count, cp.txn_id) if cp else (0, 0, None)
+            if acc_id in deltas:
+                d_balance, d_count, last_id = deltas[acc_id]
+                balance += d_balance
+                count += d_count
+            out[acc_id] = (balance, count, last_id)
+    return out
+
+
+async def post_transactions(session: AsyncSession, txns: Sequence[Transaction]) -> None:
+    """Add transactions and apply them to account_balances in the same unit of work.
+
+    The caller owns the commit; nothing is visible until it commits.
+    """
+    if not txns:
+        return
+    session.add_all(txns)
+    await session.flush()
+
+    deltas: Dict[int, list] = {}
+    for t in txns:
+        d = deltas.setdefault(t.account_id, [0, 0, 0])
+        d[0] += _txn_delta(t)
+        d[1] += 1
+        d[2] = max(d[2], t.id)
+
+    for acc_id, (delta, count, last_id) in deltas.items():
+        res = await session.execute(
+            update(AccountBalance)
+            .where(AccountBalance.account_id == acc_id)
+            .values(
+                balance=AccountBalance.balance + delta,
+                txn_count=AccountBalance.txn_count + count,
+                last_txn_id=last_id,
+            )
+        )
+        if res.rowcount == 0:
+            # First write for this account (or a table that was never rebuilt):
+            # seed the row from checkpoint + history, which already includes the new rows.
+            balance, txn_count, last_txn_id = (await _checkpointed_totals(session, [acc_id]))[acc_id]
+            session.add(AccountBalance(account_id=acc_id, balance=balance, txn_count=txn_count, last_txn_id=last_txn_id))
+    await session.flush()
+
+
+async def drop_account_balance(session: AsyncSession, account_id: int) -> None:
+    await session.execute(delete(AccountBalance).where(AccountBalance.account_id == account_id))
+
+
+async def get_balances_for_users(session: AsyncSession, user_ids: Iterable[int]) -> Dict[int, Dict[int, int]]:
+    """Return {user_id: {account_id: balance in minor units}} for every account of the given users."""
+    ids = sorted(set(user_ids))
+    out: Dict[int, Dict[int, int]] = {uid: {} for uid in ids}
+    if not ids:
+        return out
+    rows = (
+        await session.execute(
+            select(
+                Account.id,
+                Account.user_id,
+                Account.is_external_balance,
+                Account.external_balance_minor,
+                AccountBalance.balance,
+            )
+            .select_from(Account)
+            .outerjoin(AccountBalance, AccountBalance.account_id == Account.id)
+            .where(Account.user_id.in_(ids))
+        )
+    ).all()
+
+    missing: list[tuple[int, int]] = []
+    for acc_id, user_id, is_external, external_minor, balance in rows:
+        # External balance (broker portfolio, debts, crypto holdings) overrides the ledger
+        if is_external and external_minor is not None:
+            out[user_id][acc_id] = external_minor
+        elif balance is not None:
+            out[user_id][acc_id] = balance
+        else:
+            missing.append((user_id, acc_id))
+
+    if missing:
+        totals = await _checkpointed_totals(session, [acc_id for _, acc_id in missing])
+        for user_id, acc_id in missing:
+            out[user_id][acc_id] = totals[acc_id][0]
+    return out
+
+
+async def get_user_balances(session: AsyncSession, user_id: int) -> Dict[int, int]:
+    """Return {account_id: balance in minor units} for all accounts of one user."""
+    return (await get_balances_for_users(session, [user_id]))[user_id]
+
+
+async def rebuild_account_balances(session: AsyncSession, apply: bool = True) -> list[BalanceDrift]:
+    """Recompute account_balances from the full history and report rows that drifted."""
+    actual = await _history_totals(session)
+    accounts = (await session.execute(select(Account.id, Account.currency))).all()
+    account_ids = [acc_id for acc_id, _ in accounts]
+    stored = {
+        row.account_id: row
+        for row in (await session.execute(select(AccountBalance))).scalars().all()
+    }
+
+    drifts: list[BalanceDrift] = []
+    for acc_id, currency in accounts:
+        balance, txn_count, last_txn_id = actual.get(acc_id, (0, 0, None))
+        row = stored.get(acc_id)
+        if row is None:
+            drifted = txn_count > 0
+        else:
+            drifted = row.balance != balance or row.txn_count != txn_count
+        if drifted:
+            drifts.append(
+                BalanceDrift(
+                    account_id=acc_id,
+                    currency=currency,
+                    stored=row.balance if row is not None else None,
+                    actual=balance,
+                    stored_count=row.txn_count if row is not None else None,
+                    actual_count=txn_count,
+                )
+            )
+        if not apply:
+            continue
+        if row is None:
+            session.add(AccountBalance(account_id=acc_id, balance=balance, txn_count=txn_count, last_txn_id=last_txn_id))
+        else:
+            row.balance = balance
+            row.txn_count = txn_count
+            row.last_txn_id = last_txn_id
+
+    if apply:
+        # Rows left behind by accounts deleted outside the ORM
+        orphans = set(stored) - set(account_ids)
+        if orphans:
+            await session.execute(delete(AccountBalance).where(AccountBalance.account_id.in_(orphans)))
+        await session.flush()
+    return drifts
+
+
+async def write_checkpoints(session: AsyncSession, cutoff: Optional[datetime] = None) -> int:
+    """Snapshot every account that got new transactions since its last checkpoint.
+
+    Besides the running total each snapshot records the balance of rows that occurred
+    before `cutoff` (default: start of the current UTC day), which balance_as_of starts from.
+    """
+    if cutoff is None:
+        cutoff = datetime.combine(datetime.utcnow().date(), time.min)
+    latest = (
+        select(BalanceCheckpoint.account_id, func.max(BalanceCheckpoint.txn_id).label("txn_id"))
+        .group_by(BalanceCheckpoint.account_id)
+        .subquery()
+    )
+    changed = (
+        await session.execute(
+            select(AccountBalance.account_id)
+            .outerjoin(latest, latest.c.account_id == AccountBalance.account_id)
+            .where(AccountBalance.last_txn_id > func.coalesce(latest.c.txn_id, 0))
+        )
+    ).scalars().all()
+    if not changed:
+        return 0
+    totals = await _checkpointed_totals(session, changed)
+    upto = {acc_id: last_id for acc_id, (_, _, last_id) in totals.items() if last_id is not None}
+    before = await _totals_as_of(session, list(upto), cutoff, strict=True, upto=upto)
+    written = 0
+    for acc_id, (balance, count, last_id) in totals.items():
+        if last_id is None:
+            continue
+        session.add(BalanceCheckpoint(
+            account_id=acc_id,
+            txn_id=last_id,
+            balance=balance,
+            txn_count=count,
+            cutoff=cutoff,
+            cutoff_balance=before[acc_id],
+        ))
+        written += 1
+    await session.flush()
+    return written
+
+
+async def _cutoff_checkpoints(session: AsyncSession, account_ids: Sequence[int], when: datetime) -> Dict[int, BalanceCheckpoint]:
+    # Latest checkpoint with cutoff <= when per account, via the (account_id, cutoff) index
+    latest = (
+        select(BalanceCheckpoint.account_id, func.max(BalanceCheckpoint.cutoff).label("cutoff"))
+        .where(BalanceCheckpoint.account_id.in_(account_ids), BalanceCheckpoint.cutoff <= when)
+        .group_by(BalanceCheckpoint.account_id)
+        .subquery()
+    )
+    rows = (
+        await session.execute(
+            select(BalanceCheckpoint).join(
+                latest,
+                and_(
+                    BalanceCheckpoint.account_id == latest.c.account_id,
+                    BalanceCheckpoint.cutoff == latest.c.cutoff,
+                ),
+            )
+        )
+    ).scalars().all()
+    out: Dict[int, BalanceCheckpoint] = {}
+    for cp in rows:
+        # several runs on one day share a cutoff; the last one covers the most rows
+        if cp.account_id not in out or cp.txn_id > out[cp.account_id].txn_id:
+            out[cp.account_id] = cp
+    return out
+
+
+async def _totals_as_of(
+    session: AsyncSession,
+    account_ids: Sequence[int],
+    when: datetime,
+    strict: bool = False,
+    upto: Optional[Dict[int, int]] = None,
+) -> Dict[int, int]:
+    # {account_id: sum of rows that occurred at (strict: before) `when`}, optionally only ids <= upto[account_id].
+    # From the latest keyed checkpoint it adds the (account_id, occurred_at) range [cutoff, when]
+    # and the rows backdated before the cutoff after the checkpoint was written (id > txn_id).
+    out: Dict[int, int] = {}
+    ids = list(account_ids)
+    for i in range(0, len(ids), _RANGE_CHUNK):
+        chunk = ids[i:i + _RANGE_CHUNK]
+        cps = await _cutoff_checkpoints(session, chunk, when)
+        ranges = []
+        for acc_id in chunk:
+            bounds = [Transaction.occurred_at < when if strict else Transaction.occurred_at <= when]
+            if upto is not None:
+                bounds.append(Transaction.id <= upto[acc_id])
+            cp = cps.get(acc_id)
+            if cp is None:
+                ranges.append(and_(Transaction.account_id == acc_id, *bounds))
+                continue
+            ranges.append(and_(Transaction.account_id == acc_id, Transaction.occurred_at >= cp.cutoff, *bounds))
+            ranges.append(and_(
+                Transaction.account_id == acc_id,
+                Transaction.id > cp.txn_id,
+                Transaction.occurred_at < cp.cutoff,
+                *bounds[1:],
+            ))
+        deltas = await _history_totals(session, or_(*ranges))
+        for acc_id in chunk:
+            cp = cps.get(acc_id)
+            out[acc_id] = (cp.cutoff_balance if cp else 0) + (deltas[acc_id][0] if acc_id in deltas else 0)
+    return out
+
+
+async def balances_as_of(session: AsyncSession, account_ids: Sequence[int], when: datetime) -> Dict[int, int]:
+    """{account_id: ledger balance (minor units) counting transactions that occurred at or before `when`}.
+
+    Each account starts from its latest checkpoint with a cutoff at or before `when`,
+    so only the rows since that cutoff are summed; one query per _RANGE_CHUNK accounts.
+    """
+    return await _totals_as_of(session, account_ids, when)
+
+
+async def balance_as_of(session: AsyncSession, account_id: int, when: datetime) -> int:
+    """Ledger balance (minor units) of one account as of `when`, see balances_as_of."""
+    return (await balances_as_of(session, [account_id], when))[account_id]
+
+
+async def get_user_balances_as_of(session: AsyncSession, user_id: int, when: datetime) -> Dict[int, int]:
+    """Return {account_id: ledger balance as of `when`, minor units} for a user's non-external accounts."""
+    account_ids = (
+        await session.execute(
+            select(Account.id).where(Account.user_id == user_id, Account.is_external_balance == False)
+        )
+    ).scalars().all()
+    return await balances_as_of(session, account_ids, when)
@@ -0,0 +1,192 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterable, AsyncIterator, Dict, Iterable, Optional, Tuple, Union
+
+from aiogram import Bot
+from aiogram.exceptions import (
+    TelegramAPIError,
+    TelegramForbiddenError,
+    TelegramNetworkError,
+    TelegramRetryAfter,
+    TelegramServerError,
+)
+
+
+logger = logging.getLogger(__name__)
+
+# Telegram allows about 30 messages/s overall and 1/s to the same chat
+GLOBAL_RATE = 25.0
+PER_CHAT_INTERVAL = 1.0
+
+
+class TokenBucket:
+    """`rate` tokens per second up to `capacity`; waiters are served in arrival order."""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None) -> None:
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def pause(self, seconds: float) -> None:
+        """Hand out nothing for `seconds` (Telegram's retry_after), then restart from empty."""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0.0
+        self._updated = self._paused_until
+
+
+class ChatLimiter:
+    """Minimum interval between sends to the same chat."""
+
+    def __init__(self, interval: float = PER_CHAT_INTERVAL) -> None:
+        self.interval = interval
+        self._next: Dict[int, float] = {}
+
+    async def wait(self, chat_id: int) -> None:
+        now = time.monotonic()
+        at = self._next.get(chat_id, now)
+        self._next[chat_id] = max(at, now) + self.interval
+        if at > now:
+            await asyncio.sleep(at - now)
+        if len(self._next) > 10_000:
+            self._next = {c: t for c, t in self._next.items() if t > now}
+
+
+@dataclass
+class BroadcastStats:
+    queued: int = 0
+    sent: int = 0
+    blocked: int = 0  # bot blocked or chat gone (403)
+    failed: int = 0
+    retries: int = 0
+    started_at: float = field(default_factory=time.monotonic)
+    finished_at: Optional[float] = None
+
+    @property
+    def elapsed(self) -> float:
+        return (self.finished_at or time.monotonic()) - self.started_at
+
+    def as_dict(self) -> dict:
+        return {
+            "queued": self.queued,
+            "sent": self.sent,
+            "blocked": self.blocked,
+            "failed": self.failed,
+            "retries": self.retries,
+            "elapsed_s": round(self.elapsed, 1),
+        }
+
+
+async def send_messages(
+    bot: Bot,
+    messages: Union[Iterable[Tuple[int, str]], AsyncIterable[Tuple[int, str]]],
+    workers: int = 16,
+    rate: float = GLOBAL_RATE,
+    per_chat_interval: float = PER_CHAT_INTERVAL,
+    max_attempts: int = 4,
+    **send_kwargs: Any,
+) -> BroadcastStats:
+    """Send (chat_id, text) pairs through `workers` concurrent senders under Telegram's rate limits.
+
+    A RetryAfter pauses the shared bucket for every worker and the message is retried;
+    network and server errors are retried with backoff; any other error counts as failed.
+    """
+    stats = BroadcastStats()
+    bucket = TokenBucket(rate)
+    per_chat = ChatLimiter(per_chat_interval)
+    queue: asyncio.Queue[Optional[Tuple[int, str]]] = asyncio.Queue(maxsize=workers * 4)
+
+    async def send(chat_id: int, text: str) -> None:
+        for attempt in range(max_attempts):
+            await bucket.acquire()
+            await per_chat.wait(chat_id)
+            try:
+                await bot.send_message(chat_id=chat_id, text=text, **send_kwargs)
+            except TelegramRetryAfter as e:
+                stats.retries += 1
+                bucket.pause(e.retry_after)
+            except (TelegramNetworkError, TelegramServerError):
+                stats.retries += 1
+                await asyncio.sleep(2 ** attempt)
+            except TelegramForbiddenError:
+                stats.blocked += 1
+                return
+            except TelegramAPIError as e:
+                logger.warning("Broadcast to %s failed: %s", chat_id, e)
+                stats.failed += 1
+                return
+            except Exception:
+                # anything else (bad send_kwargs, a client bug) must not kill the worker,
+                # or the producer would block on a queue nobody drains
+                logger.exception("Broadcast to %s failed", chat_id)
+                stats.failed += 1
+                return
+            else:
+                stats.sent += 1
+                return
+        stats.failed += 1
+
+    async def worker() -> None:
+        while True:
+            item = await queue.get()
+            try:
+                if item is None:
+                    return
+                await send(*item)
+            finally:
+                queue.task_done()
+
+    tasks = [asyncio.create_task(worker()) for _ in range(workers)]
+    try:
+        if isinstance(messages, AsyncIterable):
+            async for item in messages:
+                stats.queued += 1
+                await queue.put(item)
+        else:
+            for item in messages:
+                stats.queued += 1
+                await queue.put(item)
+        for _ in tasks:
+            await queue.put(None)
+        await asyncio.gather(*tasks)
+    finally:
+        for t in tasks:
+            t.cancel()
+        stats.finished_at = time.monotonic()
+    return stats
+
+
+async def broadcast(
+    bot: Bot,
+    chat_ids: Union[Iterable[int], AsyncIterable[int]],
+    text: str,
+    **kwargs: Any,
+) -> BroadcastStats:
+    """Send the same `text` to every chat; see `send_messages` for limits and retries."""
+    if isinstance(chat_ids, AsyncIterable):
+        async def pairs() -> AsyncIterator[Tuple[int, str]]:
+            async for chat_id in chat_ids:
+                yield chat_id, text
+
+        return await send_messages(bot, pairs(), **kwargs)
+    return await send_messages(bot, ((chat_id, text) for chat_id in chat_ids), **kwargs)
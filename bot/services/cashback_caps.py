@@ -0,0 +1,164 @@
+from __future__ import annotations
+
+import math
+import time
+from collections import OrderedDict
+from datetime import date, timedelta
+from typing import Dict, Optional, Sequence, Tuple
+
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from ..models import Account, Transaction
+from ..money import from_minor
+from .cashback_engine import CashbackIndex, TxnContext, _calc_estimate, get_index
+from .cashback_models import CashbackRule
+
+
+def window_start(rule: CashbackRule, day: date) -> date:
+    """First day of the cap window of `rule` containing `day`."""
+    period = rule.reward.cap.period if rule.reward.cap is not None else "total"
+    if period == "monthly":
+        return day.replace(day=1)
+    if period == "weekly":
+        return day - timedelta(days=day.weekday())
+    return rule.validity.start
+
+
+class CapLedger:
+    """Cashback already earned by one user per (rule, account name, cap window).
+
+    Built once from stored expenses, then kept current by `record()` (fed from
+    committed sessions, see below), so headroom is a dict lookup.
+    """
+
+    def __init__(self, index: CashbackIndex, account_names: Dict[int, str]) -> None:
+        self.index = index
+        self.account_names = account_names
+        self.earned: Dict[Tuple[str, str, date], float] = {}
+        self.stale = False
+        self.loaded_at = time.monotonic()
+
+    def remaining(self, rule: CashbackRule, account: str, day: date) -> float:
+        cap = rule.reward.cap
+        if cap is None:
+            return math.inf
+        return max(0.0, cap.amount - self.earned.get((rule.id, account, window_start(rule, day)), 0.0))
+
+    def record(self, ctx: TxnContext, account: str) -> None:
+        """Book the cashback an expense earns: the best exclusive rule plus every stackable one.
+
+        Transactions do not store an MCC, so MCC-conditioned rules count only through their
+        category/merchant conditions (see `CashbackIndex.matching_rules`). Caps are amounts
+        in `Cap.currency`; an expense in another currency is not booked against them.
+        """
+        best: Optional[Tuple[float, CashbackRule]] = None
+        stacked: list[Tuple[float, CashbackRule]] = []
+        for rule in self.index.matching_rules(ctx, account, ignore_mcc=ctx.mcc is None):
+            cap = rule.reward.cap
+            if cap is not None and cap.currency.upper() != ctx.currency.upper():
+                continue
+            est = min(_calc_estimate(rule, ctx), self.remaining(rule, account, ctx.occurred_on))
+            if rule.stackable:
+                stacked.append((est, rule))
+            elif best is None or est > best[0]:
+                best = (est, rule)
+        for est, rule in ([best] if best else []) + stacked:
+            if est > 0:
+                key = (rule.id, account, window_start(rule, ctx.occurred_on))
+                self.earned[key] = self.earned.get(key, 0.0) + est
+
+    def record_txn(
+        self,
+        account_id: int,
+        amount: float,
+        currency: str,
+        occurred_on: date,
+        category: Optional[str],
+        merchant: Optional[str],
+    ) -> None:
+        account = self.account_names.get(account_id)
+        if account is None:
+            # account created after load; rebuild on next use
+            self.stale = True
+            return
+        self.record(
+            TxnContext(amount=amount, currency=currency, occurred_on=occurred_on, category=category, merchant=merchant),
+            account,
+        )
+
+
+async def load_cap_ledger(session: AsyncSession, user_id: int, index: CashbackIndex) -> CapLedger:
+    accounts = (await session.execute(select(Account.id, Account.name).where(Account.user_id == user_id))).all()
+    ledger = CapLedger(index, {a.id: a.name for a in accounts})
+    if not index.rules:
+        return ledger
+    since = min(r.validity.start for r in index.rules)
+    # cap windows fill up in spending order
+    rows = await session.stream(
+        select(Transaction.account_id, Transaction.amount_minor, Transaction.currency, Transaction.occurred_at,
+               Transaction.category, Transaction.description)
+        .where(Transaction.user_id == user_id, Transaction.type == "expense", Transaction.occurred_at >= since)
+        .order_by(Transaction.occurred_at, Transaction.id)
+        .execution_options(yield_per=1000)
+    )
+    async for r in rows:
+        ledger.record_txn(
+            r.account_id, float(from_minor(r.amount_minor, r.currency)), r.currency, r.occurred_at.date(), r.category, r.description
+        )
+    ledger.stale = False
+    return ledger
+
+
+# Bounded LRU like identity_cache; the TTL covers expenses written by other processes (tools/)
+LEDGER_MAXSIZE = 256
+LEDGER_TTL = 3600.0
+_ledgers: OrderedDict[int, CapLedger] = OrderedDict()
+
+
+async def get_cap_ledger(session: AsyncSession, user_id: int, rules: Sequence[CashbackRule]) -> CapLedger:
+    """Ledger of `user_id` for the current rules, loaded on first use, when stale or expired."""
+    index = get_index(rules)
+    ledger = _ledgers.get(user_id)
+    if (
+        ledger is None
+        or ledger.stale
+        or ledger.index is not index
+        or time.monotonic() - ledger.loaded_at > LEDGER_TTL
+    ):
+        ledger = await load_cap_ledger(session, user_id, index)
+        _ledgers[user_id] = ledger
+    _ledgers.move_to_end(user_id)
+    while len(_ledgers) > LEDGER_MAXSIZE:
+        _ledgers.popitem(last=False)
+    return ledger
+
+
+# Feed committed expenses into loaded ledgers instead of re-reading history
+_INFO_KEY = "cap_ledger_pending"
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_expenses(session: Session, flush_context) -> None:
+    if not _ledgers:
+        return
+    pending = session.info.setdefault(_INFO_KEY, [])
+    for obj in session.new:
+        if isinstance(obj, Transaction) and obj.type == "expense" and obj.user_id in _ledgers:
+            pending.append(
+                (obj.user_id, obj.account_id, float(obj.amount), obj.currency, obj.occurred_at.date(), obj.category, obj.description)
+            )
+
+
+@event.listens_for(Session, "after_commit")
+def _record_expenses(session: Session) -> None:
+    for user_id, *txn in session.info.pop(_INFO_KEY, ()):
+        ledger = _ledgers.get(user_id)
+        if ledger is not None:
+            ledger.record_txn(*txn)
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_expenses(session: Session) -> None:
+    session.info.pop(_INFO_KEY, None)
@@ -1,10 +1,17 @@
 from __future__ import annotations
 
+from bisect import bisect_right
+from collections import defaultdict
 from dataclasses import dataclass
-from datetime import date
-from typing import Iterable, Optional
+from datetime import date, timedelta
+from typing import TYPE_CHECKING, Dict, FrozenSet, Iterable, List, Optional, Sequence, Tuple
 
-from .cashback_models import CashbackRule
+from .cashback_models import CashbackRule, category_lineage, category_matches
+from .merchant_automaton import MerchantAutomaton
+from .merchants import merchant_key, resolver_for_patterns
+
+if TYPE_CHECKING:
+    from .cashback_caps import CapLedger
 
 
 @dataclass
@@ -26,21 +33,6 @@ class CashbackEstimate:
     reason: str
 
 
-def _match_rule(rule: CashbackRule, ctx: TxnContext, account_name: str) -> bool:
-    if account_name not in rule.applies_to.accounts:
-        return False
-    if not (rule.validity.start <= ctx.occurred_on <= rule.validity.end):
-        return False
-    cond = rule.conditions
-    if cond.categories and (ctx.category is None or ctx.category not in cond.categories):
-        return False
-    if cond.merchants and (ctx.merchant is None or not any(m.lower() in ctx.merchant.lower() for m in cond.merchants)):
-        return False
-    if cond.mcc and (ctx.mcc is None or ctx.mcc not in cond.mcc):
-        return False
-    return True
-
-
 def _calc_estimate(rule: CashbackRule, ctx: TxnContext) -> float:
     if rule.reward.kind == "percent":
         cash = ctx.amount * (rule.reward.value / 100.0)
@@ -51,16 +43,178 @@ def _calc_estimate(rule: CashbackRule, ctx: TxnContext) -> float:
     return round(cash, 2)
 
 
-def suggest_best_account(ctx: TxnContext, rules: Iterable[CashbackRule], candidate_accounts: Iterable[str]) -> Optional[CashbackEstimate]:
-    best: Optional[CashbackEstimate] = None
-    for acc in candidate_accounts:
-        for rule in rules:
-            if not _match_rule(rule, ctx, acc):
-                continue
-            est = _calc_estimate(rule, ctx)
-            reason = f"{rule.reward.kind} {rule.reward.value} with cap {rule.reward.cap.amount if rule.reward.cap else '∞'}"
-            cur = CashbackEstimate(account=acc, rule_id=rule.id, rule_title=rule.title, estimated_amount=est, reason=reason)
-            if best is None or cur.estimated_amount > best.estimated_amount:
-                best = cur
-    return best
+def _reason(rule: CashbackRule) -> str:
+    return f"{rule.reward.kind} {rule.reward.value} with cap {rule.reward.cap.amount if rule.reward.cap else '∞'}"
+
+
+@dataclass(frozen=True)
+class _CompiledRule:
+    rule: CashbackRule
+    categories: FrozenSet[str]
+    mcc: FrozenSet[int]
+    merchant_ids: FrozenSet[int]  # pattern ids in the automaton
+
+
+class _AccountBucket:
+    """Rules of one account keyed by the most selective condition they have."""
+
+    def __init__(self) -> None:
+        self.by_mcc: Dict[int, List[int]] = defaultdict(list)
+        self.by_category: Dict[str, List[int]] = defaultdict(list)
+        self.by_merchant: Dict[int, List[int]] = defaultdict(list)
+        self.unconditional: List[int] = []
+
+    def add(self, idx: int, cr: _CompiledRule) -> None:
+        if cr.mcc:
+            for m in cr.mcc:
+                self.by_mcc[m].append(idx)
+        elif cr.categories:
+            for c in cr.categories:
+                self.by_category[c].append(idx)
+        elif cr.merchant_ids:
+            for pid in cr.merchant_ids:
+                self.by_merchant[pid].append(idx)
+        else:
+            self.unconditional.append(idx)
+
+
+class CashbackIndex:
+    """Compiled form of `iter_rules` output.
+
+    Rules are bucketed per account by MCC, category or merchant pattern and
+    filtered by a precomputed validity timeline, so a suggestion only verifies the
+    few rules that can match instead of every (account, rule) pair.
+    """
+
+    def __init__(self, rules: Sequence[CashbackRule]) -> None:
+        # keep priority order: candidates are visited by index
+        self.rules = tuple(rules)
+        patterns: Dict[str, int] = {}
+        compiled: List[_CompiledRule] = []
+        for rule in self.rules:
+            cond = rule.conditions
+            ids = set()
+            for m in cond.merchants:
+                key = merchant_key(m)
+                if key:
+                    ids.add(patterns.setdefault(key, len(patterns)))
+            compiled.append(_CompiledRule(rule, frozenset(cond.categories), frozenset(cond.mcc), frozenset(ids)))
+        self._compiled = tuple(compiled)
+        self._automaton = MerchantAutomaton(patterns.items())
+        # descriptors that contain no pattern verbatim ("TROIKA" vs "Тройка") go through the fuzzy resolver
+        self._resolver = resolver_for_patterns(m for r in self.rules for m in r.conditions.merchants)
+
+        self._accounts: Dict[str, _AccountBucket] = defaultdict(_AccountBucket)
+        for idx, cr in enumerate(compiled):
+            for acc in cr.rule.applies_to.accounts:
+                self._accounts[acc].add(idx, cr)
+
+        # validity timeline: segment i covers [bounds[i], bounds[i+1]) and lists active rules
+        bounds = sorted({r.validity.start for r in self.rules} | {r.validity.end + timedelta(days=1) for r in self.rules})
+        self._bounds = bounds
+        self._active: List[FrozenSet[int]] = [
+            frozenset(i for i, r in enumerate(self.rules) if r.validity.start <= b and b <= r.validity.end)
+            for b in bounds
+        ]
+
+    def _active_at(self, day: date) -> FrozenSet[int]:
+        pos = bisect_right(self._bounds, day) - 1
+        return self._active[pos] if pos >= 0 else frozenset()
+
+    def _merchant_hits(self, merchant: Optional[str]) -> FrozenSet[int]:
+        if not merchant:
+            return frozenset()
+        hits = self._automaton.find(merchant_key(merchant))
+        if not hits:
+            canonical = self._resolver.resolve(merchant)
+            if canonical is not None:
+                hits = self._automaton.find(merchant_key(canonical.name))
+        return hits
+
+    def _verify(self, cr: _CompiledRule, ctx: TxnContext, hits: FrozenSet[int], ignore_mcc: bool = False) -> bool:
+        if cr.categories and not category_matches(cr.categories, ctx.category):
+            return False
+        if cr.mcc:
+            if ignore_mcc:
+                # MCC unknown: only rules that also name categories or merchants can be judged
+                if not (cr.categories or cr.merchant_ids):
+                    return False
+            elif ctx.mcc not in cr.mcc:
+                return False
+        if cr.merchant_ids and not (cr.merchant_ids & hits):
+            return False
+        return True
+
+    def matching_rules(
+        self, ctx: TxnContext, account_name: str, hits: Optional[FrozenSet[int]] = None, ignore_mcc: bool = False
+    ) -> List[CashbackRule]:
+        """Rules applying to `ctx` on `account_name`, in priority order.
+
+        `ignore_mcc` is for stored transactions, which carry no MCC: rules with an MCC condition
+        then match on their category/merchant conditions alone, and MCC-only rules never match.
+        """
+        bucket = self._accounts.get(account_name)
+        if bucket is None:
+            return []
+        active = self._active_at(ctx.occurred_on)
+        if not active:
+            return []
+        if hits is None:
+            hits = self._merchant_hits(ctx.merchant)
+        candidates = set(bucket.unconditional)
+        if ignore_mcc:
+            for ids in bucket.by_mcc.values():
+                candidates.update(ids)
+        elif ctx.mcc is not None:
+            candidates.update(bucket.by_mcc.get(ctx.mcc, ()))
+        if ctx.category:
+            for c in category_lineage(ctx.category):
+                candidates.update(bucket.by_category.get(c, ()))
+        for pid in hits:
+            candidates.update(bucket.by_merchant.get(pid, ()))
+        candidates &= active
+        return [self._compiled[i].rule for i in sorted(candidates) if self._verify(self._compiled[i], ctx, hits, ignore_mcc)]
+
+    def suggest(
+        self, ctx: TxnContext, candidate_accounts: Iterable[str], ledger: Optional[CapLedger] = None
+    ) -> Optional[CashbackEstimate]:
+        """Best (account, rule) for `ctx`; with a ledger, estimates are clamped to the cap headroom left."""
+        hits = self._merchant_hits(ctx.merchant)
+        best: Optional[CashbackEstimate] = None
+        for acc in candidate_accounts:
+            for rule in self.matching_rules(ctx, acc, hits):
+                est = _calc_estimate(rule, ctx)
+                if ledger is not None:
+                    est = round(min(est, ledger.remaining(rule, acc, ctx.occurred_on)), 2)
+                if best is None or est > best.estimated_amount:
+                    best = CashbackEstimate(account=acc, rule_id=rule.id, rule_title=rule.title, estimated_amount=est, reason=_reason(rule))
+        return best
+
+    def suggest_many(
+        self, contexts: Iterable[TxnContext], candidate_accounts: Sequence[str], ledger: Optional[CapLedger] = None
+    ) -> list[Optional[CashbackEstimate]]:
+        accounts = list(candidate_accounts)
+        return [self.suggest(ctx, accounts, ledger) for ctx in contexts]
+
+
+_last_index: Optional[Tuple[Sequence[CashbackRule], CashbackIndex]] = None
+
+
+def get_index(rules: Sequence[CashbackRule]) -> CashbackIndex:
+    """Compile `rules`, reusing the last index while the same (cached) tuple is passed."""
+    global _last_index
+    if _last_index is not None and _last_index[0] is rules:
+        return _last_index[1]
+    index = CashbackIndex(rules)
+    if isinstance(rules, tuple):
+        _last_index = (rules, index)
+    return index
+
 
+def suggest_best_account(
+    ctx: TxnContext,
+    rules: Iterable[CashbackRule],
+    candidate_accounts: Iterable[str],
+    ledger: Optional[CapLedger] = None,
+) -> Optional[CashbackEstimate]:
+    return get_index(rules if isinstance(rules, tuple) else tuple(rules)).suggest(ctx, candidate_accounts, ledger)
@@ -1,10 +1,49 @@
 from __future__ import annotations
 
+import hashlib
+import logging
+import pickle
+import tempfile
+from dataclasses import dataclass, field
+from datetime import date
 from pathlib import Path
-from typing import Iterable
+from typing import Iterable, List, Optional, Tuple
 import yaml
+from pydantic import ValidationError
 
 from .cashback_models import CashbackRulesFile, CashbackRule
+from .config_cache import config_cache
+
+
+logger = logging.getLogger(__name__)
+
+ROOT = Path(__file__).resolve().parents[2]
+RULES_DIR = ROOT / "cashback"
+SNAPSHOT_DIRNAME = ".compiled"
+# Part of the snapshot key: bump when cashback_models or the pickled layout change,
+# so snapshots written by an older version are recompiled instead of unpickled
+SNAPSHOT_VERSION = 2
+
+
+@dataclass(frozen=True)
+class RuleFileError:
+    file: str
+    location: str  # dotted path inside the file, "" for file-level problems
+    message: str
+
+    def __str__(self) -> str:
+        return f"{self.file}: {self.location + ': ' if self.location else ''}{self.message}"
+
+
+@dataclass
+class CompileReport:
+    compiled: List[str] = field(default_factory=list)  # months validated in this run
+    cached: List[str] = field(default_factory=list)  # months whose snapshot was current
+    errors: List[RuleFileError] = field(default_factory=list)
+
+    @property
+    def ok(self) -> bool:
+        return not self.errors
 
 
 def load_cashback_rules(file_path: Path) -> CashbackRulesFile:
@@ -12,15 +51,167 @@ def load_cashback_rules(file_path: Path) -> CashbackRulesFile:
     return CashbackRulesFile.model_validate(data)
 
 
-def iter_rules(files: Iterable[Path]) -> list[CashbackRule]:
+def validate_rules_file(file_path: Path, raw: Optional[bytes] = None) -> Tuple[Optional[CashbackRulesFile], List[RuleFileError]]:
+    """Parse and validate one monthly file, returning every problem instead of raising."""
+    name = file_path.name
+    try:
+        data = yaml.safe_load((raw if raw is not None else file_path.read_bytes()).decode("utf-8"))
+    except (OSError, UnicodeDecodeError, yaml.YAMLError) as e:
+        return None, [RuleFileError(name, "", str(e))]
+    try:
+        rules_file = CashbackRulesFile.model_validate(data)
+    except ValidationError as e:
+        return None, [RuleFileError(name, ".".join(str(p) for p in err["loc"]), err["msg"]) for err in e.errors()]
+    errors = []
+    if rules_file.month != file_path.stem:
+        errors.append(RuleFileError(name, "month", f"month {rules_file.month!r} does not match the file name"))
+    seen: set[str] = set()
+    for i, rule in enumerate(rules_file.rules):
+        if rule.id in seen:
+            errors.append(RuleFileError(name, f"rules.{i}.id", f"duplicate rule id {rule.id!r}"))
+        seen.add(rule.id)
+        if rule.validity.end < rule.validity.start:
+            errors.append(RuleFileError(name, f"rules.{i}.validity", "end is before start"))
+    return (None if errors else rules_file), errors
+
+
+def _snapshot_path(file_path: Path, raw: bytes) -> Path:
+    digest = hashlib.sha256(f"v{SNAPSHOT_VERSION}:".encode() + raw).hexdigest()
+    return file_path.parent / SNAPSHOT_DIRNAME / f"{file_path.stem}-{digest[:16]}.pickle"
+
+
+def _read_snapshot(snapshot: Path) -> Optional[Tuple[CashbackRule, ...]]:
+    # any failure is a cache miss: the caller recompiles from the yaml
+    try:
+        rules = pickle.loads(snapshot.read_bytes())
+    except Exception:
+        logger.warning("Unreadable cashback snapshot %s, recompiling", snapshot)
+        return None
+    if not (isinstance(rules, tuple) and all(isinstance(r, CashbackRule) for r in rules)):
+        logger.warning("Cashback snapshot %s has an unexpected layout, recompiling", snapshot)
+        return None
+    return rules
+
+
+def _load_month(file_path: Path) -> Tuple[Tuple[CashbackRule, ...], Tuple[RuleFileError, ...]]:
+    """Rules of one monthly file from its snapshot, compiling the snapshot if the content changed."""
+    rules, errors, _ = _load_month_cached(file_path)
+    return rules, errors
+
+
+def _load_month_cached(file_path: Path) -> Tuple[Tuple[CashbackRule, ...], Tuple[RuleFileError, ...], bool]:
+    # third item: whether the rules came from a current snapshot
+    raw = file_path.read_bytes()
+    snapshot = _snapshot_path(file_path, raw)
+    if snapshot.exists():
+        rules = _read_snapshot(snapshot)
+        if rules is not None:
+            return rules, (), True
+    rules_file, errors = validate_rules_file(file_path, raw)
+    if rules_file is None:
+        return (), tuple(errors), False
+    rules = tuple(sorted(rules_file.rules, key=lambda r: r.priority))
+    _write_snapshot(file_path, snapshot, rules)
+    return rules, (), False
+
+
+def _write_snapshot(file_path: Path, snapshot: Path, rules: Tuple[CashbackRule, ...]) -> None:
+    # Best effort: a read-only checkout or a full disk only costs the next load a recompile.
+    # The bot and a tool may compile the same month at once, hence the unique temp file
+    # and tolerating a stale snapshot the other process already removed.
+    tmp = None
+    try:
+        snapshot.parent.mkdir(exist_ok=True)
+        for old in snapshot.parent.glob(f"{file_path.stem}-*.pickle"):
+            if old != snapshot:
+                old.unlink(missing_ok=True)
+        with tempfile.NamedTemporaryFile(dir=snapshot.parent, prefix=f"{file_path.stem}-", suffix=".tmp", delete=False) as f:
+            tmp = Path(f.name)
+            f.write(pickle.dumps(rules, protocol=pickle.HIGHEST_PROTOCOL))
+        tmp.replace(snapshot)
+    except OSError as e:
+        logger.warning("Cashback snapshot %s not written: %s", snapshot, e)
+        if tmp is not None:
+            tmp.unlink(missing_ok=True)
+
+
+def _load_month_logged(file_path: Path) -> Tuple[CashbackRule, ...]:
+    rules, errors = _load_month(file_path)
+    for err in errors:
+        logger.warning("Cashback rules skipped: %s", err)
+    return rules
+
+
+def compile_rules(rules_dir: Path = RULES_DIR) -> CompileReport:
+    """Validate every monthly file once and refresh the snapshots that are out of date."""
+    report = CompileReport()
+    for fp in sorted(rules_dir.glob("*.yaml")):
+        _, errors, fresh = _load_month_cached(fp)
+        if errors:
+            report.errors.extend(errors)
+        elif fresh:
+            report.cached.append(fp.stem)
+        else:
+            report.compiled.append(fp.stem)
+    return report
+
+
+def month_bounds(month: str, months: int = 1) -> tuple[date, date]:
+    """[first day of YYYY-MM, first day after `months` months)."""
+    y, m = map(int, month.split("-"))
+    start = date(y, m, 1)
+    idx = y * 12 + (m - 1) + months
+    return start, date(idx // 12, idx % 12 + 1, 1)
+
+
+class RuleStore:
+    """Monthly rule files opened lazily: only the months a date can fall into are loaded."""
+
+    def __init__(self, rules_dir: Path = RULES_DIR) -> None:
+        self.rules_dir = rules_dir
+
+    def month_rules(self, month: str) -> Tuple[CashbackRule, ...]:
+        fp = self.rules_dir / f"{month}.yaml"
+        if not fp.exists():
+            return ()
+        return config_cache.get(fp, _load_month_logged)
+
+    def rules_for(self, day: date) -> Tuple[CashbackRule, ...]:
+        """Rules valid on `day`; last month's file is included for rules running over the month end."""
+        prev = date(day.year - 1, 12, 1) if day.month == 1 else date(day.year, day.month - 1, 1)
+        rules = [
+            r
+            for month in (prev.strftime("%Y-%m"), day.strftime("%Y-%m"))
+            for r in self.month_rules(month)
+            if r.validity.start <= day <= r.validity.end
+        ]
+        rules.sort(key=lambda r: r.priority)
+        return tuple(rules)
+
+    def rules_between(self, start: date, end: date) -> Tuple[CashbackRule, ...]:
+        """Rules of every month file from the month before `start` through `end` (inclusive)."""
+        months: List[str] = []
+        y, m = (start.year - 1, 12) if start.month == 1 else (start.year, start.month - 1)
+        while (y, m) <= (end.year, end.month):
+            months.append(f"{y:04d}-{m:02d}")
+            y, m = (y + 1, 1) if m == 12 else (y, m + 1)
+        rules = [r for month in months for r in self.month_rules(month)]
+        rules.sort(key=lambda r: r.priority)
+        return tuple(rules)
+
+
+def _parse_rules(*files: Path) -> Tuple[CashbackRule, ...]:
     collected: list[CashbackRule] = []
     for fp in files:
-        try:
-            cf = load_cashback_rules(fp)
-            collected.extend(cf.rules)
-        except Exception:
-            continue
+        collected.extend(_load_month_logged(fp))
     # sort by priority
     collected.sort(key=lambda r: r.priority)
-    return collected
+    return tuple(collected)
+
+
+def iter_rules(files: Iterable[Path]) -> Tuple[CashbackRule, ...]:
+    return config_cache.get(list(files), _parse_rules)
+
 
+async def iter_rules_async(files: Iterable[Path]) -> Tuple[CashbackRule, ...]:
+    return await config_cache.aget(list(files), _parse_rules)
@@ -1,39 +1,55 @@
 from __future__ import annotations
 
 from datetime import date
-from typing import List, Optional
-from pydantic import BaseModel, Field
+from typing import Collection, List, Optional
+from pydantic import BaseModel, ConfigDict, Field
 
 
-class Validity(BaseModel):
+def category_lineage(category: str) -> List[str]:
+    """"Group/Sub" and its parents, most specific first: ["Group/Sub", "Group"]."""
+    parts = category.split("/")
+    return ["/".join(parts[:i]) for i in range(len(parts), 0, -1)]
+
+
+def category_matches(rule_categories: Collection[str], category: Optional[str]) -> bool:
+    # app categories are "Group/Sub"; a rule for "Group" covers all of them
+    return bool(category) and any(c in rule_categories for c in category_lineage(category))
+
+
+class _Frozen(BaseModel):
+    # rules are cached and shared between callers (see config_cache)
+    model_config = ConfigDict(frozen=True)
+
+
+class Validity(_Frozen):
     start: date
     end: date
 
 
-class Cap(BaseModel):
+class Cap(_Frozen):
     period: str = Field(default="monthly")  # monthly | weekly | total
     amount: float
     currency: str = Field(default="RUB")
 
 
-class Reward(BaseModel):
+class Reward(_Frozen):
     kind: str = Field(default="percent")  # percent | fixed
     value: float  # percent e.g. 5.0 or fixed amount in currency
     cap: Optional[Cap] = None
 
 
-class Conditions(BaseModel):
+class Conditions(_Frozen):
     categories: List[str] = Field(default_factory=list)  # our internal categories
     mcc: List[int] = Field(default_factory=list)
     merchants: List[str] = Field(default_factory=list)  # substrings / normalized names
     tags: List[str] = Field(default_factory=list)  # arbitrary tags
 
 
-class AppliesTo(BaseModel):
+class AppliesTo(_Frozen):
     accounts: List[str] = Field(default_factory=list)  # account names (cards) in our system
 
 
-class CashbackRule(BaseModel):
+class CashbackRule(_Frozen):
     id: str
     title: str
     validity: Validity
@@ -45,7 +61,7 @@ class CashbackRule(BaseModel):
     notes: Optional[str] = None
 
 
-class CashbackRulesFile(BaseModel):
+class CashbackRulesFile(_Frozen):
     month: str  # YYYY-MM
     rules: List[CashbackRule]
 
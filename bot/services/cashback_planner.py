@@ -0,0 +1,182 @@
+from __future__ import annotations
+
+import calendar
+from dataclasses import dataclass, field
+from datetime import date
+from typing import Dict, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .cashback_models import CashbackRule, category_matches
+
+
+@dataclass
+class PlanLine:
+    category: str
+    account: Optional[str]  # None: no card earns anything on this part
+    amount: float
+    cashback: float
+
+
+@dataclass
+class AllocationPlan:
+    lines: List[PlanLine] = field(default_factory=list)
+    total_cashback: float = 0.0
+
+
+def _monthly_cap(rule: CashbackRule, days_in_month: int) -> float:
+    cap = rule.reward.cap
+    if cap is None:
+        return np.inf
+    if cap.period == "weekly":
+        return cap.amount * days_in_month / 7.0
+    return cap.amount
+
+
+def _simplex_max(c: np.ndarray, A: np.ndarray, b: np.ndarray, max_iter: int = 5000) -> np.ndarray:
+    """Maximize c @ x subject to A @ x <= b, x >= 0, for b >= 0 (origin is feasible).
+
+    Dense tableau with Bland's rule, which is plenty for the few hundred
+    variables a monthly plan has.
+    """
+    m, n = A.shape
+    tab = np.zeros((m + 1, n + m + 1))
+    tab[:m, :n] = A
+    tab[:m, n:n + m] = np.eye(m)
+    tab[:m, -1] = b
+    tab[m, :n] = -c
+    basis = list(range(n, n + m))
+    eps = 1e-9
+    for _ in range(max_iter):
+        entering = np.flatnonzero(tab[m, :-1] < -eps)
+        if len(entering) == 0:
+            break
+        col = entering[0]
+        column = tab[:m, col]
+        positive = column > eps
+        if not positive.any():
+            raise ValueError("cashback plan LP is unbounded")
+        ratios = np.full(m, np.inf)
+        ratios[positive] = tab[:m, -1][positive] / column[positive]
+        best = ratios.min()
+        # Bland: among tied rows leave the one whose basic variable has the lowest index
+        row = min(np.flatnonzero(ratios <= best + eps), key=lambda i: basis[i])
+        tab[row] /= tab[row, col]
+        others = np.arange(m + 1) != row
+        tab[others] -= np.outer(tab[others, col], tab[row])
+        basis[row] = col
+    x = np.zeros(n + m)
+    for i, var in enumerate(basis):
+        x[var] = tab[i, -1]
+    return x[:n]
+
+
+def plan_allocation(
+    spend: Mapping[str, float],
+    rules: Sequence[CashbackRule],
+    accounts: Sequence[str],
+    month: str,
+) -> AllocationPlan:
+    """Split planned monthly spend per category across `accounts` to maximize cashback.
+
+    Solves an LP: spend x[category, card] earns, per (rule, card), the rule's rate on
+    the categories it covers, up to the rule's cap. On each card a category feeds its
+    best exclusive rule plus every stackable one. Rules valid for part of the month
+    only count that share of the spend. Fixed rewards, rules with any merchant
+    condition (they pay only at those merchants, not on the whole category) and
+    MCC-only rules cannot be planned from category totals and are ignored; a rule
+    with both categories and MCCs is planned on its categories, as the engine
+    matches it when the MCC is unknown.
+    """
+    y, mo = map(int, month.split("-"))
+    days = calendar.monthrange(y, mo)[1]
+    first, last = date(y, mo, 1), date(y, mo, days)
+    categories = [k for k, v in spend.items() if v > 0]
+    cards = list(accounts)
+
+    # (rule, card) -> categories it earns on, with the effective rate
+    earns: Dict[Tuple[int, int], List[int]] = {}
+    rate: Dict[Tuple[int, int], float] = {}
+    cap: Dict[Tuple[int, int], float] = {}
+    for ci, card in enumerate(cards):
+        best_excl: Dict[int, Tuple[float, int]] = {}
+        usable: List[Tuple[int, float]] = []
+        for ri, r in enumerate(rules):
+            if card not in r.applies_to.accounts or r.reward.kind != "percent":
+                continue
+            overlap = (min(r.validity.end, last) - max(r.validity.start, first)).days + 1
+            if overlap <= 0:
+                continue
+            cond = r.conditions
+            # like the engine for MCC-less transactions: a merchant condition narrows the rule
+            # below a whole category, an MCC one is judged on the categories alone
+            if cond.merchants or (cond.mcc and not cond.categories):
+                continue
+            eff = r.reward.value / 100.0 * overlap / days
+            usable.append((ri, eff))
+            if not r.stackable:
+                for ki, k in enumerate(categories):
+                    if not cond.categories or category_matches(cond.categories, k):
+                        if ki not in best_excl or (eff, -r.priority) > (best_excl[ki][0], -rules[best_excl[ki][1]].priority):
+                            best_excl[ki] = (eff, ri)
+        for ri, eff in usable:
+            r = rules[ri]
+            ks = [
+                ki for ki, k in enumerate(categories)
+                if (not r.conditions.categories or category_matches(r.conditions.categories, k))
+                and (r.stackable or best_excl.get(ki, (0, None))[1] == ri)
+            ]
+            if ks:
+                earns[(ri, ci)] = ks
+                rate[(ri, ci)] = eff
+                cap[(ri, ci)] = _monthly_cap(r, days)
+
+    nk, nc = len(categories), len(cards)
+    pairs = list(earns)
+    nx, ny = nk * nc, len(pairs)
+    plan = AllocationPlan()
+    if nk == 0:
+        return plan
+    if ny == 0 or nc == 0:
+        plan.lines = [PlanLine(k, None, round(float(spend[k]), 2), 0.0) for k in categories]
+        return plan
+
+    rows: List[np.ndarray] = []
+    bounds: List[float] = []
+    for ki, k in enumerate(categories):  # sum_c x[k, c] <= S_k
+        row = np.zeros(nx + ny)
+        row[ki * nc:(ki + 1) * nc] = 1.0
+        rows.append(row)
+        bounds.append(float(spend[k]))
+    for j, (ri, ci) in enumerate(pairs):  # y <= rate * sum_k x[k, c]
+        row = np.zeros(nx + ny)
+        row[nx + j] = 1.0
+        for ki in earns[(ri, ci)]:
+            row[ki * nc + ci] = -rate[(ri, ci)]
+        rows.append(row)
+        bounds.append(0.0)
+        if np.isfinite(cap[(ri, ci)]):  # y <= cap
+            row = np.zeros(nx + ny)
+            row[nx + j] = 1.0
+            rows.append(row)
+            bounds.append(cap[(ri, ci)])
+    objective = np.concatenate([np.zeros(nx), np.ones(ny)])
+    sol = _simplex_max(objective, np.array(rows), np.array(bounds))
+    x = sol[:nx].reshape(nk, nc)
+    yv = sol[nx:]
+
+    # attribute each (rule, card) cashback to categories by their share of that card's spend
+    cash = np.zeros((nk, nc))
+    for j, (ri, ci) in enumerate(pairs):
+        ks = earns[(ri, ci)]
+        base = x[ks, ci].sum()
+        if base > 1e-9:
+            cash[ks, ci] += yv[j] * x[ks, ci] / base
+    for ki, k in enumerate(categories):
+        for ci in np.flatnonzero(x[ki] > 0.005):
+            plan.lines.append(PlanLine(k, cards[ci], round(float(x[ki, ci]), 2), round(float(cash[ki, ci]), 2)))
+        rest = float(spend[k]) - float(x[ki].sum())
+        if rest > 0.005:
+            plan.lines.append(PlanLine(k, None, round(rest, 2), 0.0))
+    plan.total_cashback = round(float(yv.sum()), 2)
+    return plan
@@ -0,0 +1,259 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from datetime import date, datetime
+from typing import Dict, FrozenSet, List, Optional, Sequence
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..models import Account, Transaction
+from ..money import from_minor
+from .cashback_models import CashbackRule, category_matches
+from .merchant_automaton import MerchantAutomaton
+from .merchants import MerchantResolver, merchant_key, resolver_for_patterns
+
+
+@dataclass
+class ExpenseArrays:
+    """Expenses in chronological order as parallel arrays."""
+
+    user_id: np.ndarray  # int64
+    account: np.ndarray  # object, account name the expense was paid with
+    amount: np.ndarray  # float64, in account currency
+    day: np.ndarray  # int64, date ordinal
+    category: np.ndarray  # object, None when unset
+    merchant: np.ndarray  # object, None when unset
+    mcc: np.ndarray  # int64, -1 when unknown
+    user_accounts: Dict[int, List[str]]  # cards each user could have paid with
+
+    def __len__(self) -> int:
+        return len(self.amount)
+
+
+@dataclass
+class SimulationResult:
+    actual: np.ndarray  # cashback per expense with the card actually used
+    optimal: np.ndarray  # cashback per expense with the best assignment found
+    optimal_account: np.ndarray  # object, card of the best assignment
+    user_id: np.ndarray
+
+    def totals_by_user(self) -> Dict[int, tuple[float, float]]:
+        out: Dict[int, tuple[float, float]] = {}
+        for uid in np.unique(self.user_id):
+            mask = self.user_id == uid
+            out[int(uid)] = (round(float(self.actual[mask].sum()), 2), round(float(self.optimal[mask].sum()), 2))
+        return out
+
+
+async def load_expenses(session: AsyncSession, start: date, end: date, user_ids: Optional[Sequence[int]] = None) -> ExpenseArrays:
+    """Expenses with start <= occurred_at < end, for all users unless `user_ids` is given."""
+    stmt = (
+        select(Transaction.user_id, Account.name, Transaction.amount_minor, Transaction.currency,
+               Transaction.occurred_at, Transaction.category, Transaction.description)
+        .join(Account, Account.id == Transaction.account_id)
+        .where(
+            Transaction.type == "expense",
+            Transaction.occurred_at >= datetime.combine(start, datetime.min.time()),
+            Transaction.occurred_at < datetime.combine(end, datetime.min.time()),
+        )
+        .order_by(Transaction.occurred_at, Transaction.id)
+    )
+    acc_stmt = select(Account.user_id, Account.name).where(Account.is_external_balance == False)  # noqa: E712
+    if user_ids is not None:
+        stmt = stmt.where(Transaction.user_id.in_(user_ids))
+        acc_stmt = acc_stmt.where(Account.user_id.in_(user_ids))
+    rows = (await session.execute(stmt)).all()
+    user_accounts: Dict[int, List[str]] = {}
+    for uid, name in (await session.execute(acc_stmt.order_by(Account.id))).all():
+        user_accounts.setdefault(uid, []).append(name)
+    return ExpenseArrays(
+        user_id=np.array([r[0] for r in rows], dtype=np.int64),
+        account=np.array([r[1] for r in rows], dtype=object),
+        amount=np.array([float(from_minor(r[2], r[3])) for r in rows], dtype=np.float64),
+        day=np.array([r[4].toordinal() for r in rows], dtype=np.int64),
+        category=np.array([r[5] for r in rows], dtype=object),
+        merchant=np.array([r[6] for r in rows], dtype=object),
+        mcc=np.full(len(rows), -1, dtype=np.int64),
+        user_accounts=user_accounts,
+    )
+
+
+class _RuleMatrix:
+    """Rules as arrays: one row per rule, one column per card for `applies`."""
+
+    MONTHLY, WEEKLY, TOTAL = 0, 1, 2
+
+    def __init__(self, rules: Sequence[CashbackRule], cards: List[str]) -> None:
+        self.rules = list(rules)
+        n = len(self.rules)
+        card_pos = {c: i for i, c in enumerate(cards)}
+        self.applies = np.zeros((n, len(cards)), dtype=bool)
+        self.start = np.empty(n, dtype=np.int64)
+        self.end = np.empty(n, dtype=np.int64)
+        self.percent = np.zeros(n)
+        self.fixed = np.zeros(n)
+        self.cap = np.full(n, np.inf)
+        self.period = np.full(n, self.TOTAL, dtype=np.int64)
+        self.stackable = np.zeros(n, dtype=bool)
+        for i, r in enumerate(self.rules):
+            for name in r.applies_to.accounts:
+                if name in card_pos:
+                    self.applies[i, card_pos[name]] = True
+            self.start[i] = r.validity.start.toordinal()
+            self.end[i] = r.validity.end.toordinal()
+            if r.reward.kind == "percent":
+                self.percent[i] = r.reward.value / 100.0
+            else:
+                self.fixed[i] = r.reward.value
+            if r.reward.cap is not None:
+                self.cap[i] = r.reward.cap.amount
+                self.period[i] = {"monthly": self.MONTHLY, "weekly": self.WEEKLY}.get(r.reward.cap.period, self.TOTAL)
+            self.stackable[i] = r.stackable
+
+    def condition_mask(self, exp: ExpenseArrays) -> np.ndarray:
+        """(expenses, rules) mask of category, MCC, merchant and validity conditions."""
+        n = len(self.rules)
+        cats, cat_code = np.unique(np.array([c or "" for c in exp.category], dtype=object), return_inverse=True)
+        cat_ok = np.ones((len(cats), n), dtype=bool)
+        mccs, mcc_code = np.unique(exp.mcc, return_inverse=True)
+        mcc_ok = np.ones((len(mccs), n), dtype=bool)
+        merchants, merch_code = np.unique(np.array([merchant_key(m) if m else "" for m in exp.merchant], dtype=object), return_inverse=True)
+        merch_ok = np.ones((len(merchants), n), dtype=bool)
+
+        patterns: Dict[str, int] = {}
+        rule_patterns: List[set[int]] = []
+        for j, r in enumerate(self.rules):
+            cond = r.conditions
+            if cond.categories:
+                allowed = set(cond.categories)
+                cat_ok[:, j] = [category_matches(allowed, c) for c in cats]
+            pids = {patterns.setdefault(p, len(patterns)) for p in map(merchant_key, cond.merchants) if p}
+            rule_patterns.append(pids)
+            if cond.mcc:
+                allowed_mcc = set(cond.mcc)
+                # stored expenses carry no MCC (-1): like the engine, such a rule then matches
+                # through its category/merchant conditions only, and an MCC-only rule not at all
+                judged = bool(cond.categories or pids)
+                mcc_ok[:, j] = [judged if m < 0 else int(m) in allowed_mcc for m in mccs]
+        automaton = MerchantAutomaton(patterns.items())
+        resolver = resolver_for_patterns(m for r in self.rules for m in r.conditions.merchants)
+        hits = [self._merchant_hits(automaton, resolver, m) for m in merchants]
+        for j, pids in enumerate(rule_patterns):
+            if pids:
+                merch_ok[:, j] = [bool(pids & h) for h in hits]
+
+        valid = (exp.day[:, None] >= self.start[None, :]) & (exp.day[:, None] <= self.end[None, :])
+        return cat_ok[cat_code] & mcc_ok[mcc_code] & merch_ok[merch_code] & valid
+
+    @staticmethod
+    def _merchant_hits(automaton: MerchantAutomaton, resolver: MerchantResolver, key: str) -> FrozenSet[int]:
+        if not key:
+            return frozenset()
+        hits = automaton.find(key)
+        if not hits:
+            canonical = resolver.resolve(key)
+            if canonical is not None:
+                hits = automaton.find(merchant_key(canonical.name))
+        return hits
+
+    def window(self, day: np.ndarray) -> np.ndarray:
+        """(expenses, rules) cap window id: month index, Monday ordinal or 0 for the whole validity."""
+        dates = [date.fromordinal(int(d)) for d in day]
+        month = np.array([d.year * 12 + d.month for d in dates], dtype=np.int64)
+        monday = day - np.array([d.weekday() for d in dates], dtype=np.int64)
+        return np.select(
+            [self.period[None, :] == self.MONTHLY, self.period[None, :] == self.WEEKLY],
+            [np.broadcast_to(month[:, None], (len(day), len(self.rules))), np.broadcast_to(monday[:, None], (len(day), len(self.rules)))],
+            0,
+        )
+
+
+def _contributions(raw: np.ndarray, applies: np.ndarray, stackable: np.ndarray, card: np.ndarray) -> np.ndarray:
+    """(expenses, rules) uncapped cashback when expense t is paid with card[t]."""
+    on_card = raw * applies[:, card].T
+    exclusive = np.where(stackable[None, :], 0.0, on_card)
+    best = exclusive.argmax(axis=1)
+    keep = stackable[None, :] | (np.arange(raw.shape[1])[None, :] == best[:, None])
+    return np.where(keep, on_card, 0.0)
+
+
+def _apply_caps(contrib: np.ndarray, cap: np.ndarray, user: np.ndarray, card: np.ndarray, window: np.ndarray) -> np.ndarray:
+    """Clamp contributions so each (user, rule, card, window) earns at most the cap, in expense order."""
+    t, r = np.nonzero(contrib)
+    if len(t) == 0:
+        return np.zeros_like(contrib)
+    vals = contrib[t, r]
+    order = np.lexsort((t, window[t, r], card[t], r, user[t]))
+    t, r, vals = t[order], r[order], vals[order]
+    key = np.stack([user[t], r, card[t], window[t, r]], axis=1)
+    new_group = np.ones(len(t), dtype=bool)
+    new_group[1:] = np.any(key[1:] != key[:-1], axis=1)
+    cum = np.cumsum(vals)
+    group_base = np.maximum.accumulate(np.where(new_group, cum - vals, 0.0))
+    capped = np.minimum(cum - group_base, cap[r])
+    prev = np.where(new_group, 0.0, np.concatenate(([0.0], capped[:-1])))
+    out = np.zeros_like(contrib)
+    out[t, r] = capped - prev
+    return out
+
+
+def simulate(exp: ExpenseArrays, rules: Sequence[CashbackRule], max_rounds: int = 8) -> SimulationResult:
+    """Cashback earned with the cards actually used vs. the best card per expense.
+
+    Of several matching exclusive rules the one with the larger uncapped cashback
+    applies, plus every stackable rule; caps are consumed in expense order.
+
+    The best assignment starts from the highest uncapped cashback per expense; expenses
+    that then lose cashback to an exhausted cap are moved to their next best card,
+    repeated until nothing moves (at most `max_rounds` times).
+    """
+    cards = sorted(set(exp.account) | {a for r in rules for a in r.applies_to.accounts} | {a for names in exp.user_accounts.values() for a in names})
+    card_pos = {c: i for i, c in enumerate(cards)}
+    rm = _RuleMatrix(rules, cards)
+    n = len(exp)
+    if n == 0 or not rm.rules:
+        zeros = np.zeros(n)
+        return SimulationResult(actual=zeros, optimal=zeros.copy(), optimal_account=exp.account.copy(), user_id=exp.user_id)
+
+    raw = np.where(rm.condition_mask(exp), exp.amount[:, None] * rm.percent[None, :] + rm.fixed[None, :], 0.0)
+    raw = np.minimum(raw, rm.cap[None, :])
+    window = rm.window(exp.day)
+    actual_card = np.array([card_pos[a] for a in exp.account], dtype=np.int64)
+
+    def earned(card: np.ndarray) -> np.ndarray:
+        return _apply_caps(_contributions(raw, rm.applies, rm.stackable, card), rm.cap, exp.user_id, card, window).sum(axis=1)
+
+    actual = earned(actual_card)
+
+    # value[t, c]: uncapped cashback of expense t on card c, -inf for cards the user does not have
+    owns = np.zeros((n, len(cards)), dtype=bool)
+    owns[np.arange(n), actual_card] = True
+    for uid, names in exp.user_accounts.items():
+        owns[np.ix_(exp.user_id == uid, [card_pos[a] for a in names])] = True
+    value = np.full((n, len(cards)), -np.inf)
+    for c in range(len(cards)):
+        value[:, c] = np.where(owns[:, c], _contributions(raw, rm.applies, rm.stackable, np.full(n, c)).sum(axis=1), -np.inf)
+    card = value.argmax(axis=1)
+    # ties keep the card actually used
+    card = np.where(value[np.arange(n), actual_card] >= value[np.arange(n), card], actual_card, card)
+    best = earned(card)
+    for _ in range(max_rounds):
+        short = best < value[np.arange(n), card] - 1e-9
+        if not short.any():
+            break
+        value[np.arange(n)[short], card[short]] = best[short]
+        moved = value.argmax(axis=1)
+        if np.array_equal(moved, card):
+            break
+        card = moved
+        best = earned(card)
+    # the heuristic can lose to what was actually done; keep the better one per user
+    for uid in np.unique(exp.user_id):
+        mask = exp.user_id == uid
+        if best[mask].sum() < actual[mask].sum():
+            card[mask], best[mask] = actual_card[mask], actual[mask]
+    cards_arr = np.array(cards, dtype=object)
+    return SimulationResult(actual=np.round(actual, 2), optimal=np.round(best, 2), optimal_account=cards_arr[card], user_id=exp.user_id)
+
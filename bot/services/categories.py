@@ -1,29 +1,59 @@
 from __future__ import annotations
 
+from dataclasses import dataclass
 from pathlib import Path
-from typing import List
+from typing import Tuple
 import yaml
 
+from aiogram.types import InlineKeyboardButton
+
+from .config_cache import config_cache
+
 
 ROOT = Path(__file__).resolve().parents[2]
 EXPENSE_FILE = ROOT / "config" / "categories_mvp.yaml"
 INCOME_FILE = ROOT / "config" / "income_categories.yaml"
 
 
-def load_categories(kind: str = "expense") -> List[str]:
-    file_path = INCOME_FILE if kind == "income" else EXPENSE_FILE
+@dataclass(frozen=True)
+class CategoryMenu:
+    names: Tuple[str, ...]
+    # two buttons per row, callback_data "wizard:cat:<name>"; shared, do not mutate
+    rows: Tuple[Tuple[InlineKeyboardButton, ...], ...]
+
+
+def _parse_categories(file_path: Path) -> Tuple[str, ...]:
     try:
         data = yaml.safe_load(file_path.read_text(encoding="utf-8"))
         if isinstance(data, list):
-            return [str(x) for x in data]
+            return tuple(str(x) for x in data)
     except Exception:
         pass
     # Fallbacks
-    if kind == "income":
-        return ["Зарплата", "Подарок", "Прочее"]
-    return [
+    if file_path == INCOME_FILE:
+        return ("Зарплата", "Подарок", "Прочее")
+    return (
         "Еда/Продукты",
         "Еда/Вне дома",
         "Транспорт/Такси",
         "Прочее",
-    ]
+    )
+
+
+def _parse_category_menu(file_path: Path) -> CategoryMenu:
+    names = _parse_categories(file_path)
+    buttons = [InlineKeyboardButton(text=c, callback_data=f"wizard:cat:{c}") for c in names]
+    rows = tuple(tuple(buttons[i:i + 2]) for i in range(0, len(buttons), 2))
+    return CategoryMenu(names=names, rows=rows)
+
+
+def _file_for(kind: str) -> Path:
+    return INCOME_FILE if kind == "income" else EXPENSE_FILE
+
+
+def load_categories(kind: str = "expense") -> Tuple[str, ...]:
+    return config_cache.get(_file_for(kind), _parse_categories)
+
+
+async def load_category_menu(kind: str = "expense") -> CategoryMenu:
+    return await config_cache.aget(_file_for(kind), _parse_category_menu)
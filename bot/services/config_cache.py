@@ -0,0 +1,92 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Sequence, Tuple, TypeVar
+
+T = TypeVar("T")
+
+# (mtime_ns, size) per file, None for a missing file
+Signature = Tuple[Optional[Tuple[int, int]], ...]
+
+
+@dataclass
+class _Entry:
+    value: Any
+    signature: Signature
+    checked_at: float
+
+
+def _stat(path: Path) -> Optional[Tuple[int, int]]:
+    try:
+        st = path.stat()
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+class ConfigCache:
+    """Parsed config files, re-parsed only when a file's mtime or size changes.
+
+    Files are stat()-ed at most once per `check_interval` seconds. Parsers must
+    return immutable values: the same object is handed to every caller.
+    """
+
+    def __init__(self, check_interval: float = 5.0) -> None:
+        self.check_interval = check_interval
+        self._entries: Dict[Tuple[Callable, Tuple[Path, ...]], _Entry] = {}
+        self._locks: Dict[Tuple[Callable, Tuple[Path, ...]], asyncio.Lock] = {}
+
+    def _fresh(self, key) -> Optional[Tuple[Optional[_Entry], Signature]]:
+        """Return None if the cached value is current, else (entry, new signature)."""
+        entry = self._entries.get(key)
+        now = time.monotonic()
+        if entry is not None and now - entry.checked_at < self.check_interval:
+            return None
+        signature = tuple(_stat(p) for p in key[1])
+        if entry is not None and entry.signature == signature:
+            entry.checked_at = now
+            return None
+        return entry, signature
+
+    def _store(self, key, value: Any, signature: Signature) -> Any:
+        self._entries[key] = _Entry(value=value, signature=signature, checked_at=time.monotonic())
+        return value
+
+    def get(self, paths: Path | Sequence[Path], parser: Callable[..., T]) -> T:
+        """Parse synchronously on a miss; `parser` receives the paths as arguments."""
+        key = (parser, _as_tuple(paths))
+        stale = self._fresh(key)
+        if stale is None:
+            return self._entries[key].value
+        return self._store(key, parser(*key[1]), stale[1])
+
+    async def aget(self, paths: Path | Sequence[Path], parser: Callable[..., T]) -> T:
+        """Like get(), but a re-parse runs in a worker thread, once per key."""
+        key = (parser, _as_tuple(paths))
+        if self._fresh(key) is None:
+            return self._entries[key].value
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            # another task may have reloaded while we waited
+            entry = self._entries.get(key)
+            signature = tuple(_stat(p) for p in key[1])
+            if entry is not None and entry.signature == signature:
+                entry.checked_at = time.monotonic()
+                return entry.value
+            value = await asyncio.to_thread(parser, *key[1])
+            return self._store(key, value, signature)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+
+def _as_tuple(paths: Path | Sequence[Path]) -> Tuple[Path, ...]:
+    if isinstance(paths, Path):
+        return (paths,)
+    return tuple(paths)
+
+
+config_cache = ConfigCache()
@@ -0,0 +1,234 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+from dataclasses import dataclass, field
+from datetime import date, datetime, time, timedelta, timezone
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..models import Account
+from ..money import from_minor
+from .balances import balances_as_of
+from .crypto_prices import price_cache
+from .fx_history import RateIndex, get_rate_index
+from .http import get_http_client
+
+
+logger = logging.getLogger(__name__)
+
+ROOT = Path(__file__).resolve().parents[2]
+OHLC_DIR = ROOT / "data" / "crypto_ohlc"
+MARKET_CHART_URL = "https://api.coingecko.com/api/v3/coins/{id}/market_chart/range"
+# CoinGecko returns hourly points for ranges up to 90 days, daily ones beyond
+CHUNK_DAYS = 90
+# a candle older than this does not price a day: gaps in the files read as "no price"
+MAX_STALE_DAYS = 7
+
+OPEN, HIGH, LOW, CLOSE = range(4)
+
+
+class CryptoPriceStore:
+    """Daily USD OHLC per symbol in `root`, one pair of .npy files per symbol.
+
+    `<SYM>.days.npy` holds sorted day ordinals (int32) and `<SYM>.ohlc.npy` a (4, n)
+    float64 array, so each price column is contiguous. Files are memory-mapped on first
+    use; lookups return the candle of the nearest day on or before the requested one,
+    if it is at most `max_stale_days` older.
+    """
+
+    def __init__(self, root: Path = OHLC_DIR, max_stale_days: int = MAX_STALE_DAYS) -> None:
+        self.root = root
+        self.max_stale_days = max_stale_days
+        self._series: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+
+    def _paths(self, symbol: str) -> Tuple[Path, Path]:
+        return self.root / f"{symbol}.days.npy", self.root / f"{symbol}.ohlc.npy"
+
+    def symbols(self) -> List[str]:
+        return sorted(p.name[: -len(".days.npy")] for p in self.root.glob("*.days.npy"))
+
+    def series(self, symbol: str) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        symbol = symbol.upper()
+        cached = self._series.get(symbol)
+        if cached is None:
+            days_path, ohlc_path = self._paths(symbol)
+            if not days_path.exists():
+                return None
+            cached = (np.load(days_path, mmap_mode="r"), np.load(ohlc_path, mmap_mode="r"))
+            self._series[symbol] = cached
+        return cached
+
+    def write(self, symbol: str, days: np.ndarray, ohlc: np.ndarray) -> int:
+        """Merge candles into the symbol's files (new ones win on the same day); return the total count."""
+        symbol = symbol.upper()
+        days = np.asarray(days, dtype=np.int32)
+        ohlc = np.asarray(ohlc, dtype=np.float64).reshape(4, len(days))
+        current = self.series(symbol)
+        if current is not None:
+            keep = ~np.isin(current[0], days)
+            days = np.concatenate([np.asarray(current[0][keep]), days])
+            ohlc = np.concatenate([np.asarray(current[1][:, keep]), ohlc], axis=1)
+        order = np.argsort(days, kind="stable")
+        days, ohlc = days[order], np.ascontiguousarray(ohlc[:, order])
+        self._series.pop(symbol, None)
+        self.root.mkdir(parents=True, exist_ok=True)
+        for path, arr in zip(self._paths(symbol), (days, ohlc)):
+            tmp = path.with_name(path.name + ".tmp")
+            with open(tmp, "wb") as f:
+                np.save(f, arr)
+            tmp.replace(path)
+        return len(days)
+
+    def close_usd(self, symbol: str, days: np.ndarray | Sequence[int]) -> np.ndarray:
+        """Close price for each day ordinal; NaN without a candle in the last `max_stale_days` or for unknown symbols."""
+        days = np.asarray(days, dtype=np.int64)
+        series = self.series(symbol)
+        if series is None or len(series[0]) == 0:
+            return np.full(len(days), np.nan)
+        series_days, ohlc = series
+        pos = np.searchsorted(series_days, days, side="right") - 1
+        at = np.clip(pos, 0, None)
+        fresh = (pos >= 0) & (days - series_days[at] <= self.max_stale_days)
+        return np.where(fresh, ohlc[CLOSE][at], np.nan)
+
+    def close_on(self, symbol: str, day: date) -> Optional[float]:
+        value = float(self.close_usd(symbol, [day.toordinal()])[0])
+        return None if np.isnan(value) else value
+
+
+crypto_store = CryptoPriceStore()
+
+
+def daily_ohlc(points: Iterable[Sequence[float]]) -> Tuple[np.ndarray, np.ndarray]:
+    """Daily candles (UTC days) from [timestamp_ms, price] points."""
+    arr = np.asarray(list(points), dtype=np.float64).reshape(-1, 2)
+    if not len(arr):
+        return np.empty(0, dtype=np.int32), np.empty((4, 0))
+    arr = arr[np.argsort(arr[:, 0], kind="stable")]
+    # 719163 = date(1970, 1, 1).toordinal()
+    day = (arr[:, 0] // 86_400_000).astype(np.int64) + 719163
+    days, first = np.unique(day, return_index=True)
+    last = np.r_[first[1:], len(day)] - 1
+    prices = arr[:, 1]
+    ohlc = np.vstack([prices[first], np.maximum.reduceat(prices, first), np.minimum.reduceat(prices, first), prices[last]])
+    return days.astype(np.int32), ohlc
+
+
+async def _fetch_range(coin_id: str, start: date, end: date) -> List[List[float]]:
+    points: List[List[float]] = []
+    chunk_start = start
+    while chunk_start <= end:
+        chunk_end = min(end, chunk_start + timedelta(days=CHUNK_DAYS - 1))
+        r = await get_http_client().get(
+            MARKET_CHART_URL.format(id=coin_id),
+            params={
+                "vs_currency": "usd",
+                "from": int(datetime.combine(chunk_start, time.min, timezone.utc).timestamp()),
+                "to": int(datetime.combine(chunk_end + timedelta(days=1), time.min, timezone.utc).timestamp()) - 1,
+            },
+        )
+        r.raise_for_status()
+        points.extend(r.json().get("prices") or [])
+        chunk_start = chunk_end + timedelta(days=1)
+    return points
+
+
+def load_fixture(path: Path) -> Dict[str, Tuple[np.ndarray, np.ndarray]]:
+    """Candles from JSON shaped like {"BTC": [["2025-01-15", open, high, low, close], ...], ...}."""
+    data = json.loads(path.read_text(encoding="utf-8"))
+    out = {}
+    for symbol, rows in data.items():
+        days = np.array([date.fromisoformat(r[0]).toordinal() for r in rows], dtype=np.int32)
+        ohlc = np.array([r[1:5] for r in rows], dtype=np.float64).reshape(-1, 4).T
+        out[symbol.upper()] = (days, ohlc)
+    return out
+
+
+@dataclass
+class CryptoBackfillReport:
+    candles: Dict[str, int] = field(default_factory=dict)  # symbol -> candles written
+    failed: Dict[str, str] = field(default_factory=dict)  # symbol -> error
+
+
+async def backfill_crypto_prices(
+    symbols: Iterable[str],
+    start: date,
+    end: date,
+    store: CryptoPriceStore = crypto_store,
+    fixture: Optional[Path] = None,
+    concurrency: int = 2,
+) -> CryptoBackfillReport:
+    """Load daily candles for [start, end] from CoinGecko (or a fixture) into `store`."""
+    report = CryptoBackfillReport()
+    symbols = sorted({s.upper() for s in symbols})
+    if fixture is not None:
+        candles = load_fixture(fixture)
+        for sym in symbols:
+            if sym not in candles:
+                report.failed[sym] = "not in fixture"
+                continue
+            days, ohlc = candles[sym]
+            mask = (days >= start.toordinal()) & (days <= end.toordinal())
+            store.write(sym, days[mask], ohlc[:, mask])
+            report.candles[sym] = int(mask.sum())
+        return report
+
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one(sym: str) -> None:
+        coin_id = price_cache.coin_id(sym)
+        if coin_id is None:
+            report.failed[sym] = "unknown CoinGecko id"
+            return
+        async with sem:
+            try:
+                points = await _fetch_range(coin_id, start, end)
+            except Exception as e:
+                report.failed[sym] = str(e)
+                return
+        days, ohlc = daily_ohlc(points)
+        store.write(sym, days, ohlc)
+        report.candles[sym] = len(days)
+
+    await asyncio.gather(*(one(s) for s in symbols))
+    return report
+
+
+async def value_crypto_accounts(
+    session: AsyncSession,
+    user_id: int,
+    day: date,
+    quote: str = "RUB",
+    store: CryptoPriceStore = crypto_store,
+    rates: Optional[RateIndex] = None,
+) -> Dict[int, Optional[float]]:
+    """{account_id: value in `quote`} of a user's crypto accounts at the close of `day`, offline.
+
+    Ledger accounts use their balance as of that day; external ones (imported holdings)
+    only have a current snapshot, which is valued at the past price. None where no
+    price or rate is stored for the day.
+    """
+    if rates is None:
+        rates = await get_rate_index(session)
+    accounts = (
+        await session.execute(select(Account).where(Account.user_id == user_id, Account.type == "crypto"))
+    ).scalars().all()
+    ledger = await balances_as_of(
+        session, [acc.id for acc in accounts if not acc.is_external_balance], datetime.combine(day, time.max)
+    )
+    ordinal = [day.toordinal()]
+    out: Dict[int, Optional[float]] = {}
+    for acc in accounts:
+        if acc.is_external_balance:
+            qty = acc.external_balance
+        else:
+            qty = from_minor(ledger[acc.id], acc.currency)
+        value = float(qty or 0) * store.close_usd(acc.currency, ordinal)[0] * rates.rates_on("USD", quote, ordinal)[0]
+        out[acc.id] = None if np.isnan(value) else round(float(value), 2)
+    return out
@@ -1,31 +1,184 @@
-import httpx
-from typing import Dict, List
-from .fx import get_usd_rub
+from __future__ import annotations
 
-# Minimal mapping; extend as needed
-SYMBOL_TO_CGID = {
+import asyncio
+import json
+import logging
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..models import Account
+from .fx import fx_cache, get_usd_rub
+from .http import get_http_client
+
+
+logger = logging.getLogger(__name__)
+
+ROOT = Path(__file__).resolve().parents[2]
+SYMBOL_MAP_FILE = ROOT / ".cache" / "coingecko_symbols.json"
+COINS_LIST_URL = "https://api.coingecko.com/api/v3/coins/list"
+SIMPLE_PRICE_URL = "https://api.coingecko.com/api/v3/simple/price"
+
+# Tickers are not unique on CoinGecko; these win over the coin list
+PREFERRED_IDS = {
     "BTC": "bitcoin",
     "ETH": "ethereum",
     "USDT": "tether",
+    "USDC": "usd-coin",
     "WBTC": "wrapped-bitcoin",
+    "BNB": "binancecoin",
+    "SOL": "solana",
+    "TON": "the-open-network",
+    "TRX": "tron",
+    "XRP": "ripple",
+    "DOGE": "dogecoin",
 }
+DEFAULT_TTL = 300.0
+# stablecoins barely move; refresh them less often
+SYMBOL_TTL = {"USDT": 3600.0, "USDC": 3600.0, "DAI": 3600.0}
+SYMBOL_MAP_MAX_AGE = timedelta(days=7)
 
 
-async def fetch_prices_usd(symbols: List[str]) -> Dict[str, float]:
-    ids = [SYMBOL_TO_CGID[s] for s in symbols if s in SYMBOL_TO_CGID]
-    if not ids:
-        return {}
-    url = "https://api.coingecko.com/api/v3/simple/price"
-    params = {"ids": ",".join(ids), "vs_currencies": "usd"}
-    async with httpx.AsyncClient(timeout=10.0) as client:
-        r = await client.get(url, params=params)
+def _pick_ids(coins: List[dict]) -> Dict[str, str]:
+    """symbol -> id from /coins/list; for shared tickers prefer the coin whose id is its name."""
+    by_symbol: Dict[str, List[dict]] = {}
+    for coin in coins:
+        sym = str(coin.get("symbol") or "").upper()
+        if sym and coin.get("id"):
+            by_symbol.setdefault(sym, []).append(coin)
+    out: Dict[str, str] = {}
+    for sym, candidates in by_symbol.items():
+        named = [c for c in candidates if c["id"] == str(c.get("name") or "").lower().replace(" ", "-")]
+        out[sym] = min(named or candidates, key=lambda c: len(c["id"]))["id"]
+    out.update(PREFERRED_IDS)
+    return out
+
+
+class CryptoPriceCache:
+    """USD prices per symbol kept in memory.
+
+    Readers (`cached_usd`) never wait on the network: they get whatever is cached and
+    expired or unknown symbols are refreshed in the background. `refresh` fetches every
+    due symbol in one request per `chunk_size` ids. The symbol -> CoinGecko id map is
+    built from /coins/list and persisted to SYMBOL_MAP_FILE.
+    """
+
+    def __init__(self, chunk_size: int = 200, symbol_map_file: Path = SYMBOL_MAP_FILE) -> None:
+        self.chunk_size = chunk_size
+        self.symbol_map_file = symbol_map_file
+        self._prices: Dict[str, Tuple[float, float]] = {}  # symbol -> (usd, fetched_at)
+        self._ids: Dict[str, str] = dict(PREFERRED_IDS)
+        self._ids_loaded_at: Optional[datetime] = None
+        self._lock = asyncio.Lock()
+        self._background: Optional[asyncio.Task] = None
+        self._load_symbol_map()
+
+    @staticmethod
+    def ttl_for(symbol: str) -> float:
+        return SYMBOL_TTL.get(symbol, DEFAULT_TTL)
+
+    def _load_symbol_map(self) -> None:
+        try:
+            data = json.loads(self.symbol_map_file.read_text(encoding="utf-8"))
+            self._ids = {**data["symbols"], **PREFERRED_IDS}
+            self._ids_loaded_at = datetime.fromisoformat(data["fetched_at"])
+        except FileNotFoundError:
+            pass
+        except Exception:
+            logger.warning("Unreadable CoinGecko symbol map %s, using built-in ids", self.symbol_map_file)
+
+    def coin_id(self, symbol: str) -> Optional[str]:
+        return self._ids.get(symbol.upper())
+
+    async def refresh_symbol_map(self, force: bool = False) -> None:
+        """Re-download /coins/list when the persisted map is missing or older than a week."""
+        if not force and self._ids_loaded_at is not None and datetime.utcnow() - self._ids_loaded_at < SYMBOL_MAP_MAX_AGE:
+            return
+        r = await get_http_client().get(COINS_LIST_URL)
+        r.raise_for_status()
+        ids = _pick_ids(r.json())
+        fetched_at = datetime.utcnow()
+        self.symbol_map_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.symbol_map_file.with_suffix(".tmp")
+        tmp.write_text(json.dumps({"fetched_at": fetched_at.isoformat(), "symbols": ids}), encoding="utf-8")
+        tmp.replace(self.symbol_map_file)
+        self._ids, self._ids_loaded_at = ids, fetched_at
+
+    def due(self, symbols: Iterable[str], ahead: float = 0.0) -> List[str]:
+        """Symbols whose price is missing or expires within `ahead` seconds."""
+        now = time.monotonic()
+        out = []
+        for sym in symbols:
+            cached = self._prices.get(sym)
+            if cached is None or now - cached[1] >= self.ttl_for(sym) - ahead:
+                out.append(sym)
+        return out
+
+    async def refresh(self, symbols: Iterable[str], ahead: float = 0.0) -> None:
+        async with self._lock:
+            # another refresh may have covered these while we waited for the lock
+            ids: Dict[str, List[str]] = {}
+            for sym in self.due({s.upper() for s in symbols}, ahead):
+                cg = self._ids.get(sym)
+                if cg is not None:
+                    ids.setdefault(cg, []).append(sym)
+            if not ids:
+                return
+            chunks = [list(ids)[i:i + self.chunk_size] for i in range(0, len(ids), self.chunk_size)]
+            results = await asyncio.gather(*(self._fetch(chunk) for chunk in chunks), return_exceptions=True)
+            now = time.monotonic()
+            for result in results:
+                if isinstance(result, BaseException):
+                    logger.warning("CoinGecko price request failed: %s", result)
+                    continue
+                for cg, usd in result.items():
+                    for sym in ids.get(cg, ()):
+                        self._prices[sym] = (usd, now)
+
+    async def _fetch(self, ids: List[str]) -> Dict[str, float]:
+        r = await get_http_client().get(SIMPLE_PRICE_URL, params={"ids": ",".join(ids), "vs_currencies": "usd"})
         r.raise_for_status()
         data = r.json()
-    out: Dict[str, float] = {}
-    for sym, cg in SYMBOL_TO_CGID.items():
-        if cg in data and "usd" in data[cg]:
-            out[sym] = float(data[cg]["usd"])
-    return out
+        return {cg: float(data[cg]["usd"]) for cg in ids if "usd" in data.get(cg, {})}
+
+    def cached_usd(self, symbols: Iterable[str]) -> Dict[str, float]:
+        """Cached prices of any age; schedules a background refresh for due symbols."""
+        symbols = [s.upper() for s in symbols]
+        if self.due(symbols) and (self._background is None or self._background.done()):
+            self._background = asyncio.create_task(self.refresh(symbols))
+        return self.snapshot(symbols)
+
+    def snapshot(self, symbols: Iterable[str]) -> Dict[str, float]:
+        """Cached USD prices of any age, without scheduling a refresh."""
+        return {s: self._prices[s][0] for s in (sym.upper() for sym in symbols) if s in self._prices}
+
+    def cached_rub(self, symbols: Iterable[str]) -> Dict[str, float]:
+        prices = self.cached_usd(symbols)
+        usd_rub = fx_cache.peek("USD")
+        if usd_rub is None:
+            return {}
+        return {s: p * usd_rub for s, p in prices.items()}
+
+
+price_cache = CryptoPriceCache()
+
+
+async def held_symbols(session: AsyncSession) -> List[str]:
+    """Currencies of every crypto account, whoever holds it."""
+    rows = await session.execute(
+        select(func.upper(Account.currency)).where(Account.type == "crypto").distinct()
+    )
+    return sorted(rows.scalars())
+
+
+async def fetch_prices_usd(symbols: List[str]) -> Dict[str, float]:
+    """Prices after refreshing whatever is due (waits on the network)."""
+    await price_cache.refresh(symbols)
+    return price_cache.snapshot(symbols)
 
 
 async def fetch_prices_rub(symbols: List[str]) -> Dict[str, float]:
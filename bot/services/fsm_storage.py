@@ -0,0 +1,151 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from ..db import _engine, dialect_insert
+from ..models import FsmState
+
+
+@dataclass
+class _Record:
+    state: Optional[str] = None
+    data: Dict[str, Any] = field(default_factory=dict)
+    updated_at: datetime = field(default_factory=datetime.utcnow)
+
+
+def _key(key: StorageKey) -> str:
+    thread = "" if key.thread_id is None else key.thread_id
+    return f"{key.bot_id}:{key.chat_id}:{key.user_id}:{thread}:{key.destiny}"
+
+
+class DbStorage(BaseStorage):
+    """FSM storage persisted in the bot database (`fsm_states`) behind a write-back cache.
+
+    Reads are served from memory after the first load. Writes only mark the record
+    dirty; `flush()` (called once per update by FsmFlushMiddleware) writes all dirty
+    records with a single upsert. Records untouched for `ttl` count as empty and are
+    purged from memory and the table every `sweep_interval` seconds. Memory holds at
+    most `maxsize` records; clean ones are evicted LRU first.
+    """
+
+    def __init__(
+        self,
+        engine: AsyncEngine = _engine,
+        maxsize: int = 10_000,
+        ttl: timedelta = timedelta(days=1),
+        sweep_interval: float = 600.0,
+    ) -> None:
+        self.engine = engine
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.sweep_interval = sweep_interval
+        self._records: OrderedDict[str, _Record] = OrderedDict()
+        self._dirty: set[str] = set()
+        self._flush_lock = asyncio.Lock()
+        self._last_sweep = time.monotonic()
+
+    async def _get(self, key: StorageKey) -> tuple[str, _Record]:
+        k = _key(key)
+        rec = self._records.get(k)
+        if rec is None:
+            async with self.engine.connect() as conn:
+                row = (
+                    await conn.execute(select(FsmState.state, FsmState.data, FsmState.updated_at).where(FsmState.key == k))
+                ).first()
+            rec = _Record(row.state, dict(row.data or {}), row.updated_at) if row is not None else _Record()
+            self._records[k] = rec
+            self._trim()
+        else:
+            self._records.move_to_end(k)
+        if (rec.state is not None or rec.data) and rec.updated_at < datetime.utcnow() - self.ttl:
+            # abandoned wizard: start over, the row goes on the next flush
+            rec.state, rec.data = None, {}
+            self._touch(k, rec)
+        return k, rec
+
+    def _touch(self, k: str, rec: _Record) -> None:
+        rec.updated_at = datetime.utcnow()
+        self._dirty.add(k)
+
+    def _trim(self) -> None:
+        if len(self._records) <= self.maxsize:
+            return
+        for k in [k for k in self._records if k not in self._dirty][: len(self._records) - self.maxsize]:
+            del self._records[k]
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        k, rec = await self._get(key)
+        rec.state = state.state if isinstance(state, State) else state
+        self._touch(k, rec)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        _, rec = await self._get(key)
+        return rec.state
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        k, rec = await self._get(key)
+        rec.data = data.copy()
+        self._touch(k, rec)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        _, rec = await self._get(key)
+        return rec.data.copy()
+
+    async def flush(self) -> None:
+        async with self._flush_lock:
+            if self._dirty:
+                await self._write(self._dirty)
+            if time.monotonic() - self._last_sweep >= self.sweep_interval:
+                await self.sweep()
+
+    async def _write(self, keys: set[str]) -> None:
+        self._dirty = set()
+        upserts, deletes = [], []
+        for k in keys:
+            rec = self._records.get(k)
+            if rec is None or (rec.state is None and not rec.data):
+                deletes.append(k)
+            else:
+                upserts.append({"key": k, "state": rec.state, "data": rec.data, "updated_at": rec.updated_at})
+        try:
+            async with self.engine.begin() as conn:
+                if upserts:
+                    stmt = dialect_insert(self.engine.dialect.name)(FsmState)
+                    stmt = stmt.on_conflict_do_update(
+                        index_elements=[FsmState.key],
+                        set_={
+                            "state": stmt.excluded.state,
+                            "data": stmt.excluded.data,
+                            "updated_at": stmt.excluded.updated_at,
+                        },
+                    )
+                    await conn.execute(stmt, upserts)
+                if deletes:
+                    await conn.execute(delete(FsmState).where(FsmState.key.in_(deletes)))
+        except Exception:
+            self._dirty |= keys
+            raise
+
+    async def sweep(self) -> int:
+        """Drop records older than `ttl` from memory and the table; return rows deleted."""
+        self._last_sweep = time.monotonic()
+        cutoff = datetime.utcnow() - self.ttl
+        for k in [k for k, rec in self._records.items() if rec.updated_at < cutoff and k not in self._dirty]:
+            del self._records[k]
+        async with self.engine.begin() as conn:
+            result = await conn.execute(delete(FsmState).where(FsmState.updated_at < cutoff))
+        return result.rowcount
+
+    async def close(self) -> None:
+        await self.flush()
+
@@ -1,22 +1,90 @@
-import httpx
-from datetime import datetime, timedelta
+from __future__ import annotations
 
-_cached = {"usd_rub": None, "ts": None}
+import asyncio
+import logging
+import time
+from typing import Dict, Optional
 
+from .http import get_http_client
 
-async def get_usd_rub() -> float:
-    global _cached
-    now = datetime.utcnow()
-    if _cached["usd_rub"] and _cached["ts"] and now - _cached["ts"] < timedelta(minutes=30):
-        return _cached["usd_rub"]
-    url = "https://www.cbr-xml-daily.ru/daily_json.js"
-    async with httpx.AsyncClient(timeout=10.0) as client:
-        r = await client.get(url)
+
+logger = logging.getLogger(__name__)
+
+CBR_DAILY_URL = "https://www.cbr-xml-daily.ru/daily_json.js"
+
+
+class FxCache:
+    """RUB rates of every currency in the CBR daily payload.
+
+    Fresh rates (younger than `ttl`) are served from memory. Stale ones are served
+    immediately while a background refresh runs; callers only wait when there is no
+    rate at all or it is older than `max_stale`. Concurrent refreshes are coalesced
+    into one request.
+    """
+
+    def __init__(self, ttl: float = 30 * 60, max_stale: float = 3 * 24 * 3600, url: str = CBR_DAILY_URL) -> None:
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self.url = url
+        self._rates: Dict[str, float] = {}  # RUB per 1 unit
+        self._fetched_at: Optional[float] = None
+        self._inflight: Optional[asyncio.Task] = None
+
+    async def _fetch(self) -> Dict[str, float]:
+        r = await get_http_client().get(self.url)
         r.raise_for_status()
-        data = r.json()
-        usd = data.get("Valute", {}).get("USD", {}).get("Value")
-        if not usd:
+        valute = r.json().get("Valute", {})
+        rates = {"RUB": 1.0}
+        for code, item in valute.items():
+            try:
+                rates[code.upper()] = float(item["Value"]) / float(item.get("Nominal") or 1)
+            except (KeyError, TypeError, ValueError):
+                continue
+        if "USD" not in rates:
             raise RuntimeError("USD rate not found")
-        _cached["usd_rub"] = float(usd)
-        _cached["ts"] = now
-        return _cached["usd_rub"]
+        self._rates = rates
+        self._fetched_at = time.monotonic()
+        return rates
+
+    def _refresh(self) -> asyncio.Task:
+        if self._inflight is None or self._inflight.done():
+            self._inflight = asyncio.create_task(self._fetch())
+            self._inflight.add_done_callback(self._log_failure)
+        return self._inflight
+
+    @staticmethod
+    def _log_failure(task: asyncio.Task) -> None:
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning("FX refresh failed: %s", task.exception())
+
+    async def rates(self) -> Dict[str, float]:
+        age = None if self._fetched_at is None else time.monotonic() - self._fetched_at
+        if age is not None and age < self.ttl:
+            return self._rates
+        if age is not None and age < self.max_stale:
+            self._refresh()
+            return self._rates
+        # shield: a cancelled waiter must not cancel the refresh other waiters share
+        return await asyncio.shield(self._refresh())
+
+    def peek(self, currency: str) -> Optional[float]:
+        """Cached rate of any age without waiting; starts a refresh when it is missing or stale."""
+        age = None if self._fetched_at is None else time.monotonic() - self._fetched_at
+        if age is None or age >= self.ttl:
+            self._refresh()
+        return self._rates.get(currency.upper())
+
+    async def rate(self, currency: str) -> float:
+        """RUB per 1 unit of `currency`."""
+        code = currency.upper()
+        rates = await self.rates()
+        if code not in rates:
+            raise RuntimeError(f"{code} rate not found")
+        return rates[code]
+
+
+fx_cache = FxCache()
+
+
+async def get_usd_rub() -> float:
+    return await fx_cache.rate("USD")
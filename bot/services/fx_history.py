@@ -0,0 +1,237 @@
+from __future__ import annotations
+
+import asyncio
+import json
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import httpx
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..db import dialect_insert
+from ..models import CurrencyRate
+from ..money import scale_for
+from .http import get_http_client
+
+
+CBR_ARCHIVE_URL = "https://www.cbr-xml-daily.ru/archive/{day:%Y/%m/%d}/daily_json.js"
+PIVOT = "RUB"
+# when several sources have a rate for the same pair and date, the first one wins
+SOURCE_PRIORITY = ("Manual", "CBR", "ECB", "Binance")
+
+DayRates = Dict[str, float]  # currency -> RUB per 1 unit
+
+
+def parse_cbr_daily(payload: dict) -> Tuple[date, DayRates]:
+    day = date.fromisoformat(str(payload["Date"])[:10])
+    rates: DayRates = {}
+    for code, item in (payload.get("Valute") or {}).items():
+        try:
+            rates[code.upper()] = float(item["Value"]) / float(item.get("Nominal") or 1)
+        except (KeyError, TypeError, ValueError):
+            continue
+    return day, rates
+
+
+async def fetch_cbr_day(day: date) -> Optional[Tuple[date, DayRates]]:
+    """CBR rates published for `day`; None for days without a publication (weekends, holidays)."""
+    r = await get_http_client().get(CBR_ARCHIVE_URL.format(day=day))
+    if r.status_code == httpx.codes.NOT_FOUND:
+        return None
+    r.raise_for_status()
+    return parse_cbr_daily(r.json())
+
+
+def load_fixture(path: Path) -> Dict[date, DayRates]:
+    """Rates from a JSON file shaped like {"2025-01-15": {"USD": 101.68, ...}, ...}."""
+    data = json.loads(path.read_text(encoding="utf-8"))
+    return {date.fromisoformat(d): {c.upper(): float(v) for c, v in rates.items()} for d, rates in data.items()}
+
+
+@dataclass
+class BackfillReport:
+    days: int = 0  # days with a publication
+    rows: int = 0
+    missing: List[date] = field(default_factory=list)
+    failed: Dict[date, str] = field(default_factory=dict)  # day -> error; retried by the next run
+
+
+async def _fetch_range(
+    start: date, end: date, concurrency: int
+) -> Tuple[Dict[date, DayRates], List[date], Dict[date, str]]:
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one(day: date):
+        async with sem:
+            return day, await fetch_cbr_day(day)
+
+    by_day: Dict[date, DayRates] = {}
+    missing: List[date] = []
+    failed: Dict[date, str] = {}
+    days = [start + timedelta(days=i) for i in range((end - start).days + 1)]
+    # one failed day must not discard the ones already fetched
+    for day, res in zip(days, await asyncio.gather(*(one(d) for d in days), return_exceptions=True)):
+        if isinstance(res, BaseException):
+            failed[day] = str(res) or type(res).__name__
+        elif res[1] is None:
+            missing.append(day)
+        else:
+            by_day[res[1][0]] = res[1][1]
+    return by_day, missing, failed
+
+
+async def backfill_cbr_rates(
+    session: AsyncSession,
+    start: date,
+    end: date,
+    fixture: Optional[Path] = None,
+    concurrency: int = 8,
+    chunk_size: int = 1000,
+) -> BackfillReport:
+    """Upsert CBR rates (base=currency, quote=RUB) for [start, end] from the archive or a fixture file."""
+    if fixture is not None:
+        by_day = {d: r for d, r in load_fixture(fixture).items() if start <= d <= end}
+        missing: List[date] = []
+        failed: Dict[date, str] = {}
+    else:
+        by_day, missing, failed = await _fetch_range(start, end, concurrency)
+
+    now = datetime.utcnow()
+    rows = [
+        {"date": d, "base": code, "quote": PIVOT, "rate": Decimal(str(round(rate, 8))), "source": "CBR", "created_at": now}
+        for d, rates in sorted(by_day.items())
+        for code, rate in sorted(rates.items())
+        if code != PIVOT
+    ]
+    insert = dialect_insert(session.bind.dialect.name)
+    for i in range(0, len(rows), chunk_size):
+        stmt = insert(CurrencyRate)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[CurrencyRate.date, CurrencyRate.base, CurrencyRate.quote, CurrencyRate.source],
+            set_={"rate": stmt.excluded.rate, "created_at": stmt.excluded.created_at},
+        )
+        await session.execute(stmt, rows[i:i + chunk_size])
+    invalidate_rate_index()
+    return BackfillReport(days=len(by_day), rows=len(rows), missing=missing, failed=failed)
+
+
+class RateIndex:
+    """Sorted per-pair rate history for as-of lookups.
+
+    Each (base, quote) pair keeps parallel arrays of day ordinals and rates; a lookup
+    is a binary search returning the rate of the nearest date on or before the
+    requested one. Pairs without a direct series are derived from the inverse pair or
+    crossed through RUB.
+    """
+
+    def __init__(self, rows: Iterable[Tuple[str, str, date, float, str]]) -> None:
+        priority = {s: i for i, s in enumerate(SOURCE_PRIORITY)}
+        best: Dict[Tuple[str, str], Dict[int, Tuple[int, float]]] = {}
+        for base, quote, day, rate, source in rows:
+            series = best.setdefault((base.upper(), quote.upper()), {})
+            rank = priority.get(source, len(priority))
+            ordinal = day.toordinal()
+            if ordinal not in series or rank < series[ordinal][0]:
+                series[ordinal] = (rank, float(rate))
+        self._pairs: Dict[Tuple[str, str], Tuple[np.ndarray, np.ndarray]] = {}
+        for pair, series in best.items():
+            days = np.array(sorted(series), dtype=np.int64)
+            self._pairs[pair] = (days, np.array([series[d][1] for d in days.tolist()], dtype=np.float64))
+
+    def __len__(self) -> int:
+        return sum(len(days) for days, _ in self._pairs.values())
+
+    def _series(self, base: str, quote: str, days: np.ndarray) -> Optional[np.ndarray]:
+        pair = self._pairs.get((base, quote))
+        if pair is None:
+            return None
+        series_days, rates = pair
+        pos = np.searchsorted(series_days, days, side="right") - 1
+        out = rates[np.clip(pos, 0, None)]
+        return np.where(pos >= 0, out, np.nan)
+
+    def _direct(self, base: str, quote: str, days: np.ndarray) -> Optional[np.ndarray]:
+        if base == quote:
+            return np.ones(len(days), dtype=np.float64)
+        out = self._series(base, quote, days)
+        if out is None:
+            inverse = self._series(quote, base, days)
+            if inverse is not None:
+                out = 1.0 / inverse
+        return out
+
+    def rates_on(self, base: str, quote: str, days: np.ndarray | Sequence[int]) -> np.ndarray:
+        """`quote` per 1 `base` for each day ordinal; NaN where no prior rate exists."""
+        base, quote = base.upper(), quote.upper()
+        days = np.asarray(days, dtype=np.int64)
+        out = self._direct(base, quote, days)
+        if out is None and PIVOT not in (base, quote):
+            to_pivot = self._direct(base, PIVOT, days)
+            from_pivot = self._direct(PIVOT, quote, days)
+            if to_pivot is not None and from_pivot is not None:
+                out = to_pivot * from_pivot
+        return out if out is not None else np.full(len(days), np.nan)
+
+    def rate_on(self, base: str, quote: str, day: date) -> Optional[float]:
+        value = float(self.rates_on(base, quote, [day.toordinal()])[0])
+        return None if np.isnan(value) else value
+
+    def _convert(self, amounts: np.ndarray, codes: List[str], inverse: np.ndarray, days: np.ndarray, to: str) -> np.ndarray:
+        out = np.empty(len(amounts), dtype=np.float64)
+        for i, code in enumerate(codes):
+            mask = inverse == i
+            out[mask] = amounts[mask] * self.rates_on(code, to, days[mask])
+        return out
+
+    def convert(
+        self, amounts: np.ndarray, currencies: np.ndarray | Sequence[str], days: np.ndarray | Sequence[int], to: str
+    ) -> np.ndarray:
+        """Convert major-unit amounts to `to` at each row's date; one pass per distinct currency."""
+        codes, inverse = _factorize(currencies)
+        return self._convert(np.asarray(amounts, dtype=np.float64), codes, inverse, np.asarray(days, dtype=np.int64), to)
+
+    def convert_minor(
+        self, amounts_minor: np.ndarray, currencies: np.ndarray | Sequence[str], days: np.ndarray | Sequence[int], to: str
+    ) -> np.ndarray:
+        """Like `convert` for minor-unit amounts (see money.scale_for); returns major units of `to`."""
+        codes, inverse = _factorize(currencies)
+        scale = np.array([10.0 ** -scale_for(c) for c in codes], dtype=np.float64)[inverse]
+        amounts = np.asarray(amounts_minor, dtype=np.float64) * scale
+        return self._convert(amounts, codes, inverse, np.asarray(days, dtype=np.int64), to)
+
+
+def _factorize(currencies: Iterable[Optional[str]]) -> Tuple[List[str], np.ndarray]:
+    """Distinct upper-cased codes and each row's position in them (None counts as RUB)."""
+    positions: Dict[Optional[str], int] = {}
+    raw = np.fromiter((positions.setdefault(c, len(positions)) for c in currencies), dtype=np.int64)
+    codes: Dict[str, int] = {}
+    remap = np.array([codes.setdefault((c or PIVOT).upper(), len(codes)) for c in positions], dtype=np.int64)
+    return list(codes), remap[raw] if len(raw) else raw
+
+
+async def load_rate_index(session: AsyncSession) -> RateIndex:
+    rows = await session.execute(
+        select(CurrencyRate.base, CurrencyRate.quote, CurrencyRate.date, CurrencyRate.rate, CurrencyRate.source)
+    )
+    return RateIndex(rows.tuples())
+
+
+_index: Optional[RateIndex] = None
+
+
+async def get_rate_index(session: AsyncSession) -> RateIndex:
+    """Process-wide index, loaded once and rebuilt after a backfill."""
+    global _index
+    if _index is None:
+        _index = await load_rate_index(session)
+    return _index
+
+
+def invalidate_rate_index() -> None:
+    global _index
+    _index = None
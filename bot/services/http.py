@@ -0,0 +1,32 @@
+from __future__ import annotations
+
+from typing import Optional
+
+import httpx
+
+
+_client: Optional[httpx.AsyncClient] = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Process-wide pooled client (HTTP/2, keep-alive); created on first use.
+
+    The bot opens it in on_startup and closes it in on_shutdown; tools that never call
+    `close_http_client` just drop the connections when their event loop ends.
+    """
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            http2=True,
+            timeout=httpx.Timeout(10.0, connect=5.0),
+            limits=httpx.Limits(max_connections=20, max_keepalive_connections=10, keepalive_expiry=60.0),
+            headers={"User-Agent": "finance-bot"},
+        )
+    return _client
+
+
+async def close_http_client() -> None:
+    global _client
+    if _client is not None:
+        client, _client = _client, None
+        await client.aclose()
@@ -0,0 +1,121 @@
+from __future__ import annotations
+
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from ..models import Account, User
+
+
+@dataclass
+class CachedIdentity:
+    user: User
+    accounts: Optional[list[Account]] = None  # loaded lazily
+    loaded_at: float = field(default_factory=time.monotonic)
+
+
+class IdentityCache:
+    """Bounded LRU of telegram_id -> (User, accounts), detached from any session.
+
+    Entries are dropped on commit of any change to the user or their accounts (see the
+    session events below); the TTL only covers writes from other processes (tools/).
+    """
+
+    def __init__(self, maxsize: int = 2048, ttl: float = 300.0) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._items: OrderedDict[int, CachedIdentity] = OrderedDict()
+        self._tg_by_user_id: Dict[int, int] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, telegram_id: int) -> Optional[CachedIdentity]:
+        item = self._items.get(telegram_id)
+        if item is not None and time.monotonic() - item.loaded_at > self.ttl:
+            self.invalidate(telegram_id)
+            item = None
+        if item is None:
+            self.misses += 1
+            return None
+        self._items.move_to_end(telegram_id)
+        self.hits += 1
+        return item
+
+    def put(self, user: User) -> CachedIdentity:
+        item = CachedIdentity(user=user)
+        self._items[user.telegram_id] = item
+        self._items.move_to_end(user.telegram_id)
+        self._tg_by_user_id[user.id] = user.telegram_id
+        while len(self._items) > self.maxsize:
+            _, old = self._items.popitem(last=False)
+            self._tg_by_user_id.pop(old.user.id, None)
+            self.evictions += 1
+        return item
+
+    def invalidate(self, telegram_id: int) -> None:
+        item = self._items.pop(telegram_id, None)
+        if item is not None:
+            self._tg_by_user_id.pop(item.user.id, None)
+
+    def invalidate_user_id(self, user_id: int) -> None:
+        telegram_id = self._tg_by_user_id.get(user_id)
+        if telegram_id is not None:
+            self.invalidate(telegram_id)
+
+    def clear(self) -> None:
+        self._items.clear()
+        self._tg_by_user_id.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._items),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+        }
+
+
+identity_cache = IdentityCache()
+
+
+# Invalidate on commit of any session that created/changed/deleted a User or Account,
+# so handlers never see a stale account list after e.g. a sync or a new debt account.
+_INFO_KEY = "identity_cache_dirty"
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_changed_identities(session: Session, flush_context) -> None:
+    dirty = session.info.setdefault(_INFO_KEY, (set(), set()))
+    user_ids, telegram_ids = dirty
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(obj, Account) and obj.user_id is not None:
+            user_ids.add(obj.user_id)
+        elif isinstance(obj, User):
+            if obj.telegram_id is not None:
+                telegram_ids.add(obj.telegram_id)
+            if obj.id is not None:
+                user_ids.add(obj.id)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_changed_identities(session: Session) -> None:
+    dirty = session.info.pop(_INFO_KEY, None)
+    if not dirty:
+        return
+    user_ids, telegram_ids = dirty
+    for user_id in user_ids:
+        identity_cache.invalidate_user_id(user_id)
+    for telegram_id in telegram_ids:
+        identity_cache.invalidate(telegram_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_changed_identities(session: Session) -> None:
+    session.info.pop(_INFO_KEY, None)
@@ -0,0 +1,55 @@
+from __future__ import annotations
+
+from collections import deque
+from typing import Dict, FrozenSet, Iterable, List, Tuple
+
+
+class MerchantAutomaton:
+    """Aho-Corasick automaton over merchant patterns (see `merchants.merchant_key`).
+
+    `find(text)` returns the ids of every pattern occurring in the text
+    in one pass, whatever the number of patterns.
+    """
+
+    def __init__(self, patterns: Iterable[Tuple[str, int]]) -> None:
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[FrozenSet[int]] = [frozenset()]
+        out: List[set[int]] = [set()]
+        for text, pid in patterns:
+            node = 0
+            for ch in text:
+                nxt = self._goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[node][ch] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    out.append(set())
+                node = nxt
+            out[node].add(pid)
+        # breadth-first failure links; outputs are merged along them
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self._goto[node].items():
+                queue.append(nxt)
+                if node:
+                    f = self._fail[node]
+                    while f and ch not in self._goto[f]:
+                        f = self._fail[f]
+                    self._fail[nxt] = self._goto[f].get(ch, 0)
+                out[nxt] |= out[self._fail[nxt]]
+        self._out = [frozenset(o) for o in out]
+
+    def find(self, text: str) -> FrozenSet[int]:
+        found: set[int] = set()
+        node = 0
+        goto, fail, out = self._goto, self._fail, self._out
+        for ch in text:
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            if out[node]:
+                found |= out[node]
+        return frozenset(found)
@@ -0,0 +1,227 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import re
+import weakref
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+import yaml
+from rapidfuzz import fuzz, process
+
+from .config_cache import config_cache
+
+
+logger = logging.getLogger(__name__)
+
+ROOT = Path(__file__).resolve().parents[2]
+MERCHANTS_FILE = ROOT / "config" / "merchants.yaml"
+CACHE_DIR = ROOT / ".cache" / "merchants"
+
+_TRANSLIT = str.maketrans({
+    "а": "a", "б": "b", "в": "v", "г": "g", "д": "d", "е": "e", "ё": "e", "ж": "zh", "з": "z",
+    "и": "i", "й": "y", "к": "k", "л": "l", "м": "m", "н": "n", "о": "o", "п": "p", "р": "r",
+    "с": "s", "т": "t", "у": "u", "ф": "f", "х": "kh", "ц": "ts", "ч": "ch", "ш": "sh", "щ": "shch",
+    "ъ": "", "ы": "y", "ь": "", "э": "e", "ю": "yu", "я": "ya",
+})
+_NON_WORD = re.compile(r"[\W_]+")
+# legal forms and location suffixes banks append to descriptors
+_NOISE = frozenset({
+    "ooo", "oao", "zao", "pao", "ao", "ip", "llc", "ltd", "inc", "gmbh",
+    "g", "moscow", "moskva", "msk", "spb", "sankt", "peterburg", "rus", "russia", "ru",
+})
+
+
+@lru_cache(maxsize=65536)
+def merchant_key(name: str) -> str:
+    """Latin, lowercase form of a merchant name without store numbers and noise words.
+
+    "ООО Пятёрочка №1234" and "PYATEROCHKA 1234 MOSCOW RUS" both give "pyaterochka".
+    """
+    text = _NON_WORD.sub(" ", name.lower().translate(_TRANSLIT))
+    words = [w for w in text.split() if w not in _NOISE and not (w.isdigit() and len(w) > 1)]
+    return " ".join(words)
+
+
+@dataclass(frozen=True)
+class Merchant:
+    name: str
+    category: Optional[str] = None
+    aliases: Tuple[str, ...] = ()
+
+
+class MerchantResolver:
+    """Resolves raw merchant strings to canonical merchants.
+
+    Exact keys are a dict lookup; the rest goes through rapidfuzz over the prebuilt key
+    list once, and the outcome (including "no match") is memoized, so repeat merchants
+    cost one `merchant_key` and one dict hit. The memo is persisted under CACHE_DIR per
+    resolver `name` and discarded when the merchant list changes.
+    """
+
+    def __init__(
+        self,
+        merchants: Iterable[Merchant],
+        name: Optional[str] = None,
+        score_cutoff: float = 85.0,
+        min_fuzzy_length: int = 4,
+        max_entries: int = 100_000,
+    ) -> None:
+        self.merchants = tuple(merchants)
+        self.score_cutoff = score_cutoff
+        self.min_fuzzy_length = min_fuzzy_length
+        self.max_entries = max_entries
+        self._keys: List[str] = []
+        self._owner: List[int] = []
+        self._exact: Dict[str, int] = {}
+        for idx, m in enumerate(self.merchants):
+            for text in (m.name, *m.aliases):
+                key = merchant_key(text)
+                if key and key not in self._exact:
+                    self._exact[key] = idx
+                    self._keys.append(key)
+                    self._owner.append(idx)
+        self._fingerprint = hashlib.sha1(
+            json.dumps([score_cutoff, min_fuzzy_length, sorted((k, self.merchants[i].name) for k, i in self._exact.items())],
+                       ensure_ascii=False).encode()
+        ).hexdigest()
+        self._memo: Dict[str, Optional[int]] = {}
+        self._dirty = False
+        self._path = CACHE_DIR / f"{name}.json" if name else None
+        if self._path is not None:
+            self._load()
+            _resolvers.add(self)
+
+    def _load(self) -> None:
+        try:
+            data = json.loads(self._path.read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            return
+        except Exception:
+            logger.warning("Unreadable merchant cache %s, starting empty", self._path)
+            return
+        if data.get("fingerprint") != self._fingerprint:
+            return
+        by_name = {m.name: idx for idx, m in enumerate(self.merchants)}
+        for key, name in data.get("entries", {}).items():
+            self._memo[key] = None if name is None else by_name.get(name)
+
+    def save(self) -> None:
+        """Write the memo if it changed since the last save."""
+        if self._path is None or not self._dirty:
+            return
+        entries = {k: (None if i is None else self.merchants[i].name) for k, i in self._memo.items()}
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self._path.with_suffix(".tmp")
+        tmp.write_text(json.dumps({"fingerprint": self._fingerprint, "entries": entries}, ensure_ascii=False), encoding="utf-8")
+        tmp.replace(self._path)
+        self._dirty = False
+
+    def _lookup(self, key: str) -> Optional[int]:
+        idx = self._exact.get(key)
+        if idx is not None or len(key) < self.min_fuzzy_length or not self._keys:
+            return idx
+        hit = process.extractOne(key, self._keys, scorer=fuzz.WRatio, processor=None, score_cutoff=self.score_cutoff)
+        return None if hit is None else self._owner[hit[2]]
+
+    def resolve_exact(self, raw: Optional[str]) -> Optional[Merchant]:
+        """Merchant whose name or alias has the same key as `raw`; no fuzzy matching."""
+        idx = self._exact.get(merchant_key(raw)) if raw else None
+        return None if idx is None else self.merchants[idx]
+
+    def resolve(self, raw: Optional[str]) -> Optional[Merchant]:
+        if not raw:
+            return None
+        key = merchant_key(raw)
+        if not key:
+            return None
+        try:
+            idx = self._memo[key]
+        except KeyError:
+            idx = self._lookup(key)
+            if len(self._memo) >= self.max_entries:
+                del self._memo[next(iter(self._memo))]
+            self._memo[key] = idx
+            self._dirty = True
+        return None if idx is None else self.merchants[idx]
+
+
+_resolvers: "weakref.WeakSet[MerchantResolver]" = weakref.WeakSet()
+
+
+def save_merchant_caches() -> None:
+    for resolver in list(_resolvers):
+        try:
+            resolver.save()
+        except OSError:
+            logger.exception("Failed to save merchant cache")
+
+
+def _parse_merchants(file_path: Path) -> Tuple[Merchant, ...]:
+    try:
+        data = yaml.safe_load(file_path.read_text(encoding="utf-8")) or []
+    except FileNotFoundError:
+        return ()
+    merchants = []
+    for item in data:
+        if isinstance(item, str):
+            merchants.append(Merchant(name=item))
+        elif isinstance(item, dict) and item.get("name"):
+            merchants.append(
+                Merchant(
+                    name=str(item["name"]),
+                    category=item.get("category"),
+                    aliases=tuple(str(a) for a in item.get("aliases") or ()),
+                )
+            )
+    return tuple(merchants)
+
+
+def load_merchants() -> Tuple[Merchant, ...]:
+    return config_cache.get(MERCHANTS_FILE, _parse_merchants)
+
+
+_default: Optional[Tuple[Tuple[Merchant, ...], MerchantResolver]] = None
+
+
+def merchant_resolver() -> MerchantResolver:
+    """Resolver over config/merchants.yaml, rebuilt when the file changes."""
+    global _default
+    merchants = load_merchants()
+    if _default is None or _default[0] is not merchants:
+        if _default is not None:
+            _default[1].save()
+        _default = (merchants, MerchantResolver(merchants, name="default"))
+    return _default[1]
+
+
+_by_patterns: Optional[Tuple[Tuple[Tuple[Merchant, ...], FrozenSet[str], str], MerchantResolver]] = None
+
+
+def resolver_for_patterns(patterns: Iterable[str], name: str = "cashback") -> MerchantResolver:
+    """Resolver over the configured merchants plus free-form `patterns` (e.g. rule merchants).
+
+    Patterns already covered by a configured merchant resolve to that merchant. The last
+    resolver is reused while the merchant list and patterns stay the same, keeping its memo.
+    """
+    global _by_patterns
+    configured = load_merchants()
+    slot = (configured, frozenset(patterns), name)
+    if _by_patterns is not None and _by_patterns[0] == slot:
+        return _by_patterns[1]
+    merchants = list(configured)
+    known = {merchant_key(t) for m in merchants for t in (m.name, *m.aliases)}
+    for p in sorted(slot[1]):
+        key = merchant_key(p)
+        if key and key not in known:
+            known.add(key)
+            merchants.append(Merchant(name=p))
+    if _by_patterns is not None:
+        _by_patterns[1].save()
+    resolver = MerchantResolver(merchants, name=name)
+    _by_patterns = (slot, resolver)
+    return resolver
@@ -0,0 +1,285 @@
+from __future__ import annotations
+
+import asyncio
+import heapq
+import logging
+import re
+from datetime import datetime, time, timedelta, timezone
+from time import monotonic
+from typing import Dict, List, Optional, Tuple
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from sqlalchemy import bindparam, select, update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from ..config import get_settings
+from ..db import AsyncSessionLocal
+from ..models import User
+from .broadcast import broadcast
+
+
+logger = logging.getLogger(__name__)
+
+REMINDER_OFF = "off"
+REMINDER_TEXT = "📝 Не забудьте записать сегодняшние расходы и доходы."
+_HHMM = re.compile(r"^([01]?\d|2[0-3]):([0-5]\d)$")
+
+
+def parse_reminder_time(text: str) -> Optional[time]:
+    m = _HHMM.match(text.strip())
+    return time(int(m.group(1)), int(m.group(2))) if m else None
+
+
+def resolve_timezone(name: Optional[str]) -> ZoneInfo:
+    try:
+        return ZoneInfo(name or get_settings().TIMEZONE)
+    except (ZoneInfoNotFoundError, ValueError):
+        return ZoneInfo(get_settings().TIMEZONE)
+
+
+def next_fire(reminder_time: str, tz_name: Optional[str], after: datetime) -> Optional[datetime]:
+    """First local `reminder_time` strictly after `after`, as naive UTC; None when reminders are off."""
+    at = parse_reminder_time(reminder_time or "")
+    if at is None:
+        return None
+    tz = resolve_timezone(tz_name)
+    local_after = after.replace(tzinfo=timezone.utc).astimezone(tz)
+    for days in (0, 1, 2):
+        day = local_after.date() + timedelta(days=days)
+        # nonexistent local times (DST gaps) resolve forward through the UTC round trip
+        candidate = datetime.combine(day, at, tz).astimezone(timezone.utc).replace(tzinfo=None)
+        if candidate > after:
+            return candidate
+    return None
+
+
+class ReminderHeap:
+    """Min-heap of (fire_at, user_id) with lazy deletion.
+
+    Rescheduling pushes a new entry with a bumped version and leaves the old one to be
+    skipped when it surfaces, so every update is O(log n).
+    """
+
+    def __init__(self) -> None:
+        self._heap: List[Tuple[datetime, int, int]] = []
+        self._current: Dict[int, Tuple[int, datetime, int]] = {}  # user_id -> (version, fire_at, chat_id)
+        self._versions: Dict[int, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._current)
+
+    def __contains__(self, user_id: int) -> bool:
+        return user_id in self._current
+
+    def push(self, user_id: int, chat_id: int, fire_at: datetime) -> None:
+        version = self._versions.get(user_id, 0) + 1
+        self._versions[user_id] = version
+        self._current[user_id] = (version, fire_at, chat_id)
+        heapq.heappush(self._heap, (fire_at, user_id, version))
+        if len(self._heap) > 2 * len(self._current) + 1024:
+            self._compact()
+
+    def remove(self, user_id: int) -> None:
+        if self._current.pop(user_id, None) is not None:
+            self._versions[user_id] += 1
+
+    def _drop_stale(self) -> None:
+        while self._heap:
+            fire_at, user_id, version = self._heap[0]
+            cur = self._current.get(user_id)
+            if cur is not None and cur[0] == version:
+                return
+            heapq.heappop(self._heap)
+
+    def _compact(self) -> None:
+        self._heap = [(fire_at, uid, ver) for uid, (ver, fire_at, _) in self._current.items()]
+        heapq.heapify(self._heap)
+
+    def peek(self) -> Optional[datetime]:
+        self._drop_stale()
+        return self._heap[0][0] if self._heap else None
+
+    def pop_due(self, now: datetime) -> List[Tuple[int, int, datetime]]:
+        """(user_id, chat_id, fire_at) of every entry due at `now`, removed from the heap."""
+        due = []
+        while True:
+            self._drop_stale()
+            if not self._heap or self._heap[0][0] > now:
+                return due
+            fire_at, user_id, _ = heapq.heappop(self._heap)
+            _, _, chat_id = self._current.pop(user_id)
+            due.append((user_id, chat_id, fire_at))
+
+
+class ReminderScheduler:
+    """Daily per-user reminders driven by one in-process heap.
+
+    Only users whose `reminder_next_at` falls within the next `horizon` are held in
+    memory; the window is reloaded from the indexed column every `horizon / 2`, so
+    startup does not depend on the number of users. A fired reminder advances
+    `reminder_next_at` by one day in the user's timezone. Reminders missed by more
+    than `grace` (e.g. while the bot was down) are skipped, not sent late.
+    """
+
+    def __init__(
+        self,
+        session_pool: async_sessionmaker[AsyncSession] = AsyncSessionLocal,
+        horizon: timedelta = timedelta(hours=1),
+        grace: timedelta = timedelta(hours=2),
+        fill_batch: int = 1000,
+    ) -> None:
+        self.session_pool = session_pool
+        self.horizon = horizon
+        self.grace = grace
+        self.fill_batch = fill_batch
+        self.heap = ReminderHeap()
+        self._bot = None
+        self._task: Optional[asyncio.Task] = None
+        self._wake = asyncio.Event()
+        self._loaded_until: Optional[datetime] = None
+        self._rescheduled_at: Dict[int, float] = {}
+        self._sends: set[asyncio.Task] = set()
+
+    def start(self, bot) -> None:
+        self._bot = bot
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def reschedule(self, user_id: int, chat_id: Optional[int], fire_at: Optional[datetime]) -> None:
+        """Reflect a changed reminder_next_at (already written by the caller) in the heap."""
+        self._rescheduled_at[user_id] = monotonic()
+        if fire_at is None or chat_id is None or self._loaded_until is None or fire_at >= self._loaded_until:
+            # outside the window: the next window load picks it up from the table
+            self.heap.remove(user_id)
+        else:
+            self.heap.push(user_id, chat_id, fire_at)
+        self._wake.set()
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                now = datetime.utcnow()
+                if self._loaded_until is None or now >= self._loaded_until - self.horizon / 2:
+                    await self._fill_missing(now)
+                    await self._load_window(now)
+                await self._fire_due(datetime.utcnow())
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Reminder scheduler iteration failed")
+                await asyncio.sleep(30)
+            wake_at = self._loaded_until - self.horizon / 2 if self._loaded_until else datetime.utcnow()
+            nxt = self.heap.peek()
+            if nxt is not None:
+                wake_at = min(wake_at, nxt)
+            delay = max(0.0, (wake_at - datetime.utcnow()).total_seconds())
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _fill_missing(self, now: datetime) -> None:
+        """Compute reminder_next_at for users that have none yet (new users, first run after migrating)."""
+        stmt = (
+            update(User.__table__)
+            .where(User.__table__.c.id == bindparam("uid"))
+            .values(reminder_next_at=bindparam("next_at"))
+        )
+        last_id = 0
+        while True:
+            async with self.session_pool() as session:
+                rows = (
+                    await session.execute(
+                        select(User.id, User.reminder_time, User.timezone)
+                        .where(User.reminder_next_at.is_(None), User.reminder_time != REMINDER_OFF, User.id > last_id)
+                        .order_by(User.id)
+                        .limit(self.fill_batch)
+                    )
+                ).all()
+                params = [{"uid": uid, "next_at": next_fire(rt, tz, now)} for uid, rt, tz in rows]
+                params = [p for p in params if p["next_at"] is not None]
+                if params:
+                    await session.execute(stmt, params)
+                    await session.commit()
+            if len(rows) < self.fill_batch:
+                return
+            last_id = rows[-1][0]
+
+    async def _load_window(self, now: datetime) -> None:
+        started = monotonic()
+        until = now + self.horizon
+        async with self.session_pool() as session:
+            rows = (
+                await session.execute(
+                    select(User.id, User.chat_id, User.reminder_next_at).where(
+                        User.reminder_next_at < until, User.chat_id.is_not(None)
+                    )
+                )
+            ).all()
+        for uid, chat_id, fire_at in rows:
+            changed = self._rescheduled_at.get(uid)
+            if changed is not None and changed >= started:
+                continue  # rescheduled while the query ran; the heap already has the newer time
+            if uid not in self.heap:
+                self.heap.push(uid, chat_id, fire_at)
+        self._loaded_until = until
+        self._rescheduled_at = {u: t for u, t in self._rescheduled_at.items() if t >= started}
+
+    async def _fire_due(self, now: datetime) -> None:
+        due = self.heap.pop_due(now)
+        if not due:
+            return
+        async with self.session_pool() as session:
+            settings = {
+                uid: (rt, tz)
+                for uid, rt, tz in (
+                    await session.execute(
+                        select(User.id, User.reminder_time, User.timezone).where(User.id.in_([d[0] for d in due]))
+                    )
+                ).all()
+            }
+            params, chat_ids = [], []
+            for uid, chat_id, fire_at in due:
+                if uid not in settings:
+                    continue
+                if now - fire_at <= self.grace:
+                    chat_ids.append(chat_id)
+                next_at = next_fire(*settings[uid], max(now, fire_at))
+                params.append({"uid": uid, "old": fire_at, "next_at": next_at})
+                if next_at is not None and next_at < self._loaded_until:
+                    self.heap.push(uid, chat_id, next_at)
+            if params:
+                # skip rows whose time was changed meanwhile
+                await session.execute(
+                    update(User.__table__)
+                    .where(User.__table__.c.id == bindparam("uid"), User.__table__.c.reminder_next_at == bindparam("old"))
+                    .values(reminder_next_at=bindparam("next_at")),
+                    params,
+                )
+                await session.commit()
+        if chat_ids and self._bot is not None:
+            task = asyncio.create_task(broadcast(self._bot, chat_ids, REMINDER_TEXT))
+            self._sends.add(task)
+            task.add_done_callback(self._log_sent)
+
+    def _log_sent(self, task: asyncio.Task) -> None:
+        self._sends.discard(task)
+        if task.cancelled():
+            return
+        if task.exception() is not None:
+            logger.error("Reminder broadcast failed: %s", task.exception())
+        else:
+            logger.info("Reminders sent: %s", task.result().as_dict())
+
+
+reminder_scheduler = ReminderScheduler()
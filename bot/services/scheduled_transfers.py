@@ -0,0 +1,179 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+from apscheduler.triggers.cron import CronTrigger
+from sqlalchemy import bindparam, func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from sqlalchemy.orm import aliased
+
+from ..db import AsyncSessionLocal
+from ..models import Account, ScheduledTransfer, Transaction, User
+from ..money import from_minor
+from .balances import post_transactions
+from .broadcast import send_messages
+from .reminders import resolve_timezone
+
+
+logger = logging.getLogger(__name__)
+
+TRANSFER_CATEGORY = "Переводы"
+
+
+@lru_cache(maxsize=1024)
+def _trigger(cron: str, tz_name: Optional[str]) -> CronTrigger:
+    return CronTrigger.from_crontab(cron, timezone=resolve_timezone(tz_name))
+
+
+def next_run(cron: str, tz_name: Optional[str], after: datetime) -> Optional[datetime]:
+    """First fire time of `cron` (in the user's timezone) strictly after naive-UTC `after`, as naive UTC.
+
+    Raises ValueError for an invalid expression; None when it never fires again.
+    """
+    after = after.replace(tzinfo=timezone.utc, microsecond=0) + timedelta(seconds=1)
+    fire = _trigger(cron, tz_name).get_next_fire_time(None, after)
+    return None if fire is None else fire.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+class TransferExecutor:
+    """Runs scheduled transfers when they fall due.
+
+    Between runs it sleeps until the earliest enabled `next_run_at` (one indexed min
+    query) or until `wake()`; `max_idle` bounds the sleep so rows written by other
+    processes are noticed. Due rows are claimed `batch_size` at a time and every
+    batch posts both legs of its transfers and the next run times in one transaction.
+    A schedule missed while the bot was down runs once, not once per missed slot.
+    """
+
+    def __init__(
+        self,
+        session_pool: async_sessionmaker[AsyncSession] = AsyncSessionLocal,
+        batch_size: int = 200,
+        max_idle: timedelta = timedelta(minutes=10),
+    ) -> None:
+        self.session_pool = session_pool
+        self.batch_size = batch_size
+        self.max_idle = max_idle
+        self._bot = None
+        self._task: Optional[asyncio.Task] = None
+        self._wake = asyncio.Event()
+        self._sends: set[asyncio.Task] = set()
+
+    def start(self, bot) -> None:
+        self._bot = bot
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def wake(self) -> None:
+        """Re-read the earliest due time after a schedule was created or changed."""
+        self._wake.set()
+
+    async def _run(self) -> None:
+        while True:
+            # cleared before the queries so a wake() during them is not lost
+            self._wake.clear()
+            next_at = None
+            try:
+                while await self.execute_due(datetime.utcnow()) == self.batch_size:
+                    pass
+                next_at = await self._earliest()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Scheduled transfers iteration failed")
+                await asyncio.sleep(30)
+            delay = self.max_idle.total_seconds()
+            if next_at is not None:
+                delay = min(delay, max(0.0, (next_at - datetime.utcnow()).total_seconds()))
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _earliest(self) -> Optional[datetime]:
+        async with self.session_pool() as session:
+            return await session.scalar(
+                select(func.min(ScheduledTransfer.next_run_at)).where(ScheduledTransfer.enabled.is_(True))
+            )
+
+    async def execute_due(self, now: datetime) -> int:
+        """Run one batch of due transfers; returns the number of rows claimed."""
+        st = ScheduledTransfer.__table__.c
+        src, dst = aliased(Account), aliased(Account)
+        async with self.session_pool() as session:
+            rows = (
+                await session.execute(
+                    select(
+                        st.id, st.user_id, st.from_account_id, st.to_account_id, st.amount, st.currency,
+                        st.cron, st.next_run_at, User.id, User.timezone, User.chat_id,
+                        src.name, src.currency, dst.name, dst.currency,
+                    )
+                    # outer joins: rows whose user or account is gone must still be claimed, or
+                    # they would stay the earliest due time and keep the executor awake
+                    .outerjoin(User, User.id == st.user_id)
+                    .outerjoin(src, src.id == st.from_account_id)
+                    .outerjoin(dst, dst.id == st.to_account_id)
+                    .where(st.enabled.is_(True), st.next_run_at <= now)
+                    .order_by(st.next_run_at)
+                    .limit(self.batch_size)
+                    # concurrent executors (several bot processes) skip each other's batches
+                    .with_for_update(of=ScheduledTransfer.__table__, skip_locked=True)
+                )
+            ).all()
+            if not rows:
+                return 0
+            params, txns = [], []
+            notices: Dict[int, List[str]] = {}
+            for (sid, user_id, from_id, to_id, amount_minor, currency, cron, run_at, owner_id, tz_name, chat_id,
+                 src_name, src_currency, dst_name, dst_currency) in rows:
+                if owner_id is None or src_name is None or dst_name is None:
+                    logger.warning("Scheduled transfer %s disabled: its user or account no longer exists", sid)
+                    params.append({"sid": sid, "next_run_at": run_at, "enabled": False})
+                    continue
+                try:
+                    next_at = next_run(cron, tz_name, max(now, run_at))
+                except ValueError as e:
+                    logger.warning("Scheduled transfer %s disabled, bad cron %r: %s", sid, cron, e)
+                    params.append({"sid": sid, "next_run_at": run_at, "enabled": False})
+                    continue
+                if not (src_currency == dst_currency == currency):
+                    logger.warning("Scheduled transfer %s disabled: currency conversion is not supported", sid)
+                    params.append({"sid": sid, "next_run_at": run_at, "enabled": False})
+                    continue
+                params.append({"sid": sid, "next_run_at": next_at, "enabled": next_at is not None})
+                common = dict(user_id=user_id, amount_minor=amount_minor, currency=currency, category=TRANSFER_CATEGORY, occurred_at=run_at)
+                txns.append(Transaction(account_id=from_id, type="expense", description=f"Перевод -> {dst_name}", **common))
+                txns.append(Transaction(account_id=to_id, type="income", description=f"Перевод <- {src_name}", **common))
+                if chat_id is not None:
+                    amount = from_minor(amount_minor, currency)
+                    notices.setdefault(chat_id, []).append(f"• {amount} {currency}, {src_name} → {dst_name}")
+            await session.execute(
+                update(ScheduledTransfer.__table__)
+                .where(st.id == bindparam("sid"))
+                .values(next_run_at=bindparam("next_run_at"), enabled=bindparam("enabled")),
+                params,
+            )
+            await post_transactions(session, txns)
+            await session.commit()
+        if notices and self._bot is not None:
+            messages = [(chat_id, "\n".join(["↔️ Выполнены запланированные переводы:", *lines])) for chat_id, lines in notices.items()]
+            task = asyncio.create_task(send_messages(self._bot, messages))
+            self._sends.add(task)
+            task.add_done_callback(self._sends.discard)
+        return len(rows)
+
+
+transfer_executor = TransferExecutor()
@@ -1,52 +1,158 @@
 from __future__ import annotations
 
+import logging
 from dataclasses import dataclass
-from datetime import datetime, timedelta, date
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
 from pathlib import Path
-from typing import List
+from typing import Dict, List, Tuple
+
 import yaml
+from dateutil.relativedelta import relativedelta
+from sqlalchemy import bindparam, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..models import Account, Subscription, Transaction, User
+from .balances import post_transactions
 
-from ..config import get_settings
 
+logger = logging.getLogger(__name__)
 
 CONFIG_FILE = Path(__file__).resolve().parents[2] / "config" / "subscriptions.yaml"
+DEFAULT_CATEGORY = "Подписки"
+# months between charges
+PERIODS = {"monthly": 1, "yearly": 12}
 
 
-@dataclass
-class Subscription:
+@dataclass(frozen=True)
+class SubscriptionSpec:
     name: str
-    amount: float
+    amount: Decimal
     currency: str
     period: str  # monthly|yearly
     next_charge: date
 
 
-def load_subscriptions() -> List[Subscription]:
-    try:
-        raw = yaml.safe_load(CONFIG_FILE.read_text(encoding="utf-8"))
-    except Exception:
-        return []
-    items: List[Subscription] = []
+def parse_subscriptions_file(file_path: Path = CONFIG_FILE) -> Tuple[SubscriptionSpec, ...]:
+    """Entries of a subscriptions.yaml; malformed ones are skipped with a warning."""
+    raw = yaml.safe_load(file_path.read_text(encoding="utf-8"))
+    items: list[SubscriptionSpec] = []
     for r in raw or []:
         try:
-            items.append(
-                Subscription(
-                    name=str(r.get("name")),
-                    amount=float(r.get("amount")),
-                    currency=str(r.get("currency", "RUB")),
-                    period=str(r.get("period", "monthly")),
-                    next_charge=datetime.fromisoformat(str(r.get("next_charge"))).date(),
-                )
+            spec = SubscriptionSpec(
+                name=str(r["name"]),
+                amount=Decimal(str(r["amount"])),
+                currency=str(r.get("currency", "RUB")).upper(),
+                period=str(r.get("period", "monthly")),
+                next_charge=datetime.fromisoformat(str(r["next_charge"])).date(),
             )
-        except Exception:
+        except Exception as e:
+            logger.warning("Skipping subscription entry %r: %s", r, e)
+            continue
+        if spec.period not in PERIODS:
+            logger.warning("Skipping subscription %s: unknown period %r", spec.name, spec.period)
             continue
-    return items
+        items.append(spec)
+    return tuple(items)
+
+
+def next_charge_after(charge: date, period: str, charge_day: int) -> date:
+    # relativedelta clamps `day` to the month length and the anchor brings it back afterwards
+    return charge + relativedelta(months=PERIODS[period], day=charge_day)
+
+
+def roll_forward(charge: date, period: str, charge_day: int, today: date) -> Tuple[List[date], date]:
+    """Charge dates before `today` starting at `charge`, and the first one on or after it."""
+    passed = []
+    while charge < today:
+        passed.append(charge)
+        charge = next_charge_after(charge, period, charge_day)
+    return passed, charge
 
 
 def format_subscription_line(s: Subscription) -> str:
     return f"{s.name}: {s.amount:.2f} {s.currency} — {s.next_charge.isoformat()} ({s.period})"
 
 
-def is_due_within(s: Subscription, days: int) -> bool:
-    today = datetime.now().date()
-    return today <= s.next_charge <= (today + timedelta(days=days))
+async def due_subscriptions(session: AsyncSession, today: date, days: int) -> Dict[int, List[Subscription]]:
+    """{chat_id: subscriptions charged within `days` from `today`}, one range scan over next_charge."""
+    rows = await session.execute(
+        select(User.chat_id, Subscription)
+        .join(User, User.id == Subscription.user_id)
+        .where(
+            Subscription.next_charge >= today,
+            Subscription.next_charge <= today + timedelta(days=days),
+            User.chat_id.is_not(None),
+        )
+        .order_by(Subscription.user_id, Subscription.next_charge, Subscription.name)
+    )
+    out: Dict[int, List[Subscription]] = {}
+    for chat_id, sub in rows.all():
+        out.setdefault(chat_id, []).append(sub)
+    return out
+
+
+@dataclass
+class AdvanceReport:
+    advanced: int = 0
+    posted: int = 0
+    skipped: int = 0  # auto_post charges that could not be recorded
+
+
+async def advance_subscriptions(session: AsyncSession, today: date, batch_size: int = 1000) -> AdvanceReport:
+    """Move every next_charge before `today` to its next date, posting the charges where auto_post is set.
+
+    Rows are handled in id batches; each batch is one executemany update plus one
+    post_transactions call. The caller owns the commit.
+    """
+    report = AdvanceReport()
+    s = Subscription.__table__.c
+    stmt = update(Subscription.__table__).where(s.id == bindparam("sid")).values(next_charge=bindparam("next_charge"))
+    last_id = 0
+    while True:
+        rows = (
+            await session.execute(
+                select(
+                    s.id, s.user_id, s.name, s.amount, s.currency, s.period, s.next_charge, s.charge_day,
+                    s.account_id, s.category, s.auto_post, Account.currency,
+                )
+                .outerjoin(Account, Account.id == s.account_id)
+                .where(s.next_charge < today, s.id > last_id)
+                .order_by(s.id)
+                .limit(batch_size)
+            )
+        ).all()
+        params, txns = [], []
+        for sid, user_id, name, amount_minor, currency, period, charge, charge_day, account_id, category, auto_post, acc_currency in rows:
+            if period not in PERIODS:
+                logger.warning("Subscription %s has unknown period %r, not advanced", sid, period)
+                continue
+            passed, next_charge = roll_forward(charge, period, charge_day, today)
+            params.append({"sid": sid, "next_charge": next_charge})
+            if not auto_post:
+                continue
+            if account_id is None or acc_currency != currency:
+                # balances are kept in the account currency; a conversion here would be a guess
+                logger.warning("Subscription %s: no account in %s to post to", sid, currency)
+                report.skipped += len(passed)
+                continue
+            for day in passed:
+                txns.append(Transaction(
+                    user_id=user_id,
+                    account_id=account_id,
+                    type="expense",
+                    amount_minor=amount_minor,
+                    currency=currency,
+                    category=category or DEFAULT_CATEGORY,
+                    description=name,
+                    occurred_at=datetime.combine(day, time(12)),
+                ))
+        if params:
+            await session.execute(stmt, params)
+        await post_transactions(session, txns)
+        report.advanced += len(params)
+        report.posted += len(txns)
+        if len(rows) < batch_size:
+            return report
+        last_id = rows[-1][0]
+
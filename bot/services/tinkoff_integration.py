@@ -1,37 +1,70 @@
+import asyncio
 from decimal import Decimal
+from typing import Dict, List, Tuple
+
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from ..models import User, Account
 from ..config import get_settings
+from .http import get_http_client
+
+
+# parallel get_portfolio calls per sync; the API rate-limits per minute, this only bounds bursts
+SDK_CONCURRENCY = 4
 
 
-def _fetch_tinkoff_summary(token: str) -> dict:
+async def _fetch_tinkoff_summary(token: str) -> dict:
     try:
-        from tinkoff_sync import fetch_tinkoff_summary  # type: ignore
+        from tinkoff_sync import fetch_tinkoff_summary_async  # type: ignore
     except Exception as e:
         raise RuntimeError(f"Cannot import tinkoff_sync: {e}")
-    return fetch_tinkoff_summary(token)
-
-
-async def _upsert_external_account(session: AsyncSession, user_id: int, name: str, balance_rub: Decimal) -> Account:
-    acc = (
-        await session.execute(select(Account).where(Account.user_id == user_id, Account.name == name))
-    ).scalar_one_or_none()
-    if acc is None:
-        acc = Account(
-            user_id=user_id,
-            name=name,
-            type="broker_portfolio",
-            currency="RUB",
-            is_external_balance=True,
-            external_balance=balance_rub,
-        )
-        session.add(acc)
-    else:
-        acc.is_external_balance = True
-        acc.external_balance = balance_rub
-    return acc
+    return await fetch_tinkoff_summary_async(token, client=get_http_client())
+
+
+async def _upsert_external_accounts(session: AsyncSession, user_id: int, balances: Dict[str, Decimal]) -> None:
+    """Set the external balance of each named broker account, creating missing ones; one select, one flush."""
+    if not balances:
+        return
+    existing = {
+        a.name: a
+        for a in (
+            await session.execute(select(Account).where(Account.user_id == user_id, Account.name.in_(list(balances))))
+        ).scalars()
+    }
+    for name, balance_rub in balances.items():
+        acc = existing.get(name)
+        if acc is None:
+            session.add(
+                Account(
+                    user_id=user_id,
+                    name=name,
+                    type="broker_portfolio",
+                    currency="RUB",
+                    is_external_balance=True,
+                    external_balance=balance_rub,
+                )
+            )
+        else:
+            acc.is_external_balance = True
+            acc.external_balance = balance_rub
+    await session.flush()
+
+
+def quotation_to_decimal(q) -> Decimal:
+    return Decimal(str(q.units or 0)) + Decimal(str(q.nano or 0)) / Decimal("1000000000")
+
+
+async def fetch_sdk_portfolios(client, accounts: list, concurrency: int = SDK_CONCURRENCY) -> List[Tuple[object, object]]:
+    """(account, portfolio or the exception it raised) for every account, fetched concurrently via AsyncClient."""
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one(a):
+        async with sem:
+            return await client.operations.get_portfolio(account_id=a.id)
+
+    results = await asyncio.gather(*(one(a) for a in accounts), return_exceptions=True)
+    return list(zip(accounts, results))
 
 
 def _map_account_name(a) -> str:
@@ -51,7 +84,7 @@ def _map_account_name(a) -> str:
 
 async def _sync_via_sdk(session: AsyncSession, user: User, token: str) -> str:
     try:
-        from tinkoff.invest import Client
+        from tinkoff.invest import AsyncClient
     except Exception as e:
         raise RuntimeError(f"SDK not available: {e}")
 
@@ -61,24 +94,26 @@ async def _sync_via_sdk(session: AsyncSession, user: User, token: str) -> str:
     ignore_ids: set[str] = set()
     if settings.TINKOFF_IGNORE_ACCOUNT_IDS:
         ignore_ids = set(x.strip() for x in settings.TINKOFF_IGNORE_ACCOUNT_IDS.split(",") if x.strip())
-    with Client(token) as client:
-        accs = client.users.get_accounts().accounts
-        for a in accs:
-            try:
-                if getattr(a, "id", "") in ignore_ids:
-                    continue
-                p = client.operations.get_portfolio(account_id=a.id)
-                q = p.total_amount_portfolio
-                value = Decimal(str((q.units or 0))) + (Decimal(str(q.nano or 0)) / Decimal("1000000000"))
-                name = _map_account_name(a)
-                # Skip zero portfolios to avoid clutter/accidental empty accounts
-                if value != 0:
-                    await _upsert_external_account(session, user.id, name, value)
-                    lines.append(f"{name:<24} {value:>14} RUB")
-                    total += value
-            except Exception as e:
-                lines.append(f"{getattr(a, 'id', 'acc')}: error {e}")
-        await session.commit()
+    async with AsyncClient(token) as client:
+        accs = [a for a in (await client.users.get_accounts()).accounts if getattr(a, "id", "") not in ignore_ids]
+        portfolios = await fetch_sdk_portfolios(client, accs)
+    balances: Dict[str, Decimal] = {}
+    for a, p in portfolios:
+        if isinstance(p, BaseException):
+            lines.append(f"{getattr(a, 'id', 'acc')}: error {p}")
+            continue
+        try:
+            value = quotation_to_decimal(p.total_amount_portfolio)
+            name = _map_account_name(a)
+        except Exception as e:
+            lines.append(f"{getattr(a, 'id', 'acc')}: error {e}")
+            continue
+        # Skip zero portfolios to avoid clutter/accidental empty accounts
+        if value != 0:
+            balances[name] = value
+            lines.append(f"{name:<24} {value:>14} RUB")
+            total += value
+    await _upsert_external_accounts(session, user.id, balances)
     body = "\n".join(lines)
     return f"Синк по SDK\n<pre>\n{body}\n\nИтого: {total} RUB\n</pre>" if lines else "Нет счетов в SDK"
 
@@ -95,37 +130,18 @@ async def sync_tinkoff_account(session: AsyncSession, user: User) -> str:
     except Exception:
         pass
 
-    data = _fetch_tinkoff_summary(settings.TINKOFF_API_TOKEN)
+    data = await _fetch_tinkoff_summary(settings.TINKOFF_API_TOKEN)
     total_rub = Decimal(str(data.get("total_rub", 0)))
-    acc = (
-        await session.execute(
-            select(Account).where(Account.user_id == user.id, Account.name == "Тинькофф Брокер")
-        )
-    ).scalar_one_or_none()
-    if acc is None:
-        acc = Account(
-            user_id=user.id,
-            name="Тинькофф Брокер",
-            type="broker_portfolio",
-            currency="RUB",
-            is_external_balance=True,
-            external_balance=total_rub,
-        )
-        session.add(acc)
-    else:
-        acc.is_external_balance = True
-        acc.external_balance = total_rub
-
-    await session.commit()
+    await _upsert_external_accounts(session, user.id, {"Тинькофф Брокер": total_rub})
     return f"Тинькофф синхронизирован: {total_rub} RUB"
 
 
-def tinkoff_debug_text() -> str:
+async def tinkoff_debug_text() -> str:
     settings = get_settings()
     if not settings.TINKOFF_API_TOKEN:
         return "Нет токена TINKOFF_API_TOKEN"
     try:
-        data = _fetch_tinkoff_summary(settings.TINKOFF_API_TOKEN)
+        data = await _fetch_tinkoff_summary(settings.TINKOFF_API_TOKEN)
     except Exception as e:
         return f"Ошибка импорта: {e}"
     dbg = data.get("_debug", {})
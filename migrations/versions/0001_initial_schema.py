@@ -0,0 +1,130 @@
+"""initial schema with composite indexes for hot paths
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-17 09:00:00
+
+Databases created earlier by Base.metadata.create_all already have some of
+these tables, so every table and index is only created when missing.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0001"
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+INDEXES = [
+    # (name, table, columns, unique)
+    ("ix_users_telegram_id", "users", ["telegram_id"], True),
+    ("ix_accounts_user_id", "accounts", ["user_id"], False),
+    ("uq_accounts_user_id_name", "accounts", ["user_id", "name"], True),
+    ("ix_transactions_user_id", "transactions", ["user_id"], False),
+    ("ix_transactions_account_id", "transactions", ["account_id"], False),
+    ("ix_transactions_account_id_id", "transactions", ["account_id", "id"], False),
+    ("ix_transactions_account_id_type", "transactions", ["account_id", "type"], False),
+    ("ix_transactions_user_id_occurred_at", "transactions", ["user_id", "occurred_at"], False),
+    ("ix_balance_checkpoints_account_id_txn_id", "balance_checkpoints", ["account_id", "txn_id"], False),
+    ("ix_balance_checkpoints_account_id_created_at", "balance_checkpoints", ["account_id", "created_at"], False),
+]
+
+
+def upgrade() -> None:
+    inspector = sa.inspect(op.get_bind())
+    tables = set(inspector.get_table_names())
+
+    if "users" not in tables:
+        op.create_table(
+            "users",
+            sa.Column("id", sa.Integer(), primary_key=True, autoincrement=True),
+            sa.Column("telegram_id", sa.BigInteger(), nullable=False),
+            sa.Column("chat_id", sa.BigInteger(), nullable=True),
+            sa.Column("base_currency", sa.String(8), nullable=False),
+            sa.Column("reminder_time", sa.String(8), nullable=False),
+            sa.Column("created_at", sa.DateTime(), nullable=False),
+        )
+
+    if "accounts" not in tables:
+        op.create_table(
+            "accounts",
+            sa.Column("id", sa.Integer(), primary_key=True, autoincrement=True),
+            sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id", ondelete="CASCADE"), nullable=False),
+            sa.Column("name", sa.String(64), nullable=False),
+            sa.Column("type", sa.String(24), nullable=False),
+            sa.Column("currency", sa.String(8), nullable=False),
+            sa.Column("is_external_balance", sa.Boolean(), nullable=False),
+            sa.Column("external_balance", sa.Numeric(18, 2), nullable=True),
+            sa.Column("created_at", sa.DateTime(), nullable=False),
+        )
+
+    if "transactions" not in tables:
+        op.create_table(
+            "transactions",
+            sa.Column("id", sa.Integer(), primary_key=True, autoincrement=True),
+            sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id", ondelete="CASCADE"), nullable=False),
+            sa.Column("account_id", sa.Integer(), sa.ForeignKey("accounts.id", ondelete="CASCADE"), nullable=False),
+            sa.Column("type", sa.String(8), nullable=False),
+            sa.Column("amount", sa.Numeric(18, 2), nullable=False),
+            sa.Column("currency", sa.String(8), nullable=False),
+            sa.Column("category", sa.String(64), nullable=True),
+            sa.Column("description", sa.String(256), nullable=True),
+            sa.Column("occurred_at", sa.DateTime(), nullable=False),
+            sa.Column("created_at", sa.DateTime(), nullable=False),
+        )
+
+    if "account_balances" not in tables:
+        op.create_table(
+            "account_balances",
+            sa.Column("account_id", sa.Integer(), sa.ForeignKey("accounts.id", ondelete="CASCADE"), primary_key=True),
+            sa.Column("balance", sa.Numeric(18, 2), nullable=False),
+            sa.Column("txn_count", sa.Integer(), nullable=False),
+            sa.Column("last_txn_id", sa.Integer(), nullable=True),
+            sa.Column("updated_at", sa.DateTime(), nullable=False),
+        )
+    # Seed accounts that have history but no counter row yet, so balance reads
+    # stay O(accounts) right away
+    op.execute(
+        """
+        INSERT INTO account_balances (account_id, balance, txn_count, last_txn_id, updated_at)
+        SELECT account_id,
+               COALESCE(SUM(CASE type WHEN 'income' THEN amount WHEN 'expense' THEN -amount ELSE 0 END), 0),
+               COUNT(id),
+               MAX(id),
+               CURRENT_TIMESTAMP
+        FROM transactions
+        WHERE account_id NOT IN (SELECT account_id FROM account_balances)
+        GROUP BY account_id
+        """
+    )
+
+    if "balance_checkpoints" not in tables:
+        op.create_table(
+            "balance_checkpoints",
+            sa.Column("id", sa.Integer(), primary_key=True, autoincrement=True),
+            sa.Column("account_id", sa.Integer(), sa.ForeignKey("accounts.id", ondelete="CASCADE"), nullable=False),
+            sa.Column("txn_id", sa.Integer(), nullable=False),
+            sa.Column("balance", sa.Numeric(18, 2), nullable=False),
+            sa.Column("txn_count", sa.Integer(), nullable=False),
+            sa.Column("created_at", sa.DateTime(), nullable=False),
+        )
+
+    for name, table, columns, unique in INDEXES:
+        existing = {ix["name"] for ix in inspector.get_indexes(table)} if table in tables else set()
+        if name not in existing:
+            op.create_index(name, table, columns, unique=unique)
+
+
+def downgrade() -> None:
+    for name, table, _, _ in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
+    op.drop_table("balance_checkpoints")
+    op.drop_table("account_balances")
+    op.drop_table("transactions")
+    op.drop_table("accounts")
+    op.drop_table("users")
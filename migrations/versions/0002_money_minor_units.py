@@ -0,0 +1,98 @@
+"""store money as integer minor units
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-17 10:00:00
+
+Amounts move from Numeric(18, 2) (REAL on SQLite) to BIGINT minor units scaled
+per currency: 2 decimals for fiat, 8 for everything else (crypto). The fiat
+list is a copy of bot/money.py as of this revision, so later edits there do
+not change what this migration does.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0002"
+down_revision: Union[str, None] = "0001"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+FIAT = (
+    "RUB", "RUR", "USD", "EUR", "GBP", "CHF", "CNY", "HKD", "JPY", "KZT", "BYN", "UAH",
+    "TRY", "AED", "GEL", "AMD", "AZN", "UZS", "KGS", "TJS", "THB", "INR", "CAD", "AUD",
+    "SGD", "PLN", "CZK", "SEK", "NOK", "DKK", "RSD", "ILS",
+)
+
+
+def _factor(currency_sql: str) -> str:
+    fiat = ", ".join(f"'{c}'" for c in FIAT)
+    return f"(CASE WHEN UPPER(COALESCE({currency_sql}, 'RUB')) IN ({fiat}) THEN 100 ELSE 100000000 END)"
+
+
+def _account_factor(account_id_sql: str) -> str:
+    return f"(SELECT {_factor('accounts.currency')} FROM accounts WHERE accounts.id = {account_id_sql})"
+
+
+def upgrade() -> None:
+    op.execute(f"UPDATE transactions SET amount = CAST(ROUND(amount * {_factor('currency')}) AS BIGINT)")
+    op.execute(
+        f"UPDATE accounts SET external_balance = CAST(ROUND(external_balance * {_factor('currency')}) AS BIGINT) "
+        "WHERE external_balance IS NOT NULL"
+    )
+    op.execute(
+        "UPDATE balance_checkpoints SET balance = "
+        f"CAST(ROUND(balance * {_account_factor('balance_checkpoints.account_id')}) AS BIGINT)"
+    )
+    # Counters are derived data: recompute them from the converted history
+    op.execute("DELETE FROM account_balances")
+    op.execute(
+        """
+        INSERT INTO account_balances (account_id, balance, txn_count, last_txn_id, updated_at)
+        SELECT account_id,
+               COALESCE(SUM(CASE type WHEN 'income' THEN amount WHEN 'expense' THEN -amount ELSE 0 END), 0),
+               COUNT(id),
+               MAX(id),
+               CURRENT_TIMESTAMP
+        FROM transactions
+        GROUP BY account_id
+        """
+    )
+
+    with op.batch_alter_table("transactions") as batch:
+        batch.alter_column("amount", type_=sa.BigInteger(), existing_type=sa.Numeric(18, 2), existing_nullable=False)
+    with op.batch_alter_table("accounts") as batch:
+        batch.alter_column("external_balance", type_=sa.BigInteger(), existing_type=sa.Numeric(18, 2), existing_nullable=True)
+    with op.batch_alter_table("account_balances") as batch:
+        batch.alter_column("balance", type_=sa.BigInteger(), existing_type=sa.Numeric(18, 2), existing_nullable=False)
+    with op.batch_alter_table("balance_checkpoints") as batch:
+        batch.alter_column("balance", type_=sa.BigInteger(), existing_type=sa.Numeric(18, 2), existing_nullable=False)
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("balance_checkpoints") as batch:
+        batch.alter_column("balance", type_=sa.Numeric(18, 2), existing_type=sa.BigInteger(), existing_nullable=False)
+    with op.batch_alter_table("account_balances") as batch:
+        batch.alter_column("balance", type_=sa.Numeric(18, 2), existing_type=sa.BigInteger(), existing_nullable=False)
+    with op.batch_alter_table("accounts") as batch:
+        batch.alter_column("external_balance", type_=sa.Numeric(18, 2), existing_type=sa.BigInteger(), existing_nullable=True)
+    with op.batch_alter_table("transactions") as batch:
+        batch.alter_column("amount", type_=sa.Numeric(18, 2), existing_type=sa.BigInteger(), existing_nullable=False)
+
+    op.execute(f"UPDATE transactions SET amount = amount * 1.0 / {_factor('currency')}")
+    op.execute(
+        f"UPDATE accounts SET external_balance = external_balance * 1.0 / {_factor('currency')} "
+        "WHERE external_balance IS NOT NULL"
+    )
+    op.execute(
+        "UPDATE balance_checkpoints SET balance = "
+        f"balance * 1.0 / {_account_factor('balance_checkpoints.account_id')}"
+    )
+    op.execute(
+        "UPDATE account_balances SET balance = "
+        f"balance * 1.0 / {_account_factor('account_balances.account_id')}"
+    )
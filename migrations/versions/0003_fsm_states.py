@@ -0,0 +1,33 @@
+"""persistent FSM storage
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-17 12:00:00
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0003"
+down_revision: Union[str, None] = "0002"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "fsm_states",
+        sa.Column("key", sa.String(128), primary_key=True),
+        sa.Column("state", sa.String(128), nullable=True),
+        sa.Column("data", sa.JSON(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(), nullable=False),
+    )
+    op.create_index("ix_fsm_states_updated_at", "fsm_states", ["updated_at"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_fsm_states_updated_at", table_name="fsm_states")
+    op.drop_table("fsm_states")
@@ -0,0 +1,40 @@
+"""historical currency rates
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-17 14:00:00
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0004"
+down_revision: Union[str, None] = "0003"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "currency_rates",
+        sa.Column("id", sa.Integer(), primary_key=True, autoincrement=True),
+        sa.Column("date", sa.Date(), nullable=False),
+        sa.Column("base", sa.String(8), nullable=False),
+        sa.Column("quote", sa.String(8), nullable=False),
+        sa.Column("rate", sa.Numeric(18, 8), nullable=False),
+        sa.Column("source", sa.String(16), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+    )
+    op.create_index(
+        "uq_currency_rates_date_base_quote_source", "currency_rates", ["date", "base", "quote", "source"], unique=True
+    )
+    op.create_index("ix_currency_rates_base_quote_date", "currency_rates", ["base", "quote", "date"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_currency_rates_base_quote_date", table_name="currency_rates")
+    op.drop_index("uq_currency_rates_date_base_quote_source", table_name="currency_rates")
+    op.drop_table("currency_rates")
@@ -0,0 +1,33 @@
+"""per-user reminder timezone and next fire time
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-17 16:00:00
+
+reminder_next_at starts out NULL; the reminder scheduler fills it in batches.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0005"
+down_revision: Union[str, None] = "0004"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    with op.batch_alter_table("users") as batch:
+        batch.add_column(sa.Column("timezone", sa.String(64), nullable=True))
+        batch.add_column(sa.Column("reminder_next_at", sa.DateTime(), nullable=True))
+    op.create_index("ix_users_reminder_next_at", "users", ["reminder_next_at"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_users_reminder_next_at", table_name="users")
+    with op.batch_alter_table("users") as batch:
+        batch.drop_column("reminder_next_at")
+        batch.drop_column("timezone")
@@ -0,0 +1,47 @@
+"""per-user subscriptions
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-17 18:00:00
+
+Replaces the global config/subscriptions.yaml; tools/import_subscriptions.py loads it per user.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0006"
+down_revision: Union[str, None] = "0005"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "subscriptions",
+        sa.Column("id", sa.Integer(), primary_key=True, autoincrement=True),
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id", ondelete="CASCADE"), nullable=False),
+        sa.Column("name", sa.String(64), nullable=False),
+        sa.Column("amount", sa.BigInteger(), nullable=False),
+        sa.Column("currency", sa.String(8), nullable=False),
+        sa.Column("period", sa.String(8), nullable=False),
+        sa.Column("next_charge", sa.Date(), nullable=False),
+        sa.Column("charge_day", sa.Integer(), nullable=False),
+        sa.Column("account_id", sa.Integer(), sa.ForeignKey("accounts.id", ondelete="SET NULL"), nullable=True),
+        sa.Column("category", sa.String(64), nullable=True),
+        sa.Column("auto_post", sa.Boolean(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+    )
+    op.create_index("ix_subscriptions_user_id", "subscriptions", ["user_id"])
+    op.create_index("uq_subscriptions_user_id_name", "subscriptions", ["user_id", "name"], unique=True)
+    op.create_index("ix_subscriptions_next_charge", "subscriptions", ["next_charge"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_subscriptions_next_charge", table_name="subscriptions")
+    op.drop_index("uq_subscriptions_user_id_name", table_name="subscriptions")
+    op.drop_index("ix_subscriptions_user_id", table_name="subscriptions")
+    op.drop_table("subscriptions")
@@ -0,0 +1,41 @@
+"""scheduled transfers
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-17 20:00:00
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0007"
+down_revision: Union[str, None] = "0006"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "scheduled_transfers",
+        sa.Column("id", sa.Integer(), primary_key=True, autoincrement=True),
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id", ondelete="CASCADE"), nullable=False),
+        sa.Column("from_account_id", sa.Integer(), sa.ForeignKey("accounts.id", ondelete="CASCADE"), nullable=False),
+        sa.Column("to_account_id", sa.Integer(), sa.ForeignKey("accounts.id", ondelete="CASCADE"), nullable=False),
+        sa.Column("amount", sa.BigInteger(), nullable=False),
+        sa.Column("currency", sa.String(8), nullable=False),
+        sa.Column("cron", sa.String(64), nullable=False),
+        sa.Column("next_run_at", sa.DateTime(), nullable=True),
+        sa.Column("enabled", sa.Boolean(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+    )
+    op.create_index("ix_scheduled_transfers_user_id", "scheduled_transfers", ["user_id"])
+    op.create_index("ix_scheduled_transfers_enabled_next_run_at", "scheduled_transfers", ["enabled", "next_run_at"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_scheduled_transfers_enabled_next_run_at", table_name="scheduled_transfers")
+    op.drop_index("ix_scheduled_transfers_user_id", table_name="scheduled_transfers")
+    op.drop_table("scheduled_transfers")
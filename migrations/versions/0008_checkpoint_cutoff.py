@@ -0,0 +1,40 @@
+"""as-of balances keyed on occurred_at
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-17 21:00:00
+
+Checkpoints gain an occurred_at cutoff and the balance of the rows before it,
+so balance_as_of only sums the (account_id, occurred_at) range between a
+checkpoint and the requested moment. Existing checkpoints keep a NULL cutoff:
+they still serve running totals and the next nightly run writes keyed ones.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0008"
+down_revision: Union[str, None] = "0007"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    with op.batch_alter_table("balance_checkpoints") as batch:
+        batch.add_column(sa.Column("cutoff", sa.DateTime(), nullable=True))
+        batch.add_column(sa.Column("cutoff_balance", sa.BigInteger(), nullable=True))
+        batch.drop_index("ix_balance_checkpoints_account_id_created_at")
+        batch.create_index("ix_balance_checkpoints_account_id_cutoff", ["account_id", "cutoff"])
+    op.create_index("ix_transactions_account_id_occurred_at", "transactions", ["account_id", "occurred_at"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_transactions_account_id_occurred_at", table_name="transactions")
+    with op.batch_alter_table("balance_checkpoints") as batch:
+        batch.drop_index("ix_balance_checkpoints_account_id_cutoff")
+        batch.create_index("ix_balance_checkpoints_account_id_created_at", ["account_id", "created_at"])
+        batch.drop_column("cutoff_balance")
+        batch.drop_column("cutoff")
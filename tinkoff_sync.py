@@ -1,12 +1,13 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+import asyncio
 import os
 import sys
 import json
 import urllib.request
 import httpx
-from typing import Any, Dict, Optional, List
+from typing import Any, Awaitable, Callable, Dict, Optional, List, Tuple
 from datetime import datetime, timezone
 import time
 from pathlib import Path
@@ -41,11 +42,248 @@ def load_env(path: Path) -> dict:
     return env
 
 
-def fetch_tinkoff_summary(token: str) -> dict:
-    # Use user's integration TinkoffClient API
-    total_rub = 0.0
-    day_change_rub = 0.0  # optional, keep 0 for now
-    by_sector = {}
+REST_V2_BASE = "https://invest-public-api.tinkoff.ru/rest"
+LEGACY_BASE = "https://api-invest.tinkoff.ru/openapi"
+REST_TIMEOUT = 25.0
+LEGACY_TIMEOUT = 20.0
+# delay before the next strategy starts while the previous one is still running
+STRATEGY_STAGGER = 1.0
+# sectors and position counts only come from the vault client: when REST wins, it gets
+# this long to finish them before it is cancelled
+VAULT_SECTOR_GRACE = 5.0
+ACCOUNT_CONCURRENCY = 4
+
+
+def _headers(token: str, json_body: bool = False) -> Dict[str, str]:
+    h = {
+        "Authorization": f"Bearer {token}",
+        "Accept": "application/json",
+        "x-app-name": "finance-bot/0.1",
+        "User-Agent": "finance-bot/0.1",
+    }
+    if json_body:
+        h["Content-Type"] = "application/json"
+    return h
+
+
+def _make_client() -> httpx.AsyncClient:
+    limits = httpx.Limits(max_connections=20, max_keepalive_connections=10)
+    try:
+        return httpx.AsyncClient(http2=True, timeout=REST_TIMEOUT, follow_redirects=True, limits=limits)
+    except ImportError as e:
+        dbg(f"HTTP/2 unavailable ({e}); falling back to HTTP/1.1")
+        return httpx.AsyncClient(timeout=REST_TIMEOUT, follow_redirects=True, limits=limits)
+
+
+async def _gather_limited(fn, items: List[Any], limit: int = ACCOUNT_CONCURRENCY) -> List[Any]:
+    """fn(item) for every item, at most `limit` at a time; exceptions are returned in place."""
+    sem = asyncio.Semaphore(limit)
+
+    async def one(item):
+        async with sem:
+            return await fn(item)
+
+    return await asyncio.gather(*(one(i) for i in items), return_exceptions=True)
+
+
+def _import_vault_client():
+    if str(VAULT) not in sys.path:
+        sys.path.append(str(VAULT))
+    from tg_alerting.integrations.tinkoff import TinkoffClient
+    return TinkoffClient
+
+
+async def _vault_strategy(token: str, info: Dict[str, Any]) -> Dict[str, Any]:
+    # the vault client is blocking; every call runs in a worker thread
+    try:
+        TinkoffClient = await asyncio.to_thread(_import_vault_client)
+    except Exception as e:
+        raise RuntimeError(f"Import TinkoffClient failed: {e}")
+    dbg("Imported TinkoffClient from tg_alerting.integrations.tinkoff")
+    info["imported_client"] = True
+    # Prefer running under the same venv where SDK installed
+    env_bin = VAULT / "800_Автоматизация" / "env" / "bin"
+    os.environ.setdefault("PATH", f"{env_bin}:{os.environ.get('PATH','')}")
+    api = await asyncio.to_thread(TinkoffClient, token)
+    accounts = await asyncio.to_thread(api.get_accounts_v2) or []
+    dbg(f"Accounts v2: {accounts}")
+    info["accounts_v2"] = accounts
+    if not accounts:
+        main = await asyncio.to_thread(api.get_main_account_id)
+        dbg(f"Main account fallback: {main}")
+        accounts = [main] if main else []
+        info["main_account"] = main
+    if not accounts:
+        raise RuntimeError("No accounts fetched; check token or API availability")
+
+    def account(acc_id):
+        return api.get_total_equity_rub(acc_id), api.get_positions_detailed(acc_id) or []
+
+    results = await _gather_limited(lambda acc_id: asyncio.to_thread(account, acc_id), accounts)
+    equities: Dict[str, float] = {}
+    positions_counts: Dict[str, int] = {}
+    all_positions: List[Any] = []
+    for acc_id, res in zip(accounts, results):
+        if isinstance(res, BaseException):
+            dbg(f"Error account {acc_id}: {res}")
+            info["errors"].append(f"account_error {acc_id}: {res}")
+            continue
+        eq, pos = res
+        dbg(f"Equity {acc_id}: {eq}, positions: {len(pos)}")
+        if eq is not None:
+            equities[acc_id] = float(eq)
+        positions_counts[acc_id] = len(pos)
+        all_positions.extend(pos)
+    total = sum(equities.values())
+    if total == 0:
+        raise RuntimeError("vault client returned no equity")
+    by_sector = await asyncio.to_thread(api.aggregate_by_sector, all_positions) if all_positions else {}
+    return {"total_rub": total, "equities": equities, "positions_counts": positions_counts, "by_sector": by_sector}
+
+
+async def _rest_v2_strategy(client: httpx.AsyncClient, token: str, info: Dict[str, Any]) -> Dict[str, Any]:
+    dbg("Trying REST v2 (HTTP/2) UsersService/GetAccounts...")
+    url_acc = REST_V2_BASE + "/tinkoff.public.invest.api.contract.v1.UsersService/GetAccounts"
+    url_port = REST_V2_BASE + "/tinkoff.public.invest.api.contract.v1.PortfolioService/GetPortfolio"
+    r = await client.post(url_acc, json={}, headers=_headers(token, json_body=True), timeout=REST_TIMEOUT, follow_redirects=True)
+    if r.status_code != 200:
+        dbg(f"REST v2 accounts http {r.status_code}: {r.text[:200]}")
+        raise RuntimeError(f"REST v2 accounts http {r.status_code}")
+    acc_data = r.json()
+    accounts = [
+        str(a.get("id") or a.get("brokerAccountId"))
+        for a in (acc_data.get("accounts") or acc_data.get("payload", {}).get("accounts") or [])
+        if (a.get("id") or a.get("brokerAccountId"))
+    ]
+    dbg(f"REST accounts: {accounts}")
+    info["accounts_rest"] = accounts
+
+    async def portfolio(acc_id: str) -> Optional[float]:
+        r2 = await client.post(
+            url_port,
+            json={"accountId": acc_id, "currency": "RUB"},
+            headers=_headers(token, json_body=True),
+            timeout=REST_TIMEOUT,
+            follow_redirects=True,
+        )
+        if r2.status_code != 200:
+            dbg(f"REST v2 portfolio {acc_id} http {r2.status_code}: {r2.text[:200]}")
+            return None
+        port = r2.json()
+        mv = port.get("totalAmountPortfolio") or port.get("payload", {}).get("totalAmountPortfolio")
+        if isinstance(mv, dict) and (mv.get("currency", "").lower() in ("rub", "rur")):
+            return float(mv.get("units") or 0) + float(mv.get("nano") or 0) / 1_000_000_000
+        return None
+
+    equities: Dict[str, float] = {}
+    for acc_id, val in zip(accounts, await _gather_limited(portfolio, accounts)):
+        if isinstance(val, BaseException):
+            info["errors"].append(f"rest_error {acc_id}: {val}")
+        elif val is not None:
+            dbg(f"REST equity {acc_id}: {val}")
+            equities[acc_id] = val
+    total = sum(equities.values())
+    if total == 0:
+        raise RuntimeError("REST v2 returned no RUB equity")
+    return {"total_rub": total, "equities": equities}
+
+
+async def _legacy_strategy(client: httpx.AsyncClient, token: str, info: Dict[str, Any]) -> Dict[str, Any]:
+    dbg("Trying legacy OpenAPI /user/accounts and /portfolio ...")
+    r = await client.get(LEGACY_BASE + "/user/accounts", headers=_headers(token), timeout=LEGACY_TIMEOUT, follow_redirects=True)
+    if r.status_code != 200:
+        dbg(f"Legacy accounts http {r.status_code}: {r.text[:200]}")
+        raise RuntimeError(f"legacy http {r.status_code}")
+    accs_data = r.json()
+    accounts = [str(a.get("brokerAccountId")) for a in accs_data.get("payload", {}).get("accounts", []) if a.get("brokerAccountId")]
+    dbg(f"Legacy accounts: {accounts}")
+    info["accounts_rest"] = info.get("accounts_rest", []) or accounts
+
+    async def portfolio(acc_id: str) -> Optional[float]:
+        r2 = await client.get(
+            LEGACY_BASE + "/portfolio",
+            params={"brokerAccountId": acc_id},
+            headers=_headers(token),
+            timeout=LEGACY_TIMEOUT,
+            follow_redirects=True,
+        )
+        if r2.status_code != 200:
+            dbg(f"Legacy portfolio {acc_id} http {r2.status_code}: {r2.text[:200]}")
+            return None
+        payload = r2.json().get("payload", {})
+        tot = payload.get("totalAmountPortfolio") or payload.get("totalAmountCurrencies")
+        return float(tot.get("value") or 0.0) if isinstance(tot, dict) else None
+
+    equities: Dict[str, float] = {}
+    for acc_id, val in zip(accounts, await _gather_limited(portfolio, accounts)):
+        if isinstance(val, BaseException):
+            info["errors"].append(f"legacy_error {acc_id}: {val}")
+        elif val:
+            dbg(f"Legacy equity {acc_id}: {val}")
+            equities[acc_id] = val
+    total = sum(equities.values())
+    if total == 0:
+        raise RuntimeError("legacy OpenAPI returned no equity")
+    return {"total_rub": total, "equities": equities}
+
+
+async def run_strategies(
+    strategies: List[Tuple[str, Callable[[], Awaitable[Any]]]],
+    stagger: float = STRATEGY_STAGGER,
+    grace: Optional[Dict[str, float]] = None,
+) -> Tuple[Optional[str], Any, Dict[str, Dict[str, Any]]]:
+    """Start strategies one `stagger` apart (at once after a failure); the first success wins.
+
+    Returns (winner, result, {name: {"status", "seconds"}}); the losers still running are
+    cancelled, except that a strategy named in `grace` first gets that many seconds to
+    finish, and its result is then kept in its report entry under "result". winner is
+    None when every strategy failed.
+    """
+    report: Dict[str, Dict[str, Any]] = {}
+    queue = list(strategies)
+    pending: Dict[asyncio.Task, Tuple[str, float]] = {}
+    try:
+        while queue or pending:
+            if queue:
+                name, factory = queue.pop(0)
+                pending[asyncio.create_task(factory())] = (name, time.monotonic())
+            done, _ = await asyncio.wait(pending, timeout=stagger if queue else None, return_when=asyncio.FIRST_COMPLETED)
+            winner = None
+            for task in done:
+                name, started = pending.pop(task)
+                elapsed = round(time.monotonic() - started, 3)
+                if task.exception() is None:
+                    report[name] = {"status": "ok", "seconds": elapsed}
+                    winner = winner or (name, task.result())
+                else:
+                    report[name] = {"status": f"error: {task.exception()}", "seconds": elapsed}
+            if winner is not None:
+                graced = [t for t, (name, _) in pending.items() if name in (grace or {})]
+                if graced:
+                    done, _ = await asyncio.wait(graced, timeout=max(grace[pending[t][0]] for t in graced))
+                    for task in done:
+                        name, started = pending.pop(task)
+                        elapsed = round(time.monotonic() - started, 3)
+                        if task.exception() is None:
+                            report[name] = {"status": "ok (late)", "seconds": elapsed, "result": task.result()}
+                        else:
+                            report[name] = {"status": f"error: {task.exception()}", "seconds": elapsed}
+                return winner[0], winner[1], report
+        return None, None, report
+    finally:
+        for task, (name, started) in pending.items():
+            task.cancel()
+            report[name] = {"status": "cancelled", "seconds": round(time.monotonic() - started, 3)}
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+
+
+async def fetch_tinkoff_summary_async(token: str, client: Optional[httpx.AsyncClient] = None) -> dict:
+    """Portfolio summary from whichever source answers first: vault TinkoffClient, REST v2 or legacy OpenAPI.
+
+    `client` is a pooled AsyncClient to share (the bot passes its own); without one a
+    client is opened for this call.
+    """
     dbginfo: Dict[str, Any] = {
         "imported_client": False,
         "accounts_v2": [],
@@ -56,175 +294,36 @@ def fetch_tinkoff_summary(token: str) -> dict:
         "sectors": [],
         "errors": [],
     }
-
+    own_client = client is None
+    if own_client:
+        client = _make_client()
     try:
-        sys.path.append(str(VAULT))
-        from tg_alerting.integrations.tinkoff import TinkoffClient
-        dbg("Imported TinkoffClient from tg_alerting.integrations.tinkoff")
-        dbginfo["imported_client"] = True
-    except Exception as e:
-        dbg(f"Import TinkoffClient failed: {e}")
-        dbginfo["errors"].append(f"import_error: {e}")
-        TinkoffClient = None
-
-    if TinkoffClient is not None:
-        try:
-            dbg("Initializing TinkoffClient (with SDK in venv if available)...")
-            # Prefer running under the same venv where SDK installed
-            env_bin = VAULT / "800_Автоматизация" / "env" / "bin"
-            os.environ.setdefault("PATH", f"{env_bin}:{os.environ.get('PATH','')}")
-            api = TinkoffClient(token)
-            accounts = api.get_accounts_v2() or []
-            dbg(f"Accounts v2: {accounts}")
-            dbginfo["accounts_v2"] = accounts
-            if not accounts:
-                main = api.get_main_account_id()
-                dbg(f"Main account fallback: {main}")
-                accounts = [main] if main else []
-                dbginfo["main_account"] = main
-
-            all_positions = []
-            for acc_id in accounts:
-                dbg(f"Fetching equity for account: {acc_id}")
-                try:
-                    eq = api.get_total_equity_rub(acc_id)
-                    dbg(f"Equity {acc_id}: {eq}")
-                    if eq is not None:
-                        total_rub += float(eq)
-                        dbginfo["equities"][acc_id] = float(eq)
-                    pos = api.get_positions_detailed(acc_id) or []
-                    dbg(f"Positions {acc_id}: {len(pos)} items")
-                    all_positions.extend(pos)
-                    dbginfo["positions_counts"][acc_id] = len(pos)
-                except Exception as e:
-                    dbg(f"Error account {acc_id}: {e}")
-                    dbginfo["errors"].append(f"account_error {acc_id}: {e}")
-                    continue
-            if all_positions:
-                by_sector = api.aggregate_by_sector(all_positions)
-                dbg(f"Sectors: {list(by_sector.keys())}")
-                dbginfo["sectors"] = list(by_sector.keys())
-            if total_rub == 0 and not accounts:
-                dbg("No accounts fetched; check token or API availability")
-                dbginfo["errors"].append("no_accounts")
-        except Exception as e:
-            dbg(f"Fatal error in client flow: {e}")
-            dbginfo["errors"].append(f"fatal_client: {e}")
-
-    # REST v2 fallback if still empty
-    if total_rub == 0:
-        try:
-            dbg("Trying REST v2 (HTTP/2) UsersService/GetAccounts...")
-            base = "https://invest-public-api.tinkoff.ru/rest"
-            url_acc = base + "/tinkoff.public.invest.api.contract.v1.UsersService/GetAccounts"
-            # prefer HTTP/2; fallback to HTTP/1.1 if not available
-            try:
-                client_ctx = httpx.Client(http2=True, timeout=25.0, follow_redirects=True)
-            except Exception as e:
-                dbg(f"HTTP/2 unavailable ({e}); falling back to HTTP/1.1")
-                client_ctx = httpx.Client(timeout=25.0, follow_redirects=True)
-            # fetch accounts
-            with client_ctx as client:
-                r = client.post(url_acc, json={}, headers={
-                    "Authorization": f"Bearer {token}",
-                    "Accept": "application/json",
-                    "Content-Type": "application/json",
-                    "x-app-name": "finance-bot/0.1",
-                    "User-Agent": "finance-bot/0.1",
-                })
-                if r.status_code != 200:
-                    dbg(f"REST v2 accounts http {r.status_code}: {r.text[:200]}")
-                    raise RuntimeError(f"REST v2 accounts http {r.status_code}")
-                acc_data = r.json()
-            accounts = [
-                str(a.get("id") or a.get("brokerAccountId"))
-                for a in (acc_data.get("accounts") or acc_data.get("payload", {}).get("accounts") or [])
-                if (a.get("id") or a.get("brokerAccountId"))
-            ]
-            dbg(f"REST accounts: {accounts}")
-            dbginfo["accounts_rest"] = accounts
-            for acc_id in accounts:
-                url_port = base + "/tinkoff.public.invest.api.contract.v1.PortfolioService/GetPortfolio"
-                payload = {"accountId": acc_id, "currency": "RUB"}
-                # use separate client context to avoid closed-client issues
-                try:
-                    c2 = httpx.Client(http2=True, timeout=25.0, follow_redirects=True)
-                except Exception:
-                    c2 = httpx.Client(timeout=25.0, follow_redirects=True)
-                with c2 as client2:
-                    r2 = client2.post(url_port, json=payload, headers={
-                        "Authorization": f"Bearer {token}",
-                        "Accept": "application/json",
-                        "Content-Type": "application/json",
-                        "x-app-name": "finance-bot/0.1",
-                        "User-Agent": "finance-bot/0.1",
-                    })
-                if r2.status_code != 200:
-                    dbg(f"REST v2 portfolio {acc_id} http {r2.status_code}: {r2.text[:200]}")
-                    continue
-                port = r2.json()
-                mv = port.get("totalAmountPortfolio") or port.get("payload", {}).get("totalAmountPortfolio")
-                if isinstance(mv, dict) and (mv.get("currency", "").lower() in ("rub", "rur")):
-                    units = float(mv.get("units") or 0)
-                    nano = float(mv.get("nano") or 0)
-                    val = units + nano / 1_000_000_000
-                    dbg(f"REST equity {acc_id}: {val}")
-                    total_rub += val
-                    dbginfo["equities"][acc_id] = val
-        except Exception as e:
-            dbg(f"REST fallback error: {e}")
-            dbginfo["errors"].append(f"rest_error: {e}")
-
-    # Legacy OpenAPI fallback
-    if total_rub == 0:
-        try:
-            dbg("Trying legacy OpenAPI /user/accounts and /portfolio ...")
-            base = "https://api-invest.tinkoff.ru/openapi"
-            # accounts
-            try:
-                client2_ctx = httpx.Client(http2=True, timeout=20.0, follow_redirects=True)
-            except Exception as e:
-                dbg(f"HTTP/2 unavailable for legacy ({e}); falling back to HTTP/1.1")
-                client2_ctx = httpx.Client(timeout=20.0, follow_redirects=True)
-            with client2_ctx as client2:
-                r = client2.get(base + "/user/accounts", headers={
-                    "Authorization": f"Bearer {token}",
-                    "Accept": "application/json",
-                    "x-app-name": "finance-bot/0.1",
-                    "User-Agent": "finance-bot/0.1",
-                })
-                if r.status_code != 200:
-                    dbg(f"Legacy accounts http {r.status_code}: {r.text[:200]}")
-                    raise RuntimeError(f"legacy http {r.status_code}")
-                accs_data = r.json()
-            accounts = [str(a.get("brokerAccountId")) for a in accs_data.get("payload", {}).get("accounts", []) if a.get("brokerAccountId")]
-            dbg(f"Legacy accounts: {accounts}")
-            dbginfo["accounts_rest"] = dbginfo.get("accounts_rest", []) or accounts
-            # portfolio per account
-            for acc_id in accounts:
-                url = base + "/portfolio?brokerAccountId=" + acc_id
-                r2 = client2.get(url, headers={
-                    "Authorization": f"Bearer {token}",
-                    "Accept": "application/json",
-                    "x-app-name": "finance-bot/0.1",
-                    "User-Agent": "finance-bot/0.1",
-                })
-                if r2.status_code != 200:
-                    dbg(f"Legacy portfolio {acc_id} http {r2.status_code}: {r2.text[:200]}")
-                    continue
-                port = r2.json()
-                payload = port.get("payload", {})
-                tot = payload.get("totalAmountPortfolio") or payload.get("totalAmountCurrencies")
-                val = None
-                if isinstance(tot, dict):
-                    val = float(tot.get("value") or 0.0)
-                dbg(f"Legacy equity {acc_id}: {val}")
-                if val:
-                    total_rub += float(val)
-                    dbginfo["equities"][acc_id] = float(val)
-        except Exception as e:
-            dbg(f"Legacy fallback error: {e}")
-            dbginfo["errors"].append(f"legacy_error: {e}")
+        winner, result, report = await run_strategies([
+            ("vault_client", lambda: _vault_strategy(token, dbginfo)),
+            ("rest_v2", lambda: _rest_v2_strategy(client, token, dbginfo)),
+            ("legacy", lambda: _legacy_strategy(client, token, dbginfo)),
+        ], grace={"vault_client": VAULT_SECTOR_GRACE})
+    finally:
+        if own_client:
+            await client.aclose()
+    # a vault result that arrived after the winner still has the sectors and position counts
+    vault = report.get("vault_client", {}).pop("result", None) or {}
+    for name, r in report.items():
+        dbg(f"Strategy {name}: {r['status']} in {r['seconds']}s")
+        if r["status"].startswith("error"):
+            dbginfo["errors"].append(f"{name}: {r['status']}")
+    dbginfo["winner"] = winner
+    dbginfo["strategies"] = report
+
+    result = result or {}
+    total_rub = float(result.get("total_rub", 0.0))
+    day_change_rub = 0.0  # optional, keep 0 for now
+    by_sector = result.get("by_sector") or vault.get("by_sector") or {}
+    dbginfo["equities"] = result.get("equities", {})
+    dbginfo["positions_counts"] = result.get("positions_counts") or vault.get("positions_counts", {})
+    dbginfo["sectors"] = list(by_sector.keys())
+    if winner is not None and winner != "vault_client" and not vault:
+        dbginfo["sectors_note"] = "sectors and position counts come from the vault client only; it did not finish"
 
     sector_rows = sorted(by_sector.items(), key=lambda x: -x[1]) if by_sector else []
     sector_md = None
@@ -243,6 +342,10 @@ def fetch_tinkoff_summary(token: str) -> dict:
     }
 
 
+def fetch_tinkoff_summary(token: str) -> dict:
+    return asyncio.run(fetch_tinkoff_summary_async(token))
+
+
 def write_cache_note(data: dict) -> None:
     CACHE_NOTE.parent.mkdir(parents=True, exist_ok=True)
     # Put key values into frontmatter so Dataview can read p.total_rub, p.day_change_rub, p.updated_at
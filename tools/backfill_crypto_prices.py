@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+import asyncio
+from argparse import ArgumentParser
+from datetime import date, timedelta
+from pathlib import Path
+import sys
+
+# ensure root
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from bot.db import AsyncSessionLocal
+from bot.services.crypto_history import backfill_crypto_prices
+from bot.services.crypto_prices import held_symbols, price_cache
+from bot.services.http import close_http_client
+
+
+async def amain(start: date, end: date, symbols: list[str], fixture: Path | None) -> int:
+    try:
+        if not symbols:
+            async with AsyncSessionLocal() as session:
+                symbols = await held_symbols(session)
+        if not symbols:
+            print("No crypto accounts; pass --symbols.")
+            return 0
+        if fixture is None:
+            await price_cache.refresh_symbol_map()
+        report = await backfill_crypto_prices(symbols, start, end, fixture=fixture)
+    finally:
+        await close_http_client()
+    for sym, count in sorted(report.candles.items()):
+        print(f"{sym}: {count} daily candles {start}..{end}")
+    for sym, err in sorted(report.failed.items()):
+        print(f"{sym}: failed ({err})")
+    return 1 if report.failed else 0
+
+
+def main():
+    p = ArgumentParser(description="Load daily USD OHLC candles for crypto symbols into data/crypto_ohlc")
+    p.add_argument("--start", required=True, type=date.fromisoformat, help="First date, YYYY-MM-DD")
+    p.add_argument("--end", default=date.today() - timedelta(days=1), type=date.fromisoformat, help="Last date (default: yesterday)")
+    p.add_argument("--symbols", nargs="*", default=[], help="Symbols (default: every symbol held in a crypto account)")
+    p.add_argument("--fixture", type=Path, default=None, help='JSON file {"BTC": [["YYYY-MM-DD", o, h, l, c], ...]} instead of CoinGecko')
+    args = p.parse_args()
+    sys.exit(asyncio.run(amain(args.start, args.end, args.symbols, args.fixture)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+import asyncio
+from argparse import ArgumentParser
+from datetime import date
+from pathlib import Path
+import sys
+
+# ensure root
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from bot.db import AsyncSessionLocal
+from bot.services.fx_history import backfill_cbr_rates
+from bot.services.http import close_http_client
+
+
+async def amain(start: date, end: date, fixture: Path | None, concurrency: int) -> None:
+    try:
+        async with AsyncSessionLocal() as session:
+            report = await backfill_cbr_rates(session, start, end, fixture=fixture, concurrency=concurrency)
+            await session.commit()
+    finally:
+        await close_http_client()
+    print(f"Loaded {report.rows} rates for {report.days} day(s) {start}..{end}")
+    if report.missing:
+        print(f"No CBR publication for {len(report.missing)} day(s); the previous rate applies")
+    for day, err in sorted(report.failed.items()):
+        print(f"Failed {day}: {err}")
+
+
+def main():
+    p = ArgumentParser(description="Load CBR daily rates for a date range into currency_rates")
+    p.add_argument("--start", required=True, type=date.fromisoformat, help="First date, YYYY-MM-DD")
+    p.add_argument("--end", default=date.today(), type=date.fromisoformat, help="Last date, YYYY-MM-DD (default: today)")
+    p.add_argument("--fixture", type=Path, default=None, help='JSON file {"YYYY-MM-DD": {"USD": 90.1, ...}} instead of the CBR archive')
+    p.add_argument("--concurrency", type=int, default=8, help="Parallel archive requests")
+    args = p.parse_args()
+    asyncio.run(amain(args.start, args.end, args.fixture, args.concurrency))
+
+
+if __name__ == "__main__":
+    main()
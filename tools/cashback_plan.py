@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+import argparse
+import sys
+from pathlib import Path
+
+# ensure root
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from bot.services.cashback_loader import RuleStore, month_bounds
+from bot.services.cashback_planner import plan_allocation
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Plan which card to use per category for a month")
+    parser.add_argument("--rules-dir", default=str(ROOT / "cashback"), help="Directory with monthly YAML files")
+    parser.add_argument("--month", required=True, help="YYYY-MM")
+    parser.add_argument("--spend", nargs="+", required=True, help="Planned spend as Category=amount")
+    parser.add_argument("--accounts", nargs="+", required=True, help="Cards to choose from")
+    args = parser.parse_args()
+
+    spend = {}
+    for item in args.spend:
+        category, _, amount = item.rpartition("=")
+        spend[category] = float(amount)
+    start, end = month_bounds(args.month)
+    rules = RuleStore(Path(args.rules_dir)).rules_between(start, end)
+
+    plan = plan_allocation(spend, rules, args.accounts, args.month)
+    for line in plan.lines:
+        print(f"{line.category:<24} {line.account or '(любая карта)':<16} {line.amount:>12.2f}  кэшбэк {line.cashback:.2f}")
+    print(f"Итого кэшбэк: {plan.total_cashback:.2f} RUB")
+
+
+if __name__ == "__main__":
+    main()
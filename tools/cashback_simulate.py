@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+import asyncio
+import sys
+import time
+from argparse import ArgumentParser
+from pathlib import Path
+
+# ensure root
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from sqlalchemy import select
+
+from bot.db import AsyncSessionLocal
+from bot.models import User
+from bot.services.cashback_loader import RuleStore, month_bounds
+from bot.services.cashback_simulation import load_expenses, simulate
+from bot.services.merchants import save_merchant_caches
+
+
+async def amain(month: str, months: int, rules_dir: Path, telegram_id: int | None) -> None:
+    start, end = month_bounds(month, months)
+    rules = RuleStore(rules_dir).rules_between(start, end)
+    async with AsyncSessionLocal() as session:
+        user_ids = None
+        if telegram_id is not None:
+            user = (await session.execute(select(User).where(User.telegram_id == telegram_id))).scalar_one_or_none()
+            if user is None:
+                print(f"User not found: {telegram_id}")
+                return
+            user_ids = [user.id]
+        expenses = await load_expenses(session, start, end, user_ids)
+
+    t0 = time.perf_counter()
+    result = simulate(expenses, rules)
+    elapsed = time.perf_counter() - t0
+    save_merchant_caches()
+
+    print(f"{len(expenses)} expenses {start}..{end}, {len(rules)} rules, simulated in {elapsed * 1000:.1f} ms")
+    for uid, (actual, optimal) in sorted(result.totals_by_user().items()):
+        print(f"user {uid}: actual {actual:.2f}, optimal {optimal:.2f}, missed {optimal - actual:.2f} RUB")
+    moved = int((result.optimal_account != expenses.account).sum())
+    print(f"{moved} expense(s) would go to another card")
+
+
+def main():
+    p = ArgumentParser(description="Compare cashback earned with the best card assignment for past expenses")
+    p.add_argument("--month", required=True, help="First month, YYYY-MM")
+    p.add_argument("--months", type=int, default=1, help="Number of months to simulate")
+    p.add_argument("--rules-dir", default=str(ROOT / "cashback"), help="Directory with monthly YAML files")
+    p.add_argument("--telegram-id", type=int, default=None, help="Only this user (default: all users)")
+    args = p.parse_args()
+    asyncio.run(amain(args.month, args.months, Path(args.rules_dir), args.telegram_id))
+
+
+if __name__ == "__main__":
+    main()
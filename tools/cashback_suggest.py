@@ -3,9 +3,31 @@ import sys
 from pathlib import Path
 from datetime import datetime
 import argparse
+import asyncio
 
-from bot.services.cashback_loader import iter_rules
+# ensure root
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from bot.services.cashback_loader import RuleStore
 from bot.services.cashback_engine import TxnContext, suggest_best_account
+from bot.services.merchants import save_merchant_caches
+
+
+async def _load_ledger(telegram_id: int, rules):
+    from sqlalchemy import select
+
+    from bot.db import AsyncSessionLocal
+    from bot.models import User
+    from bot.services.cashback_caps import get_cap_ledger
+
+    async with AsyncSessionLocal() as session:
+        user = (await session.execute(select(User).where(User.telegram_id == telegram_id))).scalar_one_or_none()
+        if user is None:
+            print(f"User not found: {telegram_id}; caps are not applied.")
+            return None
+        return await get_cap_ledger(session, user.id, rules)
 
 
 def main():
@@ -18,22 +40,25 @@ def main():
     parser.add_argument("--merchant", default=None)
     parser.add_argument("--mcc", type=int, default=None)
     parser.add_argument("--accounts", nargs="+", required=True, help="Candidate account names")
+    parser.add_argument("--telegram-id", type=int, default=None, help="Account for caps already used this period (reads the bot DB)")
     args = parser.parse_args()
 
-    rules_dir = Path(args.rules_dir)
-    files = sorted(rules_dir.glob("*.yaml"))
-    rules = iter_rules(files)
+    occurred_on = datetime.strptime(args.date, "%Y-%m-%d").date()
+    # only the month files that can cover the date are opened
+    rules = RuleStore(Path(args.rules_dir)).rules_for(occurred_on)
 
     ctx = TxnContext(
         amount=args.amount,
         currency=args.currency,
-        occurred_on=datetime.strptime(args.date, "%Y-%m-%d").date(),
+        occurred_on=occurred_on,
         category=args.category,
         merchant=args.merchant,
         mcc=args.mcc,
     )
 
-    est = suggest_best_account(ctx, rules, args.accounts)
+    ledger = asyncio.run(_load_ledger(args.telegram_id, rules)) if args.telegram_id is not None else None
+    est = suggest_best_account(ctx, rules, args.accounts, ledger)
+    save_merchant_caches()
     if est is None:
         print("No matching rules; choose any card or default policy.")
     else:
@@ -0,0 +1,30 @@
+#!/usr/bin/env python3
+import sys
+from argparse import ArgumentParser
+from pathlib import Path
+
+# ensure root
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from bot.services.cashback_loader import RULES_DIR, compile_rules
+
+
+def main():
+    p = ArgumentParser(description="Validate cashback/*.yaml and refresh the compiled snapshots")
+    p.add_argument("--rules-dir", default=str(RULES_DIR), help="Directory with monthly YAML files")
+    args = p.parse_args()
+
+    report = compile_rules(Path(args.rules_dir))
+    if report.compiled:
+        print("Compiled: " + ", ".join(report.compiled))
+    if report.cached:
+        print("Up to date: " + ", ".join(report.cached))
+    for err in report.errors:
+        print(f"ERROR {err}")
+    sys.exit(0 if report.ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+import asyncio
+from argparse import ArgumentParser
+from datetime import date
+from pathlib import Path
+import sys
+
+from dateutil.relativedelta import relativedelta
+
+# ensure root
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from sqlalchemy import select
+
+from bot.db import AsyncSessionLocal
+from bot.models import Account, User
+from bot.services.crypto_history import value_crypto_accounts
+
+
+async def amain(telegram_id: int, day: date, months: int, quote: str) -> None:
+    async with AsyncSessionLocal() as session:
+        user = (await session.execute(select(User).where(User.telegram_id == telegram_id))).scalar_one_or_none()
+        if user is None:
+            print(f"User not found: {telegram_id}")
+            return
+        names = dict((await session.execute(select(Account.id, Account.name).where(Account.user_id == user.id))).all())
+        for i in range(months):
+            d = day - relativedelta(months=i)
+            values = await value_crypto_accounts(session, user.id, d, quote=quote)
+            known = [v for v in values.values() if v is not None]
+            print(f"{d}: {sum(known):.2f} {quote}")
+            for acc_id, value in sorted(values.items(), key=lambda kv: names[kv[0]]):
+                shown = "no price" if value is None else f"{value:.2f}"
+                print(f"  {names[acc_id]}: {shown}")
+
+
+def main():
+    p = ArgumentParser(description="Value a user's crypto accounts at past dates from the local price store")
+    p.add_argument("--telegram-id", type=int, required=True)
+    p.add_argument("--date", type=date.fromisoformat, default=date.today(), help="Valuation date, YYYY-MM-DD")
+    p.add_argument("--months", type=int, default=1, help="Also value at the same day of N-1 previous months")
+    p.add_argument("--quote", default="RUB", help="Currency to value in")
+    args = p.parse_args()
+    asyncio.run(amain(args.telegram_id, args.date, args.months, args.quote.upper()))
+
+
+if __name__ == "__main__":
+    main()
@@ -9,10 +9,11 @@ ROOT = Path(__file__).resolve().parents[1]
 if str(ROOT) not in sys.path:
     sys.path.insert(0, str(ROOT))
 
-from sqlalchemy import select, delete
+from sqlalchemy import or_, select, delete
 
 from bot.db import AsyncSessionLocal
-from bot.models import User, Account, Transaction
+from bot.models import User, Account, ScheduledTransfer, Transaction
+from bot.services.balances import drop_account_balance
 
 
 async def amain(name: str) -> None:
@@ -28,6 +29,13 @@ async def amain(name: str) -> None:
             print(f"Account not found: {name}")
             return
         await session.execute(delete(Transaction).where(Transaction.account_id == acc.id))
+        # SQLite does not enforce the ON DELETE CASCADE without PRAGMA foreign_keys
+        await session.execute(
+            delete(ScheduledTransfer).where(
+                or_(ScheduledTransfer.from_account_id == acc.id, ScheduledTransfer.to_account_id == acc.id)
+            )
+        )
+        await drop_account_balance(session, acc.id)
         await session.delete(acc)
         await session.commit()
         print(f"Deleted account: {name}")
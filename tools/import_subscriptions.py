@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+import asyncio
+from argparse import ArgumentParser
+from datetime import date, datetime
+from pathlib import Path
+from typing import Optional
+import sys
+
+# ensure root
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from sqlalchemy import select
+
+from bot.db import AsyncSessionLocal, dialect_insert
+from bot.models import Account, Subscription, User
+from bot.money import to_minor
+from bot.services.subscriptions import CONFIG_FILE, parse_subscriptions_file, roll_forward
+
+
+async def amain(telegram_id: int, file: Path, account_name: Optional[str], auto_post: bool) -> None:
+    specs = parse_subscriptions_file(file)
+    async with AsyncSessionLocal() as session:
+        user = (await session.execute(select(User).where(User.telegram_id == telegram_id))).scalar_one_or_none()
+        if user is None:
+            print(f"User not found: {telegram_id}")
+            return
+        account = None
+        if account_name is not None:
+            account = (
+                await session.execute(select(Account).where(Account.user_id == user.id, Account.name == account_name))
+            ).scalar_one_or_none()
+            if account is None:
+                print(f"Account not found: {account_name}")
+                return
+        today = date.today()
+        rows = []
+        for spec in specs:
+            if auto_post and account is not None and account.currency != spec.currency:
+                print(f"Skipping {spec.name}: {spec.currency} does not match {account.name} ({account.currency})")
+                continue
+            # past dates in the file are rolled forward without posting anything
+            _, next_charge = roll_forward(spec.next_charge, spec.period, spec.next_charge.day, today)
+            rows.append(
+                {
+                    "user_id": user.id,
+                    "name": spec.name,
+                    "amount": to_minor(spec.amount, spec.currency),
+                    "currency": spec.currency,
+                    "period": spec.period,
+                    "next_charge": next_charge,
+                    "charge_day": spec.next_charge.day,
+                    "account_id": account.id if account is not None else None,
+                    "auto_post": auto_post and account is not None,
+                    "created_at": datetime.utcnow(),
+                }
+            )
+        if rows:
+            stmt = dialect_insert(session.bind.dialect.name)(Subscription.__table__)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=["user_id", "name"],
+                set_={c: stmt.excluded[c] for c in rows[0] if c not in ("user_id", "name", "created_at")},
+            )
+            await session.execute(stmt, rows)
+            await session.commit()
+    print(f"Imported {len(rows)} subscription(s) for {telegram_id}")
+    for r in rows:
+        print(f"  {r['name']}: next charge {r['next_charge']}")
+
+
+def main():
+    p = ArgumentParser(description="Import subscriptions from YAML into a user's subscriptions table")
+    p.add_argument("--telegram-id", type=int, required=True)
+    p.add_argument("--file", type=Path, default=CONFIG_FILE, help="YAML list of name/amount/currency/period/next_charge")
+    p.add_argument("--account", default=None, help="Account the charges are paid from")
+    p.add_argument("--auto-post", action="store_true", help="Record each charge as an expense on --account")
+    args = p.parse_args()
+    if args.auto_post and args.account is None:
+        p.error("--auto-post requires --account")
+    asyncio.run(amain(args.telegram_id, args.file, args.account, args.auto_post))
+
+
+if __name__ == "__main__":
+    main()
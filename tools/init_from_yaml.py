@@ -16,6 +16,7 @@ from sqlalchemy import select
 
 from bot.db import AsyncSessionLocal
 from bot.models import User, Account, Transaction
+from bot.services.balances import post_transactions
 
 
 def _to_decimal(value: Any) -> Decimal:
@@ -76,7 +77,7 @@ async def _create_opening_income(session, user_id: int, account: Account, amount
         description=f"Opening balance as of {when.date().isoformat()}",
         occurred_at=when,
     )
-    session.add(txn)
+    await post_transactions(session, [txn])
 
 
 async def import_from_yaml(yaml_path: Path) -> None:
@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+import asyncio
+from argparse import ArgumentParser
+from pathlib import Path
+import sys
+
+# ensure root
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from bot.db import AsyncSessionLocal
+from bot.money import from_minor
+from bot.services.balances import rebuild_account_balances
+
+
+async def amain(check_only: bool) -> int:
+    async with AsyncSessionLocal() as session:
+        drifts = await rebuild_account_balances(session, apply=not check_only)
+        if not check_only:
+            await session.commit()
+    for d in drifts:
+        stored = "missing" if d.stored is None else f"{from_minor(d.stored, d.currency)} ({d.stored_count} txns)"
+        print(f"Account {d.account_id}: stored {stored}, actual {from_minor(d.actual, d.currency)} {d.currency} ({d.actual_count} txns)")
+    if not drifts:
+        print("account_balances is consistent with transactions.")
+        return 0
+    if check_only:
+        print(f"Drift in {len(drifts)} account(s); run without --check to rebuild.")
+        return 1
+    print(f"Rebuilt account_balances; fixed {len(drifts)} account(s).")
+    return 0
+
+
+def main():
+    p = ArgumentParser(description="Recompute account_balances from transactions and report drift")
+    p.add_argument("--check", action="store_true", help="Only verify, do not write")
+    args = p.parse_args()
+    sys.exit(asyncio.run(amain(args.check)))
+
+
+if __name__ == "__main__":
+    main()
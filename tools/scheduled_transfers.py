@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+import asyncio
+from argparse import ArgumentParser
+from datetime import datetime
+from decimal import Decimal
+from pathlib import Path
+import sys
+
+# ensure root
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from sqlalchemy import func, select
+
+from bot.db import AsyncSessionLocal
+from bot.models import Account, ScheduledTransfer, User
+from bot.services.scheduled_transfers import next_run
+
+
+async def _user(session, telegram_id: int) -> User:
+    user = (await session.execute(select(User).where(User.telegram_id == telegram_id))).scalar_one_or_none()
+    if user is None:
+        raise SystemExit(f"User not found: {telegram_id}")
+    return user
+
+
+async def _account(session, user_id: int, name: str) -> Account:
+    acc = (
+        await session.execute(select(Account).where(Account.user_id == user_id, Account.name == name))
+    ).scalar_one_or_none()
+    if acc is None:
+        raise SystemExit(f"Account not found: {name}")
+    return acc
+
+
+async def add(args) -> None:
+    async with AsyncSessionLocal() as session:
+        user = await _user(session, args.telegram_id)
+        src = await _account(session, user.id, args.from_account)
+        dst = await _account(session, user.id, args.to_account)
+        if src.id == dst.id:
+            raise SystemExit("Source and destination are the same account")
+        if src.currency != dst.currency:
+            raise SystemExit("Currency conversion is not supported for scheduled transfers")
+        try:
+            next_at = next_run(args.cron, user.timezone, datetime.utcnow())
+        except ValueError as e:
+            raise SystemExit(f"Invalid cron expression: {e}")
+        st = ScheduledTransfer(
+            user_id=user.id,
+            from_account_id=src.id,
+            to_account_id=dst.id,
+            amount=Decimal(args.amount.replace(",", ".")),
+            currency=src.currency,
+            cron=args.cron,
+            next_run_at=next_at,
+            enabled=next_at is not None,
+        )
+        session.add(st)
+        await session.commit()
+        print(f"Scheduled transfer {st.id}: next run {next_at} UTC")
+
+
+async def list_(args) -> None:
+    async with AsyncSessionLocal() as session:
+        user = await _user(session, args.telegram_id)
+        names = dict((await session.execute(select(Account.id, Account.name).where(Account.user_id == user.id))).all())
+        rows = (
+            await session.execute(
+                select(ScheduledTransfer).where(ScheduledTransfer.user_id == user.id).order_by(ScheduledTransfer.id)
+            )
+        ).scalars().all()
+        for st in rows:
+            # an account deleted without the FK cascade (SQLite): the executor disables these
+            orphaned = st.from_account_id not in names or st.to_account_id not in names
+            state = f"next {st.next_run_at} UTC" if st.enabled and not orphaned else "disabled"
+            src = names.get(st.from_account_id, f"#{st.from_account_id}")
+            dst = names.get(st.to_account_id, f"#{st.to_account_id}")
+            print(f"{st.id}: {st.amount} {st.currency} {src} -> {dst} '{st.cron}', {state}")
+
+
+async def set_enabled(args, enabled: bool) -> None:
+    async with AsyncSessionLocal() as session:
+        user = await _user(session, args.telegram_id)
+        st = await session.get(ScheduledTransfer, args.id)
+        if st is None or st.user_id != user.id:
+            raise SystemExit(f"Scheduled transfer not found: {args.id}")
+        if enabled:
+            accounts = await session.scalar(
+                select(func.count(Account.id)).where(Account.id.in_([st.from_account_id, st.to_account_id]))
+            )
+            if accounts < len({st.from_account_id, st.to_account_id}):
+                raise SystemExit(f"Scheduled transfer {st.id} refers to a deleted account and cannot be enabled")
+        st.enabled = enabled
+        if enabled:
+            st.next_run_at = next_run(st.cron, user.timezone, datetime.utcnow())
+            st.enabled = st.next_run_at is not None
+        await session.commit()
+    # a running bot picks the change up within TransferExecutor.max_idle
+    print(f"Scheduled transfer {args.id} {'enabled' if enabled else 'disabled'}")
+
+
+def main():
+    p = ArgumentParser(description="Manage a user's scheduled transfers")
+    p.add_argument("--telegram-id", type=int, required=True)
+    sub = p.add_subparsers(dest="command", required=True)
+    a = sub.add_parser("add", help="Schedule a transfer")
+    a.add_argument("--from", dest="from_account", required=True, help="Source account name")
+    a.add_argument("--to", dest="to_account", required=True, help="Destination account name")
+    a.add_argument("--amount", required=True)
+    a.add_argument("--cron", required=True, help='Crontab expression in the user\'s timezone, e.g. "0 9 1 * *"')
+    sub.add_parser("list", help="List scheduled transfers")
+    for name in ("enable", "disable"):
+        sub.add_parser(name).add_argument("id", type=int)
+    args = p.parse_args()
+    if args.command == "add":
+        asyncio.run(add(args))
+    elif args.command == "list":
+        asyncio.run(list_(args))
+    else:
+        asyncio.run(set_enabled(args, args.command == "enable"))
+
+
+if __name__ == "__main__":
+    main()